@@ -0,0 +1,97 @@
+"""
+Sync vs async throughput and latency of the Weather endpoint against the
+local fake Openweathermap server, with the forecast cache disabled so
+every request waits on upstream I/O.
+
+Both sides run in one process: the sync view on a pool of --threads
+worker threads (like a threaded WSGI worker), the async view on a single
+event loop (like one ASGI worker).
+
+Usage, from the planneroutdoor directory:
+    python -m benchmarks.bench_async --requests 500 --threads 8 --delay 0.1
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "planneroutdoor.settings")
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import AsyncRequestFactory, RequestFactory, override_settings  # noqa: E402
+from benchmarks.fake_openweather import spawn  # noqa: E402
+from po_app import async_views  # noqa: E402
+from po_app.openweather import close_async_client  # noqa: E402
+from po_app.views import WeatherViewSet  # noqa: E402
+
+
+def coordinates(i):
+    return {"lat": f"{(i % 8000) * 0.01:.2f}", "lon": "2.35"}
+
+
+def report(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:>6}: {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms")
+
+
+def run_sync(requests, threads):
+    view = WeatherViewSet.as_view({"get": "list"})
+    factory = RequestFactory()
+
+    def call(args):
+        i, submitted = args
+        response = view(factory.get("/po_app/Weather/", coordinates(i)))
+        response.render()
+        assert response.status_code == 200, response.data
+        return time.perf_counter() - submitted
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(call, [(i, start) for i in range(requests)]))
+    return latencies, time.perf_counter() - start
+
+
+async def run_async(requests):
+    factory = AsyncRequestFactory()
+
+    async def call(i, submitted):
+        response = await async_views.weather(factory.get("/po_app/async/Weather/", coordinates(i)))
+        assert response.status_code == 200, response.content
+        return time.perf_counter() - submitted
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(call(i, start) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    await close_async_client()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server, url = spawn(delay=args.delay)
+    overrides = {
+        "OPENWEATHER_URL": url,
+        "OPENWEATHER_API_KEY": "bench",
+        "WEATHER_CACHE": {"TTL": 0, "STALE_TTL": 0},
+    }
+    with override_settings(**overrides):
+        print(f"{args.requests} requests, upstream delay {args.delay * 1000:.0f} ms, "
+              f"sync worker with {args.threads} threads vs one event loop")
+        report("sync", *run_sync(args.requests, args.threads))
+        report("async", *asyncio.run(run_async(args.requests)))
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
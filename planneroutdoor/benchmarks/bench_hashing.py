@@ -0,0 +1,108 @@
+"""
+Login throughput and latency of concurrent weather requests during a
+login burst, with password checks run inline on the request threads or
+on the bounded hashing pool.
+
+--logins threads check passwords in a loop while --clients threads call
+the Weather endpoint, served from the warm forecast cache so its latency
+only depends on the CPU left to it.
+
+Usage, from the planneroutdoor directory:
+    python -m benchmarks.bench_hashing --logins 16 --clients 4 --seconds 5
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "planneroutdoor.settings")
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import hashers  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from po_app.hashing import password_pool  # noqa: E402
+from po_app.models import Users  # noqa: E402
+from po_app.views import WeatherViewSet  # noqa: E402
+
+PASSWORD = "Test>012"
+FORECAST = {"city": {"name": "Paris"}, "list": [{"dt": 86400 * i, "temp": {"day": 290}} for i in range(16)]}
+
+
+def weather_call():
+    view = WeatherViewSet.as_view({"get": "list"})
+    factory = RequestFactory()
+
+    def call():
+        response = view(factory.get("/po_app/Weather/", {"lat": "48.85", "lon": "2.35"}))
+        response.render()
+        assert response.status_code == 200, response.data
+    return call
+
+
+def run(pooled, logins, clients, seconds):
+    user = Users(username="bench", password=hashers.make_password(PASSWORD))
+    check = (lambda: user.check_password(PASSWORD)) if pooled else (
+        lambda: hashers.check_password(PASSWORD, user.password))
+    call = weather_call()
+    call()
+    stop = threading.Event()
+    checked = []
+    latencies = []
+
+    def login_loop():
+        count = 0
+        while not stop.is_set():
+            assert check()
+            count += 1
+        checked.append(count)
+
+    def weather_loop():
+        while not stop.is_set():
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    with ThreadPoolExecutor(max_workers=logins + clients) as executor:
+        futures = [executor.submit(login_loop) for _ in range(logins)]
+        futures += [executor.submit(weather_loop) for _ in range(clients)]
+        time.sleep(seconds)
+        stop.set()
+        for future in futures:
+            future.result()
+
+    latencies.sort()
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    label = "pool" if pooled else "inline"
+    print(f"{label:>6}: {sum(checked) / seconds:7.1f} logins/s  weather p50 "
+          f"{statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=16)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--iterations", type=int, default=None,
+                        help="PBKDF2 iterations, Django's default when omitted")
+    args = parser.parse_args()
+
+    overrides = {"PASSWORD_HASHING": {"WORKERS": args.workers, "QUEUE_SIZE": args.logins,
+                                      "QUEUE_TIMEOUT": 60, "PBKDF2_ITERATIONS": args.iterations}}
+    with override_settings(**overrides), patch("po_app.weather_cache.fetch_forecast", return_value=FORECAST):
+        password_pool.reset()
+        print(f"{args.logins} login threads, {args.clients} weather clients, "
+              f"{args.workers} hashing workers, {os.cpu_count()} CPUs")
+        run(False, args.logins, args.clients, args.seconds)
+        run(True, args.logins, args.clients, args.seconds)
+        password_pool.reset()
+
+
+if __name__ == "__main__":
+    main()
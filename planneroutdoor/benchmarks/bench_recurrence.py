@@ -0,0 +1,78 @@
+"""
+Time and peak memory of the expansion of a year of weekly occurrences for
+many users, lazily or into a list, and of their materialization in batches.
+
+Rules are created in a throwaway test database. Usage, from the
+planneroutdoor directory:
+    python -m benchmarks.bench_recurrence --users 5000 --batch-size 500
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "planneroutdoor.settings")
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from po_app.models import Users, Activities, RecurrenceRules  # noqa: E402
+from po_app.recurrence import expand, materialize, occurrences  # noqa: E402
+
+
+def populate(users):
+    accounts = Users.objects.bulk_create(
+        [Users(username=f"user{i}", email=f"user{i}@maildrop.cc", address=f"address {i}",
+               password="pbkdf2_unused") for i in range(users)])
+    activity = Activities.objects.create(activity_name="Running", activity_desc="Run")
+    start = date.today()
+    RecurrenceRules.objects.bulk_create(
+        [RecurrenceRules(user_id=user, activity_id=activity, location="Paris",
+                         start_date=start + timedelta(days=i % 7), end_date=start + timedelta(days=i % 7),
+                         frequency=RecurrenceRules.WEEKLY) for i, user in enumerate(accounts)])
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        populate(args.users)
+        rules = list(RecurrenceRules.objects.all())
+        start = date.today()
+        end = start + timedelta(days=args.days - 1)
+
+        count, elapsed, peak = measure(lambda: sum(1 for _ in expand(rules, start, end)))
+        print(f"lazy expansion   {count:8d} occurrences {elapsed * 1000:8.1f} ms  peak {peak / 2**20:7.1f} MiB")
+        listed, elapsed, peak = measure(lambda: sorted(
+            (first, rule.pk, last) for rule in rules for first, last in occurrences(rule, start, end)))
+        print(f"list expansion   {len(listed):8d} occurrences {elapsed * 1000:8.1f} ms  peak {peak / 2**20:7.1f} MiB")
+        del listed, rules
+
+        result, elapsed, peak = measure(lambda: materialize(end, batch_size=args.batch_size))
+        print(f"materialization  {result['created']:8d} rows        {elapsed * 1000:8.1f} ms  "
+              f"peak {peak / 2**20:7.1f} MiB, batches of {args.batch_size}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
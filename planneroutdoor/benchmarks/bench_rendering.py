@@ -0,0 +1,88 @@
+"""
+Bytes on the wire and server CPU per request of cached forecast and
+pollution responses, for the stock DRF JSON renderer, the orjson renderer,
+the pre-encoded passthrough, and gzip or brotli compression.
+
+Usage, from the planneroutdoor directory:
+    python -m benchmarks.bench_rendering --requests 500 --repeat 5
+"""
+import argparse
+import os
+import time
+from contextlib import ExitStack
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "planneroutdoor.settings")
+import django  # noqa: E402
+
+django.setup()
+
+from unittest.mock import patch  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.response import Response  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from benchmarks.fake_openweather import forecast_payload, pollution_payload  # noqa: E402
+from po_app import views  # noqa: E402
+from po_app.models import Users  # noqa: E402
+from po_app.renderers import ORJSONRenderer  # noqa: E402
+
+
+ENDPOINTS = (
+    ("forecast", "/po_app/Weather/", views.WeatherViewSet),
+    ("pollution", "/po_app/WeatherPollution/", views.WeatherPollutionViewSet),
+)
+CONFIGS = (
+    ("drf json", JSONRenderer, False, ""),
+    ("orjson", ORJSONRenderer, False, ""),
+    ("passthrough", ORJSONRenderer, True, ""),
+    ("passthrough+gzip", ORJSONRenderer, True, "gzip"),
+    ("passthrough+br", ORJSONRenderer, True, "br"),
+)
+
+
+def stock_response(request, weather_cache, key, entry, name, data):
+    return Response({"message": "", "data": data})
+
+
+def run(path, viewset, renderer, passthrough, encoding, requests, repeat):
+    middleware = [m for m in settings.MIDDLEWARE if m != "po_app.middleware.CompressionMiddleware"]
+    if encoding:
+        middleware.insert(0, "po_app.middleware.CompressionMiddleware")
+    with ExitStack() as stack:
+        stack.enter_context(override_settings(MIDDLEWARE=middleware))
+        stack.enter_context(patch.object(viewset, "renderer_classes", [renderer]))
+        if not passthrough:
+            stack.enter_context(patch.object(views, "payload_response", stock_response))
+        client = APIClient()
+        client.force_authenticate(Users(id=1, username="bench"))
+        params = {"lat": "48.86", "lon": "2.35"}
+        size = len(client.get(path, params, HTTP_ACCEPT_ENCODING=encoding).content)
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            for _ in range(requests):
+                client.get(path, params, HTTP_ACCEPT_ENCODING=encoding)
+            timings.append((time.process_time() - start) / requests)
+        return size, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    with patch.object(views, "fetch_forecast", return_value=forecast_payload()), \
+            patch.object(views, "fetch_pollution", return_value=pollution_payload()):
+        for name, path, viewset in ENDPOINTS:
+            for label, renderer, passthrough, encoding in CONFIGS:
+                size, cpu = run(path, viewset, renderer, passthrough, encoding,
+                                args.requests, args.repeat)
+                print(f"{name:10} {label:17} {size:7d} bytes  {cpu * 1e6:8.0f} us CPU/request")
+
+
+if __name__ == "__main__":
+    main()
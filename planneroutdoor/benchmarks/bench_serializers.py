@@ -0,0 +1,89 @@
+"""
+Serialization time of the hyperlinked and flat representations of the
+PlannedActivities, UserActivities and UserAllergens lists.
+
+Rows are created in a throwaway test database. Usage, from the
+planneroutdoor directory:
+    python -m benchmarks.bench_serializers --rows 2000
+"""
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "planneroutdoor.settings")
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from po_app.models import (Users, Activities, Allergens, UserActivities,  # noqa: E402
+                           UserAllergens, PlannedActivities)
+from po_app import serializers  # noqa: E402
+
+
+LISTS = (
+    ("PlannedActivities", PlannedActivities, serializers.PlannedActivitiesSerializer,
+     serializers.PlannedActivitiesFlatSerializer),
+    ("UserActivities", UserActivities, serializers.UserActivitiesSerializer,
+     serializers.UserActivitiesFlatSerializer),
+    ("UserAllergens", UserAllergens, serializers.UserAllergensSerializer,
+     serializers.UserAllergensFlatSerializer),
+)
+
+
+def populate(rows):
+    users = Users.objects.bulk_create(
+        [Users(username=f"user{i}", email=f"user{i}@maildrop.cc", address=f"address {i}",
+               password="pbkdf2_unused") for i in range(rows // 50 + 1)])
+    activities = Activities.objects.bulk_create(
+        [Activities(activity_name=f"activity {i}", activity_desc=f"desc {i}") for i in range(50)])
+    allergens = Allergens.objects.bulk_create(
+        [Allergens(allergen_name=f"allergen {i}", allergen_desc=f"desc {i}") for i in range(50)])
+    start = date(2024, 10, 16)
+    UserActivities.objects.bulk_create(
+        [UserActivities(user_id=users[i // 50], activity_id=activities[i % 50]) for i in range(rows)])
+    UserAllergens.objects.bulk_create(
+        [UserAllergens(user_id=users[i // 50], allergen_id=allergens[i % 50]) for i in range(rows)])
+    PlannedActivities.objects.bulk_create(
+        [PlannedActivities(user_id=users[i // 50], activity_id=activities[i % 50], location="Paris",
+                           start_date=start + timedelta(days=i // 50),
+                           end_date=start + timedelta(days=i // 50 + 1)) for i in range(rows)])
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        populate(args.rows)
+        request = Request(APIRequestFactory().get("/"))
+        for name, model, hyperlinked, flat in LISTS:
+            queryset = model.objects.all()
+            slow = best_of(args.repeat, lambda: hyperlinked(
+                queryset.all(), many=True, context={"request": request}).data)
+            fast = best_of(args.repeat, lambda: flat(queryset.all(), request).data)
+            print(f"{name:18} {args.rows} rows: hyperlinked {slow * 1000:8.1f} ms, "
+                  f"flat {fast * 1000:6.1f} ms, x{slow / fast:.1f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Upstream call count for N concurrent identical pollution requests,
+with and without single-flight coalescing.
+
+Usage, from the planneroutdoor directory:
+    python -m benchmarks.bench_singleflight --clients 100
+"""
+import argparse
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "planneroutdoor.settings")
+import django  # noqa: E402
+
+django.setup()
+
+from unittest.mock import patch  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from benchmarks.fake_openweather import FakeOpenWeather  # noqa: E402
+from po_app import openweather  # noqa: E402
+
+
+def run(server, clients, coalesce):
+    server.hits.clear()
+    fetch = openweather.fetch_pollution
+    if coalesce:
+        context = nullcontext()
+    else:
+        context = patch.object(openweather.upstream_flight, "do", lambda key, fn: fn())
+    with context, ThreadPoolExecutor(max_workers=clients) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: fetch("48.86", "2.35"), range(clients)))
+        elapsed = time.perf_counter() - start
+    return sum(server.hits.values()), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = FakeOpenWeather(delay=args.delay).start()
+    with override_settings(OPENWEATHER_URL=server.url, OPENWEATHER_API_KEY="bench"):
+        for coalesce in (False, True):
+            calls, elapsed = run(server, args.clients, coalesce)
+            label = "single-flight" if coalesce else "direct"
+            print(f"{label:>14}: {args.clients} clients -> {calls} upstream calls in {elapsed:.3f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Local fake Openweathermap server used by the benchmarks.
+
+Answers forecast/daily, air_pollution/forecast and geo/1.0/direct with
+canned payloads after a configurable delay and counts upstream hits.
+It runs on an asyncio loop so thousands of keep-alive connections can
+wait on the delay at once.
+"""
+import asyncio
+import json
+import multiprocessing
+import socket
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+
+DAY = 86400
+START = 1729080000
+
+
+def forecast_payload(days=16):
+    return {
+        "city": {"name": "Fake City", "coord": {"lat": 48.86, "lon": 2.35}},
+        "cnt": days,
+        "list": [{
+            "dt": START + i * DAY,
+            "sunrise": START + i * DAY - 21600,
+            "sunset": START + i * DAY + 21600,
+            "temp": {"day": 285.0 + i % 5, "min": 280.0, "max": 290.0 + i % 3,
+                     "night": 281.0, "eve": 284.0, "morn": 282.0},
+            "feels_like": {"day": 284.0, "night": 280.0, "eve": 283.0, "morn": 281.0},
+            "pressure": 1015, "humidity": 70,
+            "weather": [{"id": 500, "main": "Rain", "description": "light rain", "icon": "10d"}],
+            "speed": 3.0 + i % 7, "deg": (i * 37) % 360, "gust": 6.0 + i % 5,
+            "clouds": 40, "pop": (i % 10) / 10, "rain": 0.5 * (i % 3),
+        } for i in range(days)],
+    }
+
+
+def pollution_payload(hours=96):
+    return {
+        "coord": {"lat": 48.86, "lon": 2.35},
+        "list": [{
+            "dt": START + i * 3600,
+            "main": {"aqi": 1 + i % 5},
+            "components": {"co": 200.0 + i, "no": 0.5, "no2": 10.0 + i % 7,
+                           "o3": 60.0, "so2": 2.0 + i % 3, "pm2_5": 5.0 + i % 11,
+                           "pm10": 8.0 + i % 13, "nh3": 1.0 + i % 4},
+        } for i in range(hours)],
+    }
+
+
+GEOCODING = [{"name": "Fake City", "lat": 48.8566, "lon": 2.3522, "country": "FR"}]
+
+PAYLOADS = {
+    "/data/2.5/forecast/daily": json.dumps(forecast_payload()).encode(),
+    "/data/2.5/air_pollution/forecast": json.dumps(pollution_payload()).encode(),
+    "/geo/1.0/direct": json.dumps(GEOCODING).encode(),
+}
+
+
+class FakeOpenWeather:
+    """
+    HTTP/1.1 keep-alive server counting requests per path.
+    """
+
+    def __init__(self, delay=0.05, port=0):
+        self.delay = delay
+        self.hits = Counter()
+        self.sock = socket.create_server(("127.0.0.1", port), backlog=4096)
+        self.loop = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.sock.getsockname()[1]}"
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                path = urlparse(head.split(b" ", 2)[1].decode()).path
+                self.hits[path] += 1
+                await asyncio.sleep(self.delay)
+                body = PAYLOADS.get(path)
+                status = b"200 OK" if body else b"404 Not Found"
+                body = body or b"{}"
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self.handle, sock=self.sock)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve())
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        """
+        Serve from a daemon thread of the current process.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        if self.loop is not None:
+            for task in asyncio.all_tasks(self.loop):
+                self.loop.call_soon_threadsafe(task.cancel)
+
+
+def _serve(port, delay):
+    FakeOpenWeather(delay=delay, port=port).serve_forever()
+
+
+def spawn(delay=0.05):
+    """
+    Run the server in a child process so it does not share the GIL with
+    the code under test. Returns the process and the base URL.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = multiprocessing.Process(target=_serve, args=(port, delay), daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    server = FakeOpenWeather(port=8099)
+    print(f"Fake Openweathermap listening on {server.url}")
+    server.serve_forever()
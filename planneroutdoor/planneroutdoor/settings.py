@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,8 +50,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "po_app.metrics.MetricsMiddleware",
+    "po_app.timing.ServerTimingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "po_app.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -89,6 +94,15 @@ SWAGGER_SETTINGS = {
     },
 }
 
+# Schema artifacts written by build_openapi_schema, served when URL is set
+OPENAPI_SCHEMA = {
+    "DIR": BASE_DIR / "openapi",
+    "URL": os.environ.get("OPENAPI_URL"),
+    "RELEASE": os.environ.get("RELEASE", ""),
+    "MAX_AGE": 86400,
+    "MAX_ENTRIES": 32,
+}
+
 ROOT_URLCONF = "planneroutdoor.urls"
 
 TEMPLATES = [
@@ -126,6 +140,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Redis shares the quota budget, weather entries and cache versions across
+# worker processes. Without REDIS_URL every process has its own memory cache.
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -150,23 +184,53 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-# password hash methodology
-PASSWORD_HASHERS = [
-    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
-    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
-    "django.contrib.auth.hashers.Argon2PasswordHasher",
-    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
-    "django.contrib.auth.hashers.ScryptPasswordHasher",
-]
+# password hash methodology, PASSWORD_HASHER selects the hasher of new
+# hashes, the others still check existing ones until their next login
+_PASSWORD_HASHERS = {
+    "pbkdf2_sha256": "po_app.hashing.PBKDF2PasswordHasher",
+    "pbkdf2_sha1": "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "argon2": "po_app.hashing.Argon2PasswordHasher",
+    "bcrypt_sha256": "po_app.hashing.BCryptSHA256PasswordHasher",
+    "scrypt": "po_app.hashing.ScryptPasswordHasher",
+}
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2_sha256")
+if PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(
+        f"Unknown PASSWORD_HASHER {PASSWORD_HASHER!r}, expected one of {', '.join(_PASSWORD_HASHERS)}")
+PASSWORD_HASHERS = [_PASSWORD_HASHERS.pop(PASSWORD_HASHER), *_PASSWORD_HASHERS.values()]
+
+# Password hashing pool: WORKERS threads hash concurrently, QUEUE_SIZE more
+# calls wait for one and the others get a 503 after QUEUE_TIMEOUT seconds.
+# The cost parameters default to Django's values when None.
+PASSWORD_HASHING = {
+    "WORKERS": int(os.environ.get("PASSWORD_HASHING_WORKERS", 2)),
+    "QUEUE_SIZE": int(os.environ.get("PASSWORD_HASHING_QUEUE_SIZE", 16)),
+    "QUEUE_TIMEOUT": 2.0,
+    "PBKDF2_ITERATIONS": int(os.environ.get("PBKDF2_ITERATIONS", 0)) or None,
+    "ARGON2_TIME_COST": None,
+    "ARGON2_MEMORY_COST": None,
+    "ARGON2_PARALLELISM": None,
+    "SCRYPT_WORK_FACTOR": None,
+    "BCRYPT_ROUNDS": None,
+}
 
 # django rest framework authentication management
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "po_app.authentication.TokenUserAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
-    ]
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "po_app.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "po_app.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 # Authentification for po_app.Users model
@@ -204,3 +268,94 @@ SECURE_CONTENT_TYPE_NOSNIFF = True
 
 # External openweather API key (6 months free trial)
 OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY")
+OPENWEATHER_URL = os.environ.get("OPENWEATHER_URL", "http://api.openweathermap.org")
+
+# Pooled Openweather HTTP client: timeouts in seconds, retries limited to
+# RETRY_RATIO of the requests (plus MIN_RETRIES_PER_SECOND) process-wide
+OPENWEATHER_CLIENT = {
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    "POOL_SIZE": 20,
+    "ASYNC_POOL_SIZE": 100,
+    "MAX_RETRIES": 2,
+    "BACKOFF": 0.2,
+    "RETRY_RATIO": 0.1,
+    "MIN_RETRIES_PER_SECOND": 1,
+}
+
+# Openweather API key quota guard: at most CALLS_PER_MINUTE upstream calls,
+# and after FAILURE_THRESHOLD consecutive failures calls fail fast for
+# RESET_TIMEOUT seconds. Shared by all worker processes with a shared
+# cache, otherwise per process with CALLS_PER_MINUTE / WORKERS calls each.
+OPENWEATHER_QUOTA = {
+    "CALLS_PER_MINUTE": int(os.environ.get("OPENWEATHER_CALLS_PER_MINUTE", 60)),
+    "WORKERS": int(os.environ.get("WEB_CONCURRENCY", 1)),
+    "FAILURE_THRESHOLD": 5,
+    "RESET_TIMEOUT": 30,
+}
+
+# Openweather forecast cache: coordinates are snapped to GRID degrees,
+# entries are fresh for TTL seconds and served stale until STALE_TTL
+# while a background refresh runs. Older entries are kept up to
+# FALLBACK_TTL for when the quota guard refuses upstream calls.
+WEATHER_CACHE = {
+    "GRID": float(os.environ.get("WEATHER_CACHE_GRID", 0.01)),
+    "TTL": int(os.environ.get("WEATHER_CACHE_TTL", 600)),
+    "STALE_TTL": int(os.environ.get("WEATHER_CACHE_STALE_TTL", 3600)),
+    "LRU_SIZE": 256,
+    "FALLBACK_TTL": 24 * 3600,
+}
+
+# Seconds before a "Location not found" geocoding answer is asked again upstream
+GEOCODING_NEGATIVE_TTL = 24 * 3600
+
+# Seconds a per-user response stays in the shared cache, writes make it
+# unreachable earlier by bumping the user version
+USER_CACHE_TTL = 3600
+
+# Without a shared cache, versions are bumped in the writing process only:
+# seconds other processes may keep serving catalog and per-user data
+LOCAL_CACHE_TTL = 60
+
+# Seconds a worker process reuses the Users row of an access token, account
+# updates and deletions drop it earlier
+TOKEN_USER_CACHE_TTL = 30
+
+# Coalescing of identical upstream calls, other worker processes wait for
+# the leader's result as long as its call can last with OPENWEATHER_CLIENT
+# timeouts and retries, or LOCK_TIMEOUT seconds when set
+SINGLE_FLIGHT = {
+    "LOCK_TIMEOUT": None,
+    "RESULT_TTL": 5,
+}
+
+# Server-Timing header and po_app.timing log line for SAMPLE_RATE of the
+# requests under PATH_PREFIX, 0 disables the instrumentation. Not sampled
+# under manage.py test unless REQUEST_TIMING_SAMPLE_RATE is set
+REQUEST_TIMING = {
+    "SAMPLE_RATE": float(os.environ.get("REQUEST_TIMING_SAMPLE_RATE", 0 if "test" in sys.argv[1:2] else 0.01)),
+    "PATH_PREFIX": "/po_app/",
+    "HEADER": True,
+}
+
+# Prometheus metrics served on /metrics: with DIR set, every worker process
+# writes its counters there every FLUSH_INTERVAL seconds and /metrics sums
+# them. Empty DIR when restarting the workers. TOKEN, when set, is the
+# bearer token required by /metrics, else it is only served in DEBUG or to
+# INTERNAL_IPS.
+METRICS = {
+    "DIR": os.environ.get("METRICS_DIR"),
+    "FLUSH_INTERVAL": 5,
+    "TOKEN": os.environ.get("METRICS_TOKEN"),
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "po_app.timing": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
@@ -15,19 +15,19 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from po_app.views import CookieTokenObtainPairView, CookieTokenRefreshView
+from po_app.metrics import metrics_view
+from po_app.schema import cached_schema_view
 from django.urls import path, include, re_path
 from django.contrib import admin
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
-schema_view = get_schema_view(
+schema_view = cached_schema_view(
     openapi.Info(
         title="PlannerOutdoor API",
         default_version='v1',
         description="API documentation for PlannerOutdoor project",
     ),
-    public=True,
     permission_classes=(permissions.AllowAny,),
     patterns=[
         (path("", include("po_app.urls"))),
@@ -43,9 +43,8 @@ urlpatterns = [
     path("api/token/refresh/", CookieTokenRefreshView.as_view(), name="token_refresh"),
     path("", include("po_app.urls")),
     re_path(r"^swagger(?P<format>\.json|\.yaml)$",
-            schema_view.without_ui(cache_timeout=0), name="schema-json"),
-    path("swagger/", schema_view.with_ui("swagger",
-         cache_timeout=0), name="schema-swagger-ui"),
-    path("redoc/", schema_view.with_ui("redoc",
-         cache_timeout=0), name="schema-redoc"),
+            schema_view.without_ui(), name="schema-json"),
+    path("swagger/", schema_view.with_ui("swagger"), name="schema-swagger-ui"),
+    path("redoc/", schema_view.with_ui("redoc"), name="schema-redoc"),
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Users, Activities, Allergens, UserActivities, UserAllergens, PlannedActivities
+from .models import Users, Activities, Allergens, UserActivities, UserAllergens, PlannedActivities, GeoLocations
+from .models import RecurrenceRules, ForecastSnapshots
 
 """
 This file registers the models with the Django admin site.
@@ -11,3 +12,6 @@ admin.site.register(Allergens)
 admin.site.register(UserActivities)
 admin.site.register(UserAllergens)
 admin.site.register(PlannedActivities)
+admin.site.register(RecurrenceRules)
+admin.site.register(ForecastSnapshots)
+admin.site.register(GeoLocations)
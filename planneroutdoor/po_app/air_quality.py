@@ -0,0 +1,118 @@
+"""
+Daily air quality aggregation of the Openweathermap hourly pollution forecast.
+
+The hourly samples are loaded into one array and reduced per day with
+numpy, giving min, mean and max of every component and the vehicle,
+industrial and agricultural levels shown by AirPollutionAverage.vue,
+computed with the same thresholds.
+"""
+from datetime import datetime, timezone
+import numpy as np
+
+
+COMPONENTS = ("co", "no", "no2", "o3", "so2", "pm2_5", "pm10", "nh3")
+CATEGORIES = {
+    "vehicle": (("co", "no", "no2", "pm2_5", "pm10"), (60, 150, 450)),
+    "industrial": (("co", "so2"), (50, 250, 550)),
+    "agricultural": (("nh3",), (40, 220, 600)),
+}
+LEVELS = ("Good", "Moderate", "Unhealthy", "Very Unhealthy")
+# Openweathermap air quality index, from 1 to 5
+AQI_LEVELS = ("Good", "Fair", "Moderate", "Poor", "Very Poor")
+
+
+def level(value, thresholds):
+    """
+    Return the level name of a category average.
+    """
+    if np.isnan(value):
+        return "Unknown"
+    return LEVELS[int(np.searchsorted(thresholds, value, side="left"))]
+
+
+def aqi_level(value):
+    """
+    Return the name of an air quality index, "" when unknown.
+    """
+    if value is None or not 1 <= value <= len(AQI_LEVELS):
+        return ""
+    return AQI_LEVELS[int(round(value)) - 1]
+
+
+def _row_mean(values):
+    """
+    Mean of each row of values ignoring NaN entries, NaN for empty rows.
+    """
+    present = ~np.isnan(values)
+    seen = present.sum(axis=1)
+    sums = np.where(present, values, 0.0).sum(axis=1)
+    return np.where(seen > 0, sums / np.maximum(seen, 1), np.nan)
+
+
+def _day_reduce(values, starts):
+    """
+    Reduce each column of values per day, NaN entries are ignored.
+    """
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+    seen = np.add.reduceat(present.astype(np.int64), starts, axis=0)
+    mean = np.where(seen > 0, sums / np.maximum(seen, 1), np.nan)
+    return (np.fmin.reduceat(values, starts, axis=0), mean,
+            np.fmax.reduceat(values, starts, axis=0))
+
+
+def aggregate(payload):
+    """
+    Return per UTC day statistics of an air_pollution/forecast payload.
+    """
+    samples = payload.get("list", [])
+    if not samples:
+        return {"coord": payload.get("coord"), "days": []}
+
+    dt = np.fromiter((sample["dt"] for sample in samples), dtype=np.int64, count=len(samples))
+    matrix = np.array([[sample.get("components", {}).get(name, np.nan) for name in COMPONENTS]
+                       for sample in samples], dtype=np.float64)
+    aqi = np.array([[sample.get("main", {}).get("aqi", np.nan)] for sample in samples],
+                   dtype=np.float64)
+
+    order = np.argsort(dt, kind="stable")
+    dt, matrix, aqi = dt[order], matrix[order], aqi[order]
+    days, starts, counts = np.unique(dt // 86400, return_index=True, return_counts=True)
+
+    columns = {name: index for index, name in enumerate(COMPONENTS)}
+    category_means = {}
+    for category, (names, _) in CATEGORIES.items():
+        hourly = _row_mean(matrix[:, [columns[name] for name in names]])
+        category_means[category] = _day_reduce(hourly[:, None], starts)[1][:, 0]
+
+    component_min, component_mean, component_max = _day_reduce(matrix, starts)
+    aqi_min, aqi_mean, aqi_max = _day_reduce(aqi, starts)
+
+    def number(value):
+        return None if np.isnan(value) else round(float(value), 2)
+
+    result = []
+    for i, day in enumerate(days):
+        result.append({
+            "dt": int(day) * 86400,
+            "samples": int(counts[i]),
+            "aqi": {"min": number(aqi_min[i, 0]), "mean": number(aqi_mean[i, 0]), "max": number(aqi_max[i, 0])},
+            "components": {
+                name: {"min": number(component_min[i, j]), "mean": number(component_mean[i, j]),
+                       "max": number(component_max[i, j])}
+                for j, name in enumerate(COMPONENTS)
+            },
+            "levels": {
+                category: level(category_means[category][i], CATEGORIES[category][1])
+                for category in CATEGORIES
+            },
+        })
+    return {"coord": payload.get("coord"), "days": result}
+
+
+def daily_aqi(aggregated):
+    """
+    Return {date: highest air quality index} of an aggregation.
+    """
+    return {datetime.fromtimestamp(day["dt"], timezone.utc).date(): day["aqi"]["max"]
+            for day in aggregated["days"]}
@@ -0,0 +1,238 @@
+"""
+Async versions of the Openweathermap endpoints for ASGI deployments.
+
+The views never block the event loop on upstream I/O, so one ASGI worker
+can keep hundreds of Openweathermap calls in flight. They answer with the
+same payloads as their DRF counterparts in views.py. Served by WSGI, each
+request runs on an event loop of its own, whose aiohttp session is closed
+when the view returns.
+"""
+import asyncio
+from functools import wraps
+import aiohttp
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import TokenUserAuthentication
+from .geocoding import LocationTooLong, ageocode
+from .openweather import afetch_forecast, afetch_pollution, close_async_client
+from .quota import UpstreamUnavailable
+from .weather_cache import CoordinateError, forecast_cache, pollution_cache, quantize_coordinates
+from .forecast import ProjectionError, parse_projection
+from .views import encoded_envelope, forecast_data, merge_day_details, pollution_data
+
+
+def closes_async_client(view):
+    """
+    Close the aiohttp session of the event loop once the view returns,
+    unless the request came through ASGI, whose event loop lives on and
+    keeps the session alive across requests.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            if not isinstance(request, ASGIRequest):
+                await close_async_client()
+    return wrapper
+
+
+def async_login_required(view):
+    """
+    Authenticate the JWT bearer token the way the DRF views do, answering
+    401 when it is missing or invalid. Checking the token needs no query,
+    so it runs on the event loop.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = TokenUserAuthentication().authenticate(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if result is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def aforecast_source(lat=None, lon=None, city=None):
+    """
+    Async variant of weather_cache.forecast_source, the loader is a coroutine function.
+    """
+    if city is None:
+        lat, lon = quantize_coordinates(lat, lon)
+        return f"{lat},{lon}", lambda: afetch_forecast(lat=lat, lon=lon)
+    return f"city:{city.strip().casefold()}", lambda: afetch_forecast(q=city)
+
+
+async def aget_forecast(lat, lon):
+    """
+    Async variant of views.get_forecast.
+    """
+    return await forecast_cache.aget(*aforecast_source(lat, lon))
+
+
+def apollution_source(lat, lon):
+    """
+    Async variant of weather_cache.pollution_source.
+    """
+    lat, lon = quantize_coordinates(lat, lon)
+    return f"{lat},{lon}", lambda: afetch_pollution(lat, lon)
+
+
+async def aget_pollution(lat, lon):
+    """
+    Async variant of views.get_pollution.
+    """
+    return await pollution_cache.aget(*apollution_source(lat, lon))
+
+
+@closes_async_client
+async def geocode(request):
+    """
+    Retrieve geographic coordinates for a specified location.
+    """
+    location = request.GET.get("location")
+    if not location:
+        return JsonResponse({"error": "Please provide a location"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        data = await ageocode(location)
+        if not data:
+            return JsonResponse({"error": "Location not found"}, status=status.HTTP_200_OK)
+        return JsonResponse({"message": "", "data": data}, status=status.HTTP_200_OK)
+    except LocationTooLong as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UpstreamUnavailable as e:
+        return JsonResponse({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except aiohttp.ClientResponseError as e:
+        return JsonResponse({"error": "Location not found"}, status=e.status)
+    except Exception as e:
+        return JsonResponse({"error": "Error from Openweathermap geocoding API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@closes_async_client
+async def weather(request):
+    """
+    Retrieve weather data for a specified city or by latitude and longitude.
+    """
+    city = request.GET.get("city")
+    lat = request.GET.get("lat")
+    lon = request.GET.get("lon")
+
+    try:
+        projection = parse_projection(request.GET)
+        if lat and lon:
+            key, loader = aforecast_source(lat, lon)
+        elif city:
+            key, loader = aforecast_source(city=city)
+        else:
+            return JsonResponse({"error": "Please provide a city name or latitude and longitude"}, status=status.HTTP_400_BAD_REQUEST)
+        entry = await forecast_cache.aget_entry(key, loader)
+        data = forecast_data(key, entry, projection)
+        return HttpResponse(encoded_envelope(forecast_cache, key, entry, projection, data),
+                            content_type="application/json")
+    except UpstreamUnavailable as e:
+        return JsonResponse({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return JsonResponse({"error": "Error from Openweathermap forecast API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except ProjectionError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except CoordinateError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@closes_async_client
+@async_login_required
+async def weather_details(request):
+    """
+    Retrieve weather data for a specified city and a choosen day.
+    """
+    lat = request.GET.get("lat")
+    lon = request.GET.get("lon")
+
+    if not lat or not lon:
+        return JsonResponse({"error": "Latitude, longitude, are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        projection = parse_projection(request.GET)
+        key, loader = aforecast_source(lat, lon)
+        entry = await forecast_cache.aget_entry(key, loader)
+        data = forecast_data(key, entry, projection)
+        return HttpResponse(encoded_envelope(forecast_cache, key, entry, projection, data),
+                            content_type="application/json")
+    except UpstreamUnavailable as e:
+        return JsonResponse({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return JsonResponse({"error": "Error from Openweathermap forecast API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except ProjectionError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except CoordinateError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@closes_async_client
+@async_login_required
+async def weather_pollution(request):
+    """
+    Retrieve pollution data for a specified city and a choosen day.
+    """
+    lat = request.GET.get("lat")
+    lon = request.GET.get("lon")
+    mode = request.GET.get("mode")
+
+    if not lat or not lon:
+        return JsonResponse({"error": "Latitude, longitude, are required"}, status=status.HTTP_400_BAD_REQUEST)
+    if mode not in (None, "", "raw", "aggregated"):
+        return JsonResponse({"error": "mode must be raw or aggregated"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        key, loader = apollution_source(lat, lon)
+        entry = await pollution_cache.aget_entry(key, loader)
+        data = pollution_data(key, entry, mode)
+        return HttpResponse(encoded_envelope(pollution_cache, key, entry, mode or "raw", data),
+                            content_type="application/json")
+    except UpstreamUnavailable as e:
+        return JsonResponse({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return JsonResponse({"error": "Error from Openweathermap pollution API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except CoordinateError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@closes_async_client
+@async_login_required
+async def weather_day_details(request):
+    """
+    Retrieve forecast and pollution data for a choosen day.
+    """
+    lat = request.GET.get("lat")
+    lon = request.GET.get("lon")
+    day = request.GET.get("day")
+
+    if not lat or not lon:
+        return JsonResponse({"error": "Latitude, longitude, are required"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        day = int(day) if day else None
+    except ValueError:
+        return JsonResponse({"error": "day must be a unix timestamp"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        forecast, pollution = await asyncio.gather(
+            aget_forecast(lat, lon), aget_pollution(lat, lon), return_exceptions=True)
+        if isinstance(forecast, Exception):
+            raise forecast
+        if isinstance(pollution, Exception):
+            pollution = None
+        data = merge_day_details(forecast, pollution, day)
+        return JsonResponse({"message": "", "data": data}, status=status.HTTP_200_OK)
+    except UpstreamUnavailable as e:
+        return JsonResponse({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return JsonResponse({"error": "Error from Openweathermap forecast API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except CoordinateError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,114 @@
+"""
+JWT authentication without a database query per request.
+
+The user of a valid access token is a TokenUser holding the user id of
+the signed claims, which is all the weather endpoints need. Authentication
+checks the account still exists, and views needing more, e.g. an ORM
+filter on the user or an is_staff check, get the Users row, both from a
+per-process cache bounded by TOKEN_USER_CACHE_TTL
+seconds and dropped when the account is updated or deleted, through the
+user cache version, in every process when the cache is shared.
+"""
+import copy
+import threading
+import time
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .catalog_cache import get_version, user_namespace
+from .models import Users
+from .timing import timed
+
+
+class UserCache:
+    """
+    Per-process Users rows by id, each entry valid for one user version
+    and at most ttl seconds.
+    """
+
+    def __init__(self, max_users=4096):
+        self.max_users = max_users
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Return a private copy of the user, raising AuthenticationFailed
+        when the account does not exist anymore.
+        """
+        return copy.copy(self.check(user_id))
+
+    def check(self, user_id):
+        """
+        Return the cached user, raising AuthenticationFailed when the
+        account does not exist anymore.
+        """
+        version = get_version(user_namespace(user_id))
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is None or entry[0] != version or entry[1] < time.monotonic():
+            try:
+                user = Users.objects.get(pk=user_id)
+            except Users.DoesNotExist:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            entry = (version, time.monotonic() + getattr(settings, "TOKEN_USER_CACHE_TTL", 30), user)
+            with self._lock:
+                if len(self._users) >= self.max_users:
+                    self._users.clear()
+                self._users[user_id] = entry
+        return entry[2]
+
+    def forget(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+class TokenUser(SimpleLazyObject):
+    """
+    Authenticated user known by the id of its token. id, pk and the
+    authentication flags never load the Users row, anything else does.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id):
+        super().__init__(lambda: user_cache.get(user_id))
+        self.__dict__["id"] = self.__dict__["pk"] = user_id
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f"<TokenUser: {self.__dict__['id']}>"
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication returning a TokenUser instead of querying the user.
+    """
+
+    def authenticate(self, request):
+        with timed("auth"):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        """
+        Return the TokenUser of the token, raising AuthenticationFailed here
+        rather than in the view when the account was deleted.
+        """
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken("Token contained no recognizable user identification")
+        user_cache.check(user_id)
+        return TokenUser(user_id)
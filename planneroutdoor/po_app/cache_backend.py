@@ -0,0 +1,20 @@
+"""
+Whether the default Django cache is shared by the worker processes.
+
+State kept in the cache, like the quota budget, the weather entries and
+the namespace versions, only spans processes with a shared backend such
+as Redis. The in-memory backends keep one copy per process.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias="default"):
+    """
+    Return whether the cache alias is seen by every worker process.
+    """
+    return not isinstance(caches[alias], LOCAL_BACKENDS)
@@ -0,0 +1,153 @@
+"""
+Versioned per-process cache of serialized read-mostly data.
+
+Each namespace has a version counter in the Django cache, bumped after
+every committed write. Processes keep the serialized data with the
+version it was built for and a strong ETag, and rebuild only when the
+version moved, so an unchanged catalog costs one cache read. Per-user
+data is stored in the Django cache under keys that include the user
+version, so a bump makes older entries unreachable.
+
+Bumps reach every process only with a shared cache backend. With the
+per-process memory cache a write only moves the version of the writing
+process, so other processes also rebuild their data after
+LOCAL_CACHE_TTL seconds, which bounds how long they serve stale data.
+"""
+import hashlib
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from .cache_backend import is_shared
+from .metrics import metrics
+
+
+def local_ttl():
+    """
+    Return the seconds data may be reused without a shared cache, None
+    when versions are shared and entries live until the next bump.
+    """
+    return None if is_shared() else getattr(settings, "LOCAL_CACHE_TTL", 60)
+
+
+def _version_key(name):
+    return f"po_app:version:{name}"
+
+
+def get_version(name):
+    """
+    Return the current version of a namespace. A missing version, e.g.
+    evicted, is seeded with the current time so that it never matches
+    entries built for an earlier version.
+    """
+    version = cache.get(_version_key(name))
+    if version is None:
+        seed = time.time_ns()
+        cache.add(_version_key(name), seed, timeout=None)
+        version = cache.get(_version_key(name), seed)
+    return version
+
+
+def incr_version(name):
+    """
+    Increment the version of a namespace now and return the new version.
+    """
+    key = _version_key(name)
+    cache.add(key, time.time_ns(), timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def bump_version(name):
+    """
+    Invalidate a namespace in every process once the current transaction commits.
+    """
+    transaction.on_commit(lambda: incr_version(name))
+
+
+def make_etag(data):
+    """
+    Return a strong ETag for JSON serializable data.
+    """
+    body = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return quote_etag(hashlib.sha1(body.encode()).hexdigest())
+
+
+def etag_matches(request, etag):
+    """
+    True when the If-None-Match header of the request matches etag.
+    """
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+class VersionedCache:
+    """
+    Per-process cache of data built for one version of a namespace.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, variant, build):
+        """
+        Return (data, etag) for namespace name, calling build() only when
+        the shared version changed. variant separates representations of
+        the same data, e.g. the host used in hyperlinks.
+        """
+        version = get_version(name)
+        key = (name, variant)
+        ttl = local_ttl()
+        with self._lock:
+            entry = self._entries.get(key)
+        if (entry is None or entry[0] != version
+                or (ttl is not None and time.monotonic() - entry[3] >= ttl)):
+            metrics.inc("po_app_cache_requests_total", cache="catalog", result="miss")
+            data = build()
+            entry = (version, data, make_etag(data), time.monotonic())
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                self._entries[key] = entry
+        else:
+            metrics.inc("po_app_cache_requests_total", cache="catalog", result="hit")
+        return entry[1], entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_cache = VersionedCache()
+
+
+def user_namespace(user_id):
+    return f"user:{user_id}"
+
+
+def get_user_cached(user_id, name, variant, build):
+    """
+    Return build() for one user from the shared cache, rebuilt after any
+    write bumped the user version.
+    """
+    version = get_version(user_namespace(user_id))
+    key = f"po_app:user:{user_id}:{version}:{name}:{variant}"
+    data = cache.get(key)
+    metrics.inc("po_app_cache_requests_total", cache="user", result="miss" if data is None else "hit")
+    if data is None:
+        data = build()
+        timeout = getattr(settings, "USER_CACHE_TTL", 3600)
+        cache.set(key, data, timeout=min(timeout, local_ttl() or timeout))
+    return data
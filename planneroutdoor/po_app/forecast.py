@@ -0,0 +1,160 @@
+"""
+Compact server-side representation of an Openweathermap daily forecast.
+
+An upstream payload is parsed once into slotted ForecastDay objects, then
+projected on the fields, units and number of days asked by the client.
+Both steps are cached with the forecast cache entry they come from.
+"""
+from datetime import datetime, timezone, timedelta
+
+
+FIELDS = (
+    "dt", "date", "weekday", "sunrise", "sunset",
+    "temp_min", "temp_max", "temp_morn", "temp_day", "temp_eve", "temp_night",
+    "feels_morn", "feels_day", "feels_eve", "feels_night",
+    "pressure", "humidity", "clouds", "pop", "rain",
+    "description", "icon",
+    "wind_speed", "wind_gust", "wind_deg", "wind_direction",
+)
+TEMPERATURE_FIELDS = frozenset(f for f in FIELDS if f.startswith(("temp_", "feels_")))
+SPEED_FIELDS = frozenset(("wind_speed", "wind_gust"))
+UNITS = {
+    "standard": (lambda k: k, lambda s: s),
+    "metric": (lambda k: k - 273.15, lambda s: s),
+    "imperial": (lambda k: (k - 273.15) * 1.8 + 32, lambda s: s * 2.236936),
+}
+WIND_DIRECTIONS = ("N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+                   "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW")
+
+
+class ProjectionError(ValueError):
+    """
+    Raised for invalid fields, units or days query parameters.
+    """
+
+
+def wind_direction(degrees):
+    """
+    Return the 16 points compass direction for a wind angle.
+    """
+    if degrees is None:
+        return ""
+    return WIND_DIRECTIONS[int((degrees % 360 + 11.25) // 22.5) % 16]
+
+
+class ForecastDay:
+    """
+    One parsed forecast day, times are local to the forecast city.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, entry, utc_offset=0):
+        temp = entry.get("temp", {})
+        feels = entry.get("feels_like", {})
+        weather = (entry.get("weather") or [{}])[0]
+        local = datetime.fromtimestamp(entry["dt"], timezone(timedelta(seconds=utc_offset)))
+        self.dt = entry["dt"]
+        self.date = local.date().isoformat()
+        self.weekday = local.strftime("%A")
+        self.sunrise = self._time(entry.get("sunrise"), utc_offset)
+        self.sunset = self._time(entry.get("sunset"), utc_offset)
+        self.temp_min = temp.get("min")
+        self.temp_max = temp.get("max")
+        self.temp_morn = temp.get("morn")
+        self.temp_day = temp.get("day")
+        self.temp_eve = temp.get("eve")
+        self.temp_night = temp.get("night")
+        self.feels_morn = feels.get("morn")
+        self.feels_day = feels.get("day")
+        self.feels_eve = feels.get("eve")
+        self.feels_night = feels.get("night")
+        self.pressure = entry.get("pressure")
+        self.humidity = entry.get("humidity")
+        self.clouds = entry.get("clouds")
+        self.pop = entry.get("pop", 0)
+        self.rain = entry.get("rain", 0)
+        self.description = weather.get("description", "")
+        self.icon = weather.get("icon", "")
+        self.wind_speed = entry.get("speed")
+        self.wind_gust = entry.get("gust")
+        self.wind_deg = entry.get("deg")
+        self.wind_direction = wind_direction(self.wind_deg)
+
+    @staticmethod
+    def _time(timestamp, utc_offset):
+        if timestamp is None:
+            return None
+        return datetime.fromtimestamp(timestamp + utc_offset, timezone.utc).strftime("%H:%M")
+
+    def to_dict(self, fields, units="standard"):
+        convert_temp, convert_speed = UNITS[units]
+        row = {}
+        for field in fields:
+            value = getattr(self, field)
+            if value is not None:
+                if field in TEMPERATURE_FIELDS:
+                    value = round(convert_temp(value), 1)
+                elif field in SPEED_FIELDS:
+                    value = round(convert_speed(value), 1)
+            row[field] = value
+        return row
+
+
+class Forecast:
+    """
+    Parsed forecast: city information and a tuple of ForecastDay.
+    """
+    __slots__ = ("city", "days")
+
+    def __init__(self, payload):
+        city = payload.get("city", {})
+        self.city = {
+            "name": city.get("name"),
+            "country": city.get("country"),
+            "coord": city.get("coord"),
+            "timezone": city.get("timezone", 0),
+        }
+        self.days = tuple(ForecastDay(entry, self.city["timezone"] or 0)
+                          for entry in payload.get("list", []))
+
+
+def parse_projection(query_params):
+    """
+    Read fields, units and days from the query parameters, fields in
+    FIELDS order without duplicates as they key the cached projection.
+    Returns None when none of them is given, so callers keep the raw payload.
+    """
+    if not any(name in query_params for name in ("fields", "units", "days")):
+        return None
+    fields = query_params.get("fields")
+    if fields:
+        fields = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = sorted(fields.difference(FIELDS))
+        if unknown:
+            raise ProjectionError(f"Unknown fields: {', '.join(unknown)}")
+        fields = tuple(field for field in FIELDS if field in fields)
+    else:
+        fields = FIELDS
+    units = query_params.get("units") or "standard"
+    if units not in UNITS:
+        raise ProjectionError("units must be standard, metric or imperial")
+    days = query_params.get("days")
+    try:
+        days = int(days) if days else None
+    except ValueError:
+        raise ProjectionError("days must be an integer")
+    if days is not None and days < 1:
+        raise ProjectionError("days must be a positive integer")
+    return fields, units, days
+
+
+def project(forecast, fields, units, days):
+    """
+    Return the compact representation of a parsed forecast.
+    """
+    selected = forecast.days[:days] if days is not None else forecast.days
+    return {
+        "city": forecast.city,
+        "units": units,
+        "days": [day.to_dict(fields, units) for day in selected],
+    }
@@ -0,0 +1,107 @@
+"""
+Read-through geocoding table in front of the Openweathermap Geocoding API.
+"""
+import unicodedata
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .metrics import metrics
+from .models import GeoLocations
+from .openweather import fetch_geocoding, afetch_geocoding
+from .quota import UpstreamUnavailable
+
+
+MAX_LOCATION_LENGTH = GeoLocations._meta.get_field("normalized_name").max_length
+
+
+class LocationTooLong(ValueError):
+    """
+    Raised for a location name that does not fit the geocoding table.
+    """
+
+    def __init__(self):
+        super().__init__(f"Location must be at most {MAX_LOCATION_LENGTH} characters")
+
+
+def normalize_location(location):
+    """
+    Case-fold a location name, strip accents and collapse whitespace.
+    """
+    decomposed = unicodedata.normalize("NFKD", location)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def store_location(location, results):
+    """
+    Save geocoding results for a location, an empty list marks it as not found.
+    """
+    GeoLocations.objects.update_or_create(
+        normalized_name=normalize_location(location),
+        defaults={"location": location, "results": results})
+
+
+def is_usable(row):
+    """
+    Tell whether a stored row can answer a query, negative results expire
+    after GEOCODING_NEGATIVE_TTL seconds so new place names can be resolved.
+    """
+    negative_ttl = timedelta(seconds=settings.GEOCODING_NEGATIVE_TTL)
+    return bool(row.results) or row.fetched_at > timezone.now() - negative_ttl
+
+
+def checked_name(location):
+    """
+    Return the normalized name of a location, raising LocationTooLong when
+    the name or the location exceeds MAX_LOCATION_LENGTH.
+    """
+    name = normalize_location(location)
+    if max(len(name), len(location)) > MAX_LOCATION_LENGTH:
+        raise LocationTooLong()
+    return name
+
+
+def geocode(location):
+    """
+    Return geocoding results for a location.
+    Known locations are answered from the database, unknown ones are
+    fetched once and stored. An expired "not found" answer is kept when
+    the quota guard refuses the upstream call.
+    """
+    name = checked_name(location)
+    row = GeoLocations.objects.filter(normalized_name=name).only(
+        "results", "fetched_at").first()
+    usable = row is not None and is_usable(row)
+    metrics.inc("po_app_cache_requests_total", cache="geocode", result="hit" if usable else "miss")
+    if usable:
+        return row.results
+    try:
+        results = fetch_geocoding(location)
+    except UpstreamUnavailable:
+        if row is None:
+            raise
+        return row.results
+    store_location(location, results)
+    return results
+
+
+async def ageocode(location):
+    """
+    Async variant of geocode.
+    """
+    name = checked_name(location)
+    row = await GeoLocations.objects.filter(normalized_name=name).only(
+        "results", "fetched_at").afirst()
+    usable = row is not None and is_usable(row)
+    metrics.inc("po_app_cache_requests_total", cache="geocode", result="hit" if usable else "miss")
+    if usable:
+        return row.results
+    try:
+        results = await afetch_geocoding(location)
+    except UpstreamUnavailable:
+        if row is None:
+            raise
+        return row.results
+    await GeoLocations.objects.aupdate_or_create(
+        normalized_name=name, defaults={"location": location, "results": results})
+    return results
@@ -0,0 +1,180 @@
+"""
+Password hashing on a bounded worker pool.
+
+Hashing a password or checking one against its hash costs tens to
+hundreds of milliseconds of CPU. Register, login, account updates and
+RecoverPassword run it on a pool of WORKERS threads, the hash functions
+releasing the GIL, so a login burst uses at most WORKERS cores and leaves
+the others to weather traffic. At most QUEUE_SIZE more calls wait for a
+worker, others wait up to QUEUE_TIMEOUT seconds for a place in the queue
+and are then refused with a 503.
+
+The hashers read their cost parameters from PASSWORD_HASHING, and the one
+first in PASSWORD_HASHERS is selected by the PASSWORD_HASHER environment
+variable. A stored hash made by another hasher or with other costs is
+replaced on the next successful login.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .timing import timed
+
+
+DEFAULTS = {
+    "WORKERS": 2,
+    "QUEUE_SIZE": 16,
+    "QUEUE_TIMEOUT": 2.0,
+    "PBKDF2_ITERATIONS": None,
+    "ARGON2_TIME_COST": None,
+    "ARGON2_MEMORY_COST": None,
+    "ARGON2_PARALLELISM": None,
+    "SCRYPT_WORK_FACTOR": None,
+    "BCRYPT_ROUNDS": None,
+}
+
+
+def get_setting(name):
+    """
+    Return a PASSWORD_HASHING setting, falling back on the default value.
+    """
+    return getattr(settings, "PASSWORD_HASHING", {}).get(name, DEFAULTS[name])
+
+
+class HashingBusy(APIException):
+    """
+    Raised instead of hashing when the pool queue stays full.
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many password operations, please retry shortly"
+    default_code = "hashing_busy"
+
+
+class HashingPool:
+    """
+    Threads running the password hash functions, with a bounded queue.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = self._slots = None
+        self.counters = {"completed": 0, "rejected": 0}
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                workers = get_setting("WORKERS")
+                self._slots = threading.BoundedSemaphore(workers + get_setting("QUEUE_SIZE"))
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hashing",
+                                                    initializer=self._mark_worker)
+            return self._executor, self._slots
+
+    def _mark_worker(self):
+        self._local.worker = True
+
+    def _release(self, slots):
+        def done(future):
+            slots.release()
+            with self._lock:
+                self.counters["completed"] += 1
+        return done
+
+    def run(self, fn, *args):
+        """
+        Return fn(*args) computed on the pool, raising HashingBusy when no
+        place in the queue frees up within QUEUE_TIMEOUT seconds.
+        """
+        if getattr(self._local, "worker", False):
+            return fn(*args)
+        executor, slots = self._start()
+        with timed("hash"):
+            if not slots.acquire(timeout=get_setting("QUEUE_TIMEOUT")):
+                with self._lock:
+                    self.counters["rejected"] += 1
+                raise HashingBusy()
+            try:
+                future = executor.submit(fn, *args)
+            except BaseException:
+                slots.release()
+                raise
+            future.add_done_callback(self._release(slots))
+            return future.result()
+
+    def reset(self):
+        """
+        Stop the workers, the next call starts them with the current settings.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+password_pool = HashingPool()
+
+
+def make_password(password):
+    """
+    make_password computed on the pool.
+    """
+    return password_pool.run(hashers.make_password, password)
+
+
+def check_password(password, encoded, setter=None):
+    """
+    check_password computed on the pool. setter is called on the calling
+    thread when the password is right but its hash must be upgraded.
+    """
+    upgrades = []
+    valid = password_pool.run(hashers.check_password, password, encoded, upgrades.append)
+    if valid and upgrades and setter:
+        setter(password)
+    return valid
+
+
+def is_hashed(value):
+    """
+    Return whether a password field value is a hash or marked unusable.
+    """
+    if not hashers.is_password_usable(value):
+        return True
+    try:
+        hashers.identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return get_setting("PBKDF2_ITERATIONS") or super().iterations
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return get_setting("ARGON2_TIME_COST") or super().time_cost
+
+    @property
+    def memory_cost(self):
+        return get_setting("ARGON2_MEMORY_COST") or super().memory_cost
+
+    @property
+    def parallelism(self):
+        return get_setting("ARGON2_PARALLELISM") or super().parallelism
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return get_setting("SCRYPT_WORK_FACTOR") or super().work_factor
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return get_setting("BCRYPT_ROUNDS") or super().rounds
@@ -0,0 +1,273 @@
+"""
+Per-user interval index of planned activities for conflict detection.
+
+Each process keeps, per user, the (start_date, end_date) intervals of the
+user activities sorted by start. Planned activities of a user do not
+overlap, so their end dates are sorted too and an overlap check is a
+bisect plus one step back per conflict; rows created before conflict
+detection may overlap and make checks walk back further. Adding an
+interval is a bisect and a list insert. An index is tagged with the
+version of the user "planned" namespace it was loaded for.
+
+Writers lock the user row, copy the cached index and check a new
+interval after syncing it with one overlap query, so a check never misses
+a committed row even when the cached index lags behind. Once the
+transaction commits, the version is bumped and the updated copy becomes
+the cached index, unless another writer bumped the version meanwhile.
+"""
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .catalog_cache import get_version, incr_version
+from .models import Users, PlannedActivities
+
+
+def planned_namespace(user_id):
+    return f"planned:{user_id}"
+
+
+class PlanningConflict(APIException):
+    """
+    Raised when planned activities of a user would overlap.
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Planned activities overlap"
+    default_code = "conflict"
+
+    def __init__(self, conflicts):
+        super().__init__(detail={"error": "Overlaps planned activities", "conflicts": conflicts}, code="conflict")
+        # ids stay integers, as in the bulk import response, not error strings
+        self.detail["conflicts"] = list(conflicts)
+
+
+class IntervalIndex:
+    """
+    Sorted intervals of one user, dates are inclusive.
+    """
+    __slots__ = ("version", "starts", "ends", "ids", "disjoint")
+
+    def __init__(self, rows=(), version=None):
+        rows = sorted(rows, key=lambda row: (row[1], row[0]))
+        self.version = version
+        self.ids = [row[0] for row in rows]
+        self.starts = [row[1] for row in rows]
+        self.ends = [row[2] for row in rows]
+        self.disjoint = all(end < start for end, start in zip(self.ends, self.starts[1:]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def copy(self):
+        index = IntervalIndex(version=self.version)
+        index.ids, index.starts, index.ends = list(self.ids), list(self.starts), list(self.ends)
+        index.disjoint = self.disjoint
+        return index
+
+    def overlapping(self, start, end):
+        """
+        Return the positions of the intervals overlapping [start, end], last first.
+        """
+        position = bisect_right(self.starts, end) - 1
+        found = []
+        while position >= 0:
+            if self.ends[position] >= start:
+                found.append(position)
+            elif self.disjoint:
+                break
+            position -= 1
+        return found
+
+    def conflicts(self, start, end, exclude=None):
+        """
+        Return the ids of the intervals overlapping [start, end].
+        """
+        return [self.ids[position] for position in self.overlapping(start, end)
+                if self.ids[position] != exclude]
+
+    def add(self, pk, start, end):
+        position = bisect_right(self.starts, start)
+        if ((position > 0 and self.ends[position - 1] >= start)
+                or (position < len(self.starts) and self.starts[position] <= end)):
+            self.disjoint = False
+        self.ids.insert(position, pk)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+
+    def remove(self, pk):
+        if pk not in self.ids:
+            return
+        position = self.ids.index(pk)
+        for values in (self.ids, self.starts, self.ends):
+            del values[position]
+
+    def free_windows(self, start, end):
+        """
+        Return the (first day, last day) windows of [start, end] without
+        any planned activity.
+        """
+        if not self.disjoint:
+            return self._free_windows_slow(start, end)
+        windows = []
+        cursor = start
+        first = max(bisect_right(self.starts, start) - 1, 0)
+        for position in range(first, len(self.ids)):
+            if self.starts[position] > end:
+                break
+            if self.ends[position] < cursor:
+                continue
+            if self.starts[position] > cursor:
+                windows.append((cursor, self.starts[position] - timedelta(days=1)))
+            cursor = max(cursor, self.ends[position] + timedelta(days=1))
+            if cursor > end:
+                return windows
+        windows.append((cursor, end))
+        return windows
+
+    def _free_windows_slow(self, start, end):
+        """
+        Free windows of overlapping intervals, only possible with rows
+        created before conflict detection.
+        """
+        busy = sorted((s, e) for s, e in zip(self.starts, self.ends) if s <= end and e >= start)
+        windows, cursor = [], start
+        for s, e in busy:
+            if s > cursor:
+                windows.append((cursor, s - timedelta(days=1)))
+            cursor = max(cursor, e + timedelta(days=1))
+        if cursor <= end:
+            windows.append((cursor, end))
+        return windows
+
+
+class IntervalWriter:
+    """
+    Copy of a user index updated by one locked writer.
+    """
+
+    def __init__(self, user_id, index):
+        self.user_id = user_id
+        self.index = index
+        self.reload = False
+
+    def sync(self, start, end):
+        """
+        Bring the intervals overlapping [start, end] in line with the
+        database, which the cached index may lag behind, e.g. rows written
+        by another process not yet published. One query on the
+        (user_id, start_date) index.
+        """
+        rows = PlannedActivities.objects.filter(
+            user_id=self.user_id, start_date__lte=end, end_date__gte=start).values_list(
+            "planned_activity_id", "start_date", "end_date")
+        rows = {pk: (first, last) for pk, first, last in rows}
+        indexed = {self.index.ids[position]: (self.index.starts[position], self.index.ends[position])
+                   for position in self.index.overlapping(start, end)}
+        for pk, dates in indexed.items():
+            if pk is not None and rows.get(pk) != dates:
+                self.index.remove(pk)
+        for pk, dates in rows.items():
+            if indexed.get(pk) != dates:
+                self.index.remove(pk)
+                self.index.add(pk, *dates)
+
+    def check(self, start, end, exclude=None):
+        """
+        Raise PlanningConflict when [start, end] overlaps another interval.
+        """
+        self.sync(start, end)
+        conflicts = self.index.conflicts(start, end, exclude)
+        if conflicts:
+            raise PlanningConflict(conflicts)
+
+    def add(self, pk, start, end):
+        """
+        Record a new interval, without pk when the row id is not known
+        yet, in which case the index is reloaded after commit.
+        """
+        self.reload = self.reload or pk is None
+        self.index.add(pk, start, end)
+
+    def remove(self, pk):
+        self.index.remove(pk)
+
+
+class IntervalIndexes:
+    """
+    Per-process registry of user interval indexes.
+    """
+
+    def __init__(self, max_users=4096):
+        self.max_users = max_users
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._writing = threading.local()
+
+    def _load(self, user_id, version):
+        rows = PlannedActivities.objects.filter(user_id=user_id).values_list(
+            "planned_activity_id", "start_date", "end_date")
+        return IntervalIndex(rows, version)
+
+    def _store(self, user_id, index):
+        with self._lock:
+            if len(self._indexes) >= self.max_users:
+                self._indexes.clear()
+            self._indexes[user_id] = index
+
+    def get(self, user_id):
+        """
+        Return the current index of a user, loaded and cached when the
+        cached one is missing or older than the user version.
+        """
+        version = get_version(planned_namespace(user_id))
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is None or index.version != version:
+            index = self._load(user_id, version)
+            self._store(user_id, index)
+        return index
+
+    @property
+    def writing(self):
+        """
+        True while the current thread writes through write().
+        """
+        return getattr(self._writing, "active", False)
+
+    @contextmanager
+    def write(self, user_id):
+        """
+        Lock the user planned activities for the current transaction and
+        yield an IntervalWriter holding a copy of the current index.
+        """
+        namespace = planned_namespace(user_id)
+        with transaction.atomic():
+            list(Users.objects.select_for_update().filter(pk=user_id).values_list("pk"))
+            writer = IntervalWriter(user_id, self.get(user_id).copy())
+            self._writing.active = True
+            try:
+                yield writer
+            finally:
+                self._writing.active = False
+
+            def publish():
+                base = writer.index.version
+                version = incr_version(namespace)
+                if writer.reload or version != base + 1:
+                    with self._lock:
+                        self._indexes.pop(user_id, None)
+                else:
+                    writer.index.version = version
+                    self._store(user_id, writer.index)
+
+            transaction.on_commit(publish)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+interval_indexes = IntervalIndexes()
@@ -0,0 +1,37 @@
+"""
+Write the OpenAPI schema artifacts of the current code version.
+"""
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve, reverse
+from drf_yasg.renderers import SwaggerJSONRenderer, SwaggerYAMLRenderer
+from po_app.schema import get_setting
+
+
+class Command(BaseCommand):
+    help = ("Generate the OpenAPI schema as JSON and YAML into OPENAPI_SCHEMA DIR, "
+            "named after the code version, and remove the artifacts of other "
+            "versions. To run on deploy, the schema views then serve the artifacts "
+            "without generating the schema.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default=get_setting("URL"),
+                            help="Public API URL, OPENAPI_SCHEMA URL by default")
+
+    def handle(self, *args, **options):
+        url = options["url"]
+        if not url:
+            raise CommandError("--url or the OPENAPI_SCHEMA URL setting is required")
+
+        view = resolve(reverse("schema-json", kwargs={"format": ".json"})).func.view_class
+        directory = Path(get_setting("DIR"))
+        directory.mkdir(parents=True, exist_ok=True)
+        written = set()
+        for renderer_class in (SwaggerJSONRenderer, SwaggerYAMLRenderer):
+            artifact = view.artifact(renderer_class.format)
+            artifact.write_bytes(view.build(renderer_class, url))
+            written.add(artifact)
+        for stale in directory.glob("schema-*"):
+            if stale not in written:
+                stale.unlink()
+        self.stdout.write(self.style.SUCCESS(f"Schema version {view.version()} written to {directory}"))
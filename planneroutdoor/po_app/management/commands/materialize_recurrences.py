@@ -0,0 +1,28 @@
+"""
+Create the planned activities of recurrence rules within the forecast window.
+"""
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from po_app.recurrence import BATCH_SIZE, HORIZON_DAYS, materialize
+
+
+class Command(BaseCommand):
+    help = ("Create the planned activities of the recurrence rule occurrences "
+            "starting within the next --days days, to run daily before "
+            "prewarm_forecasts. Occurrences overlapping a planned activity are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=HORIZON_DAYS,
+                            help="Number of days from today to materialize")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                            help="Rows per insert")
+
+    def handle(self, *args, **options):
+        days, batch_size = options["days"], options["batch_size"]
+        if days < 1 or batch_size < 1:
+            raise CommandError("--days and --batch-size must be positive")
+
+        result = materialize(date.today() + timedelta(days=days - 1), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['users']} users: {result['created']} occurrences created, "
+            f"{result['skipped']} overlapping skipped"))
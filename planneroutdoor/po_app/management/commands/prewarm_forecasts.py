@@ -0,0 +1,45 @@
+"""
+Refresh the weather caches of upcoming planned activities ahead of page loads.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from po_app.cache_backend import is_shared
+from po_app.prewarm import prewarm, prewarm_targets, upcoming_locations
+from po_app.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = ("Refresh the forecast and pollution caches of the locations of "
+            "planned activities within the 16 days forecast window, then their "
+            "forecast snapshots. Runs once, or every --interval seconds as a "
+            "long-lived worker.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Maximum concurrent upstream calls")
+        parser.add_argument("--interval", type=int, default=0,
+                            help="Seconds between runs, 0 to run once")
+
+    def handle(self, *args, **options):
+        workers, interval = options["workers"], options["interval"]
+        if workers < 1 or interval < 0:
+            raise CommandError("--workers must be positive and --interval not negative")
+        if not is_shared():
+            raise CommandError("The default cache is local to this process, so warmed entries would not "
+                               "reach the web workers: set REDIS_URL to use a shared cache")
+
+        while True:
+            close_old_connections()
+            locations = upcoming_locations()
+            targets = prewarm_targets(locations)
+            result = prewarm(targets, workers=workers, horizon=interval)
+            snapshots = refresh_snapshots()
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(locations)} locations, {len(targets)} targets: "
+                f"{result['refreshed']} refreshed, {result['skipped']} fresh, "
+                f"{result['errors']} errors; snapshots: {snapshots['updated']} updated, "
+                f"{snapshots['unchanged']} unchanged, {snapshots['missing']} missing"))
+            if not interval:
+                break
+            time.sleep(interval)
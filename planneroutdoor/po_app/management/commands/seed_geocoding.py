@@ -0,0 +1,35 @@
+"""
+Pre-seed the GeoLocations table so a fresh deployment starts warm.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from po_app.geocoding import geocode, store_location
+
+
+class Command(BaseCommand):
+    help = ("Seed the geocoding table from a JSON file mapping location names "
+            "to Openweathermap results, or from a text file with one location "
+            "name per line resolved through the geocoding API.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSON or text file to load")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            with open(path, encoding="utf-8") as file:
+                content = file.read()
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        if path.endswith(".json"):
+            entries = json.loads(content)
+            for location, results in entries.items():
+                store_location(location, results)
+            count = len(entries)
+        else:
+            locations = [line.strip() for line in content.splitlines() if line.strip()]
+            for location in locations:
+                geocode(location)
+            count = len(locations)
+        self.stdout.write(self.style.SUCCESS(f"{count} locations seeded"))
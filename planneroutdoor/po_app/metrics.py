@@ -0,0 +1,327 @@
+"""
+Prometheus metrics of the API: request latency per route, Openweathermap
+latency, errors and retries per endpoint, cache hits and misses, and
+database queries per route.
+
+Observations only update counters of the process in memory, under one
+lock. With METRICS DIR set, every process writes its counters to its own
+file in that directory, at most every FLUSH_INTERVAL seconds and at
+exit, and /metrics sums the files of all processes, the way
+prometheus_client's multiprocess mode does. The directory should be
+emptied when the workers are restarted by a deploy. Without DIR only
+the serving process is reported.
+"""
+import atexit
+from bisect import bisect_left
+import contextlib
+from contextvars import ContextVar
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+import uuid
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+import orjson
+
+
+DEFAULTS = {
+    "DIR": None,
+    "FLUSH_INTERVAL": 5,
+    "BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    "TOKEN": None,
+}
+# name: (type, help)
+METRICS = {
+    "po_app_request_duration_seconds": (
+        "histogram", "Request latency by route and method"),
+    "po_app_requests_total": (
+        "counter", "Requests by route, method and status class"),
+    "po_app_db_queries_total": (
+        "counter", "Database queries by route"),
+    "po_app_upstream_request_duration_seconds": (
+        "histogram", "Openweathermap call latency by endpoint"),
+    "po_app_upstream_errors_total": (
+        "counter", "Failed Openweathermap calls by endpoint"),
+    "po_app_upstream_retries_total": (
+        "counter", "Retried Openweathermap calls by endpoint"),
+    "po_app_cache_requests_total": (
+        "counter", "Cache lookups by cache and result"),
+    "po_app_cache_hit_ratio": (
+        "gauge", "Share of cache lookups answered without rebuilding"),
+}
+HIT_RESULTS = {"hit", "stale", "fallback"}
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "CONNECT", "TRACE"}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+request_queries = ContextVar("po_app_request_queries", default=None)
+
+
+def get_setting(name):
+    """
+    Return a METRICS setting, falling back on the default value.
+    """
+    return getattr(settings, "METRICS", {}).get(name, DEFAULTS[name])
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    Counters and histograms of one process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed = time.monotonic()
+        self._file = f"metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Add value to the histogram name, bucket counts are not cumulative.
+        """
+        buckets = get_setting("BUCKETS")
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+    def state(self):
+        with self._lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, labels, list(counts), total]
+                               for (name, labels), (counts, total) in self._histograms.items()],
+            }
+
+    def flush(self):
+        """
+        Write the state of the process to its file in DIR, if set.
+        """
+        with self._flush_lock:
+            self._write()
+
+    def maybe_flush(self):
+        """
+        Flush when FLUSH_INTERVAL elapsed, unless another thread is flushing.
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._flushed >= get_setting("FLUSH_INTERVAL"):
+                self._write()
+        finally:
+            self._flush_lock.release()
+
+    def _write(self):
+        """
+        Write the state through a temporary file of its own, logging
+        failures so that metrics never fail a request.
+        """
+        directory = get_setting("DIR")
+        if not directory:
+            return
+        self._flushed = time.monotonic()
+        path = Path(directory) / self._file
+        temporary = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".metrics-", delete=False) as file:
+                temporary = file.name
+                file.write(orjson.dumps(self.state()))
+            os.replace(temporary, path)
+        except OSError:
+            logger.exception("Cannot write the metrics to %s", path)
+            if temporary is not None:
+                with contextlib.suppress(OSError):
+                    os.unlink(temporary)
+
+    def collect(self):
+        """
+        Return the state summed over every process writing to DIR, or the
+        state of this process without DIR.
+        """
+        directory = get_setting("DIR")
+        if not directory:
+            return self.state()
+        self.flush()
+        counters, histograms = {}, {}
+        for path in Path(directory).glob("metrics-*.json"):
+            try:
+                state = orjson.loads(path.read_bytes())
+            except (OSError, orjson.JSONDecodeError):
+                continue
+            for name, labels, value in state["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total in state["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+            "histograms": [[name, labels, counts, total] for (name, labels), (counts, total) in histograms.items()],
+        }
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = Registry()
+atexit.register(metrics.flush)
+
+
+def format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def hit_ratios(counters):
+    """
+    Return {cache labels: hit ratio} of the cache lookup counters.
+    """
+    totals, hits = {}, {}
+    for name, labels, value in counters:
+        if name != "po_app_cache_requests_total":
+            continue
+        labels = dict(labels)
+        key = (("cache", labels["cache"]),)
+        totals[key] = totals.get(key, 0) + value
+        if labels["result"] in HIT_RESULTS:
+            hits[key] = hits.get(key, 0) + value
+    return {key: hits.get(key, 0) / total for key, total in totals.items() if total}
+
+
+def render(state):
+    """
+    Return the Prometheus text exposition of a collected state.
+    """
+    buckets = get_setting("BUCKETS")
+    samples = {name: [] for name in METRICS}
+    for name, labels, value in sorted(state["counters"]):
+        samples[name].append(f"{name}{format_labels(labels)} {value}")
+    for labels, ratio in sorted(hit_ratios(state["counters"]).items()):
+        samples["po_app_cache_hit_ratio"].append(f"po_app_cache_hit_ratio{format_labels(labels)} {ratio:.6g}")
+    for name, labels, counts, total in sorted(state["histograms"]):
+        cumulative = 0
+        for bound, count in zip([*map(str, buckets), "+Inf"], counts):
+            cumulative += count
+            samples[name].append(f"{name}_bucket{format_labels(labels, le=bound)} {cumulative}")
+        samples[name].append(f"{name}_sum{format_labels(labels)} {total:.6g}")
+        samples[name].append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        if samples[name]:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", *samples[name]]
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    Serve the metrics of all processes, behind the TOKEN bearer token if
+    set, else only in DEBUG or to the INTERNAL_IPS addresses.
+    """
+    token = get_setting("TOKEN")
+    if token:
+        allowed = constant_time_compare(request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}")
+    else:
+        allowed = settings.DEBUG or request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render(metrics.collect()), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, status and database queries of every request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def record(self, request, response, elapsed, queries=None):
+        match = request.resolver_match
+        route = match.view_name if match else "unmatched"
+        method = request.method if request.method in METHODS else "other"
+        metrics.observe("po_app_request_duration_seconds", elapsed, route=route, method=method)
+        metrics.inc("po_app_requests_total", route=route, method=method,
+                    status=f"{response.status_code // 100}xx")
+        if queries:
+            metrics.inc("po_app_db_queries_total", queries[0], route=route)
+        metrics.maybe_flush()
+        return response
+
+    @staticmethod
+    def counter(queries):
+        """
+        Return an execute wrapper counting the queries run in the context
+        of the request owning queries.
+        """
+        def count(execute, sql, params, many, context):
+            if request_queries.get() is queries:
+                queries[0] += 1
+            return execute(sql, params, many, context)
+        return count
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = [0]
+        token = request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self.counter(queries)):
+                response = self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        return self.record(request, response, time.perf_counter() - start, queries)
+
+    async def __acall__(self, request):
+        """
+        The ORM calls of async views run on the thread of sync_to_async,
+        whose connection gets the counting wrapper.
+        """
+        queries = [0]
+        token = request_queries.set(queries)
+        count = self.counter(queries)
+        database = await sync_to_async(connections.__getitem__)(DEFAULT_DB_ALIAS)
+        database.execute_wrappers.append(count)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            database.execute_wrappers.remove(count)
+            request_queries.reset(token)
+        return self.record(request, response, time.perf_counter() - start, queries)
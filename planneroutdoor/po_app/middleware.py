@@ -0,0 +1,101 @@
+"""
+Response compression negotiated on Accept-Encoding: brotli when the
+client accepts it, gzip otherwise.
+
+Brotli output cannot carry the random padding Django adds to gzip output
+against BREACH, so the middleware only brotli-compresses public responses,
+which hold no secret. Other responses, e.g. authenticated JSON or the JWT
+login, go through GZipMiddleware and its padding. Views compressing public
+payloads themselves, like the weather payloads and the schema, use
+compress() and may pick brotli.
+"""
+import brotli
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+
+BROTLI_QUALITY = 5
+
+
+def accepted_codings(request):
+    """
+    Return {content coding: q-value} of the Accept-Encoding header.
+    """
+    codings = {}
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, *parameters = (part.strip() for part in item.split(";"))
+        if not name:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[name.lower()] = quality
+    return codings
+
+
+def accepts(codings, encoding):
+    """
+    Return whether accepted_codings allow encoding: q=0 refuses it, and
+    codings not listed fall back on "*".
+    """
+    return codings.get(encoding, codings.get("*", 0)) > 0
+
+
+def accepted_encoding(request):
+    """
+    Return "br" or "gzip" as accepted by the client, or None.
+    """
+    codings = accepted_codings(request)
+    for encoding in ("br", "gzip"):
+        if accepts(codings, encoding):
+            return encoding
+    return None
+
+
+def compress(content, encoding):
+    """
+    Compress content with "br" or "gzip", gzip output padded like
+    GZipMiddleware pads it.
+    """
+    if encoding == "br":
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return compress_string(content, max_random_bytes=GZipMiddleware.max_random_bytes)
+
+
+def is_public(response):
+    return "public" in (directive.strip().lower() for directive in response.get("Cache-Control", "").split(","))
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware with brotli for public non streaming responses.
+    Responses compressed by the view, with a Content-Encoding, are kept.
+    """
+
+    def process_response(self, request, response):
+        if (not response.streaming and len(response.content) < 200) or response.has_header("Content-Encoding"):
+            return response
+        codings = accepted_codings(request)
+        if response.streaming or not is_public(response) or not accepts(codings, "br"):
+            if accepts(codings, "gzip"):
+                return super().process_response(request, response)
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed_content = compress(response.content, "br")
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
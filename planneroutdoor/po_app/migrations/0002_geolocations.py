@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('po_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoLocations',
+            fields=[
+                ('geolocation_id', models.AutoField(primary_key=True, serialize=False)),
+                ('normalized_name', models.CharField(max_length=250, unique=True)),
+                ('location', models.CharField(max_length=250)),
+                ('results', models.JSONField(default=list)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'GeoLocations',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('po_app', '0002_geolocations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plannedactivities',
+            index=models.Index(fields=['user_id', 'start_date'], name='planned_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plannedactivities',
+            index=models.Index(fields=['user_id', 'end_date'], name='planned_user_end_idx'),
+        ),
+    ]
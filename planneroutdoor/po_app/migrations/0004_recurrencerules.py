@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('po_app', '0003_plannedactivities_calendar_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurrenceRules',
+            fields=[
+                ('rule_id', models.AutoField(primary_key=True, serialize=False)),
+                ('location', models.CharField(max_length=250)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('until', models.DateField(blank=True, null=True)),
+                ('count', models.PositiveIntegerField(blank=True, null=True)),
+                ('materialized_until', models.DateField(blank=True, editable=False, null=True)),
+                ('activity_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='po_app.activities')),
+                ('user_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'RecurrenceRules',
+            },
+        ),
+        migrations.AddField(
+            model_name='plannedactivities',
+            name='rule_id',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='po_app.recurrencerules'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('po_app', '0004_recurrencerules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastSnapshots',
+            fields=[
+                ('planned_activity_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='forecast', serialize=False, to='po_app.plannedactivities')),
+                ('source_key', models.CharField(max_length=50)),
+                ('fetched_at', models.FloatField()),
+                ('pollution_fetched_at', models.FloatField(blank=True, null=True)),
+                ('first_day', models.DateField(blank=True, null=True)),
+                ('last_day', models.DateField(blank=True, null=True)),
+                ('temp_min', models.FloatField(blank=True, null=True)),
+                ('temp_max', models.FloatField(blank=True, null=True)),
+                ('pop', models.FloatField(blank=True, null=True)),
+                ('wind_speed', models.FloatField(blank=True, null=True)),
+                ('wind_direction', models.CharField(blank=True, default='', max_length=3)),
+                ('air_quality', models.CharField(blank=True, default='', max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'ForecastSnapshots',
+            },
+        ),
+    ]
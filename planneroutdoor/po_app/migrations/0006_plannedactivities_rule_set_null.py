@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('po_app', '0005_forecastsnapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='plannedactivities',
+            name='rule_id',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='po_app.recurrencerules'),
+        ),
+    ]
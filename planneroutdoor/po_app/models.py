@@ -4,7 +4,7 @@ Django models creation module
 from django.db import models
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.auth.hashers import make_password
+from .hashing import check_password, is_hashed, make_password
 
 
 class UserManager(BaseUserManager):
@@ -52,10 +52,25 @@ class Users(AbstractBaseUser):
     REQUIRED_FIELDS = ["email", "address"]
 
     def save(self, *args, **kwargs):
-        if self.password and not self.password.startswith("pbkdf2_"):
+        if self.password and not is_hashed(self.password):
             self.password = make_password(self.password)
         super().save(*args, **kwargs)
 
+    def set_password(self, raw_password):
+        self.password = make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        Check the password on the hashing pool, upgrading its hash when
+        the hasher or its cost changed.
+        """
+        def setter(raw_password):
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=["password"])
+        return check_password(raw_password, self.password, setter)
+
     def __str__(self) -> str:
         return self.username
 
@@ -127,6 +142,35 @@ class UserAllergens(models.Model):
         return f"{self.user_id.username} - {self.allergen_id.allergen_name}"
 
 
+class RecurrenceRules(models.Model):
+    """
+    Planned activity repeated every interval days, weeks or months from
+    its first occurrence, until a date or for a number of occurrences.
+    """
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    FREQUENCIES = [(DAILY, "Daily"), (WEEKLY, "Weekly"), (MONTHLY, "Monthly")]
+
+    rule_id = models.AutoField(primary_key=True)
+    user_id = models.ForeignKey(Users, on_delete=models.CASCADE)
+    activity_id = models.ForeignKey(Activities, on_delete=models.CASCADE)
+    location = models.CharField(max_length=250)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES)
+    interval = models.PositiveSmallIntegerField(default=1)
+    until = models.DateField(null=True, blank=True)
+    count = models.PositiveIntegerField(null=True, blank=True)
+    materialized_until = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name_plural = "RecurrenceRules"
+
+    def __str__(self) -> str:
+        return f"{self.user_id.username} - {self.activity_id.activity_name} - {self.frequency} from {self.start_date}"
+
+
 class PlannedActivities(models.Model):
     """
     """
@@ -136,10 +180,58 @@ class PlannedActivities(models.Model):
     location = models.CharField(max_length=250)
     start_date = models.DateField()
     end_date = models.DateField()
+    rule_id = models.ForeignKey(RecurrenceRules, null=True, blank=True, on_delete=models.SET_NULL)
 
     class Meta:
         unique_together = ("user_id", "activity_id", "start_date", "end_date")
+        indexes = [
+            models.Index(fields=["user_id", "start_date"], name="planned_user_start_idx"),
+            models.Index(fields=["user_id", "end_date"], name="planned_user_end_idx"),
+        ]
         verbose_name_plural = "PlannedActivities"
 
     def __str__(self) -> str:
         return f"{self.user_id.username} - {self.activity_id.activity_name} - {self.start_date} - {self.end_date}"
+
+
+class ForecastSnapshots(models.Model):
+    """
+    Weather summary of the forecast days of an upcoming planned activity,
+    in metric units, with the cache entries it was computed from.
+    """
+    planned_activity_id = models.OneToOneField(
+        PlannedActivities, primary_key=True, on_delete=models.CASCADE, related_name="forecast")
+    source_key = models.CharField(max_length=50)
+    fetched_at = models.FloatField()
+    pollution_fetched_at = models.FloatField(null=True, blank=True)
+    first_day = models.DateField(null=True, blank=True)
+    last_day = models.DateField(null=True, blank=True)
+    temp_min = models.FloatField(null=True, blank=True)
+    temp_max = models.FloatField(null=True, blank=True)
+    pop = models.FloatField(null=True, blank=True)
+    wind_speed = models.FloatField(null=True, blank=True)
+    wind_direction = models.CharField(max_length=3, blank=True, default="")
+    air_quality = models.CharField(max_length=20, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "ForecastSnapshots"
+
+    def __str__(self) -> str:
+        return f"{self.planned_activity_id_id} - {self.first_day} - {self.last_day}"
+
+
+class GeoLocations(models.Model):
+    """
+    """
+    geolocation_id = models.AutoField(primary_key=True)
+    normalized_name = models.CharField(max_length=250, unique=True)
+    location = models.CharField(max_length=250)
+    results = models.JSONField(default=list)
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "GeoLocations"
+
+    def __str__(self) -> str:
+        return self.normalized_name
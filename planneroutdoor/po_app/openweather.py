@@ -0,0 +1,337 @@
+"""
+Openweathermap API access shared by the weather viewsets.
+
+All upstream calls use one pooled keep-alive session with explicit
+timeouts. Idempotent GETs are retried with jittered backoff as long as
+the process-wide retry budget allows it, so retries cannot multiply the
+load on a failing upstream. Every attempt also goes through the quota
+guard, which enforces the API key budget and the circuit breaker.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+import weakref
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from .metrics import metrics
+from .quota import quota_guard
+from .singleflight import upstream_flight, upstream_key
+from .timing import timed
+
+
+DEFAULTS = {
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    "POOL_SIZE": 20,
+    "ASYNC_POOL_SIZE": 100,
+    "MAX_RETRIES": 2,
+    "BACKOFF": 0.2,
+    "RETRY_RATIO": 0.1,
+    "MIN_RETRIES_PER_SECOND": 1,
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def get_setting(name):
+    """
+    Return an OPENWEATHER_CLIENT setting, falling back on the default value.
+    """
+    return getattr(settings, "OPENWEATHER_CLIENT", {}).get(name, DEFAULTS[name])
+
+
+class RetryBudget:
+    """
+    Token bucket for retries: every request deposits RETRY_RATIO tokens,
+    every retry withdraws one, and MIN_RETRIES_PER_SECOND are refilled so
+    low traffic can still retry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        rate = get_setting("MIN_RETRIES_PER_SECOND")
+        self._tokens = min(self._tokens + (now - self._updated) * rate, max(rate * 10, 10))
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens += get_setting("RETRY_RATIO")
+
+    def withdraw(self):
+        """
+        Return True when a retry is allowed.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class UpstreamStats:
+    """
+    Per-endpoint latency and error counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, elapsed, error=False, retry=False):
+        if retry:
+            metrics.inc("po_app_upstream_retries_total", endpoint=endpoint)
+        else:
+            metrics.observe("po_app_upstream_request_duration_seconds", elapsed, endpoint=endpoint)
+            if error:
+                metrics.inc("po_app_upstream_errors_total", endpoint=endpoint)
+        with self._lock:
+            counters = self._endpoints.setdefault(endpoint, {
+                "requests": 0, "errors": 0, "retries": 0,
+                "latency_ms_total": 0.0, "latency_ms_max": 0.0})
+            if retry:
+                counters["retries"] += 1
+                return
+            latency = elapsed * 1000
+            counters["requests"] += 1
+            counters["errors"] += int(error)
+            counters["latency_ms_total"] += latency
+            counters["latency_ms_max"] = max(counters["latency_ms_max"], latency)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    **counters,
+                    "latency_ms_avg": round(counters["latency_ms_total"] / counters["requests"], 2) if counters["requests"] else 0.0,
+                }
+                for endpoint, counters in self._endpoints.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+retry_budget = RetryBudget()
+upstream_stats = UpstreamStats()
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the shared keep-alive session, created on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4,
+                                      pool_maxsize=get_setting("POOL_SIZE"))
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def max_call_duration():
+    """
+    Return the seconds a get_with_retries call can last at most: every
+    attempt timing out, plus the longest backoffs between them.
+    """
+    retries = get_setting("MAX_RETRIES")
+    attempt = get_setting("CONNECT_TIMEOUT") + get_setting("READ_TIMEOUT")
+    return math.ceil((retries + 1) * attempt + get_setting("BACKOFF") * (2 ** retries - 1)) + 1
+
+
+def get_with_retries(endpoint, url, params):
+    """
+    GET url with timeouts and budgeted jittered retries.
+    Raises requests exceptions once retries are exhausted, and
+    UpstreamUnavailable when the quota guard refuses an attempt.
+    """
+    timeout = (get_setting("CONNECT_TIMEOUT"), get_setting("READ_TIMEOUT"))
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        quota_guard.before_call()
+        start = time.perf_counter()
+        try:
+            response = get_session().get(url, params=params, timeout=timeout)
+            if response.status_code in RETRY_STATUS:
+                response.raise_for_status()
+            upstream_stats.record(endpoint, time.perf_counter() - start,
+                                  error=response.status_code >= 400)
+            quota_guard.record_success()
+            return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.HTTPError):
+            upstream_stats.record(endpoint, time.perf_counter() - start, error=True)
+            quota_guard.record_failure()
+            if attempt >= get_setting("MAX_RETRIES") or not retry_budget.withdraw():
+                raise
+        attempt += 1
+        upstream_stats.record(endpoint, 0, retry=True)
+        backoff = get_setting("BACKOFF") * 2 ** (attempt - 1)
+        time.sleep(random.uniform(0, backoff))
+
+
+def fetch_upstream(endpoint, path, params):
+    """
+    GET an Openweathermap endpoint, identical concurrent calls are coalesced.
+    """
+    url = f"{settings.OPENWEATHER_URL}{path}"
+    params = {**params, "appid": settings.OPENWEATHER_API_KEY}
+
+    def fetch():
+        response = get_with_retries(endpoint, url, params)
+        response.raise_for_status()
+        return response.json()
+
+    with timed("upstream"):
+        return upstream_flight.do(upstream_key(url, params), fetch, timeout=max_call_duration())
+
+
+def fetch_forecast(**params):
+    """
+    Fetch a 16 days forecast from Openweathermap for the given query parameters.
+    """
+    return fetch_upstream("forecast", "/data/2.5/forecast/daily", {**params, "cnt": 16})
+
+
+def fetch_pollution(lat, lon):
+    """
+    Fetch the 4 days hourly air pollution forecast from Openweathermap.
+    """
+    return fetch_upstream("pollution", "/data/2.5/air_pollution/forecast", {"lat": lat, "lon": lon})
+
+
+def fetch_geocoding(location):
+    """
+    Fetch up to 5 matching places from Openweathermap.
+    """
+    return fetch_upstream("geocode", "/geo/1.0/direct", {"q": location, "limit": 5})
+
+
+"""
+Non-blocking variants used by the ASGI views.
+"""
+_async_clients = weakref.WeakKeyDictionary()
+_async_inflight = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Return the keep-alive aiohttp session bound to the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        timeout = aiohttp.ClientTimeout(sock_connect=get_setting("CONNECT_TIMEOUT"),
+                                        sock_read=get_setting("READ_TIMEOUT"))
+        connector = aiohttp.TCPConnector(limit=get_setting("ASYNC_POOL_SIZE"))
+        client = _async_clients[loop] = aiohttp.ClientSession(
+            connector=connector, timeout=timeout, raise_for_status=False)
+    return client
+
+
+async def close_async_client():
+    """
+    Close the session bound to the running event loop, if any.
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def aget_json(endpoint, url, params):
+    """
+    Async GET with the same timeouts, retry policy and budget as get_with_retries.
+    Returns the decoded JSON body, raises aiohttp.ClientResponseError on
+    an error status once retries are exhausted.
+    """
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        await quota_guard.abefore_call()
+        start = time.perf_counter()
+        try:
+            async with get_async_client().get(url, params=params) as response:
+                if response.status in RETRY_STATUS:
+                    response.raise_for_status()
+                upstream_stats.record(endpoint, time.perf_counter() - start,
+                                      error=response.status >= 400)
+                await quota_guard.arecord_success()
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except aiohttp.ClientResponseError as e:
+            if e.status not in RETRY_STATUS:
+                raise
+            upstream_stats.record(endpoint, time.perf_counter() - start, error=True)
+            await quota_guard.arecord_failure()
+            if attempt >= get_setting("MAX_RETRIES") or not retry_budget.withdraw():
+                raise
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            upstream_stats.record(endpoint, time.perf_counter() - start, error=True)
+            await quota_guard.arecord_failure()
+            if attempt >= get_setting("MAX_RETRIES") or not retry_budget.withdraw():
+                raise
+        attempt += 1
+        upstream_stats.record(endpoint, 0, retry=True)
+        backoff = get_setting("BACKOFF") * 2 ** (attempt - 1)
+        await asyncio.sleep(random.uniform(0, backoff))
+
+
+async def afetch_upstream(endpoint, path, params):
+    """
+    Async GET of an Openweathermap endpoint, identical concurrent calls on
+    the same event loop share one request.
+    """
+    url = f"{settings.OPENWEATHER_URL}{path}"
+    params = {**params, "appid": settings.OPENWEATHER_API_KEY}
+    key = upstream_key(url, params)
+    inflight = _async_inflight.setdefault(asyncio.get_running_loop(), {})
+
+    task = inflight.get(key)
+    if task is None:
+        async def fetch():
+            try:
+                return await aget_json(endpoint, url, params)
+            finally:
+                del inflight[key]
+
+        task = inflight[key] = asyncio.ensure_future(fetch())
+    with timed("upstream"):
+        return await asyncio.shield(task)
+
+
+async def afetch_forecast(**params):
+    """
+    Async variant of fetch_forecast.
+    """
+    return await afetch_upstream("forecast", "/data/2.5/forecast/daily", {**params, "cnt": 16})
+
+
+async def afetch_pollution(lat, lon):
+    """
+    Async variant of fetch_pollution.
+    """
+    return await afetch_upstream("pollution", "/data/2.5/air_pollution/forecast", {"lat": lat, "lon": lon})
+
+
+async def afetch_geocoding(location):
+    """
+    Async variant of fetch_geocoding.
+    """
+    return await afetch_upstream("geocode", "/geo/1.0/direct", {"q": location, "limit": 5})
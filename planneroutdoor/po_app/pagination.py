@@ -0,0 +1,15 @@
+"""
+Keyset pagination classes.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class CalendarPagination(CursorPagination):
+    """
+    Cursor over (start_date, planned_activity_id): every page is a range
+    read of the (user_id, start_date) index, whatever its depth.
+    """
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("start_date", "planned_activity_id")
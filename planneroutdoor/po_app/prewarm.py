@@ -0,0 +1,115 @@
+"""
+Forecast and pollution cache pre-warming for upcoming planned activities.
+
+Locations of activities running within the forecast window are geocoded
+through the GeoLocations table, deduplicated on the cache grid, and their
+cache entries refreshed before they expire so page loads are cache hits.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import requests
+from .models import PlannedActivities
+from .geocoding import LocationTooLong, geocode, normalize_location
+from .quota import QuotaExceeded, UpstreamUnavailable
+from .weather_cache import CoordinateError, forecast_cache, forecast_source, get_setting, pollution_cache
+from .weather_cache import pollution_source
+
+
+FORECAST_DAYS = 16
+POLLUTION_DAYS = 4
+
+logger = logging.getLogger(__name__)
+
+
+def upcoming_locations(today=None):
+    """
+    Return {normalized name: (location, needs pollution)} for the activities
+    overlapping the forecast window. Pollution is only forecast 4 days ahead.
+    """
+    today = today or date.today()
+    rows = PlannedActivities.objects.filter(
+        start_date__lt=today + timedelta(days=FORECAST_DAYS),
+        end_date__gte=today,
+    ).values_list("location", "start_date").distinct()
+
+    locations = {}
+    for location, start_date in rows:
+        name = normalize_location(location)
+        if not name:
+            continue
+        pollution = start_date < today + timedelta(days=POLLUTION_DAYS)
+        known = locations.get(name)
+        locations[name] = (location, pollution or (known is not None and known[1]))
+    return locations
+
+
+def prewarm_targets(locations):
+    """
+    Geocode locations and return {(lat, lon): needs pollution}, keeping one
+    target per cache grid cell. Locations that cannot be geocoded are logged
+    and skipped.
+    """
+    targets = {}
+    for location, pollution in locations.values():
+        try:
+            results = geocode(location)
+            if not results:
+                continue
+            key, _ = forecast_source(results[0]["lat"], results[0]["lon"])
+        except (LocationTooLong, CoordinateError, UpstreamUnavailable, requests.exceptions.RequestException) as e:
+            logger.warning("Cannot geocode %r for pre-warming: %s", location, e)
+            continue
+        targets[key] = targets.get(key, False) or pollution
+    return targets
+
+
+def _needs_refresh(cache, key, horizon):
+    """
+    True when the entry is missing or stops being fresh within horizon seconds.
+    """
+    entry = cache.lookup(key)
+    return entry is None or time.time() - entry[0] + horizon >= get_setting("TTL")
+
+
+def prewarm(targets, workers=4, horizon=0):
+    """
+    Refresh the forecast, and pollution when needed, of every target with at
+    most workers concurrent upstream calls. Returns refreshed, skipped and
+    error counts.
+    """
+    jobs = []
+    skipped = 0
+    for key, pollution in targets.items():
+        lat, lon = key.split(",")
+        sources = [(forecast_cache, forecast_source(lat, lon))]
+        if pollution:
+            sources.append((pollution_cache, pollution_source(lat, lon)))
+        for cache, (cache_key, loader) in sources:
+            if _needs_refresh(cache, cache_key, horizon):
+                jobs.append((cache, cache_key, loader))
+            else:
+                skipped += 1
+
+    result = {"refreshed": 0, "skipped": skipped, "errors": 0}
+    if not jobs:
+        return result
+
+    def refresh(job):
+        cache, cache_key, loader = job
+        cache.set(cache_key, loader())
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="po_app-prewarm") as executor:
+        futures = [executor.submit(refresh, job) for job in jobs]
+        for future in futures:
+            try:
+                future.result()
+                result["refreshed"] += 1
+            except QuotaExceeded:
+                result["errors"] += 1
+                for pending in futures:
+                    pending.cancel()
+            except Exception:
+                result["errors"] += 1
+    return result
@@ -0,0 +1,186 @@
+"""
+Quota guard for the shared OPENWEATHER_API_KEY.
+
+Every upstream call first takes a slot from a calls-per-minute budget and
+checks a circuit breaker. Both keep their state in the Django cache, so
+with a shared backend all worker processes enforce the same limits. With
+the per-process in-memory backend each process gets CALLS_PER_MINUTE
+divided by WORKERS and trips its own breaker. The budget is a sliding
+window counter built on atomic cache.incr, the closest shared token
+bucket the Django cache API allows.
+"""
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from .cache_backend import is_shared
+
+
+DEFAULTS = {
+    "CALLS_PER_MINUTE": 60,
+    "WORKERS": 1,
+    "FAILURE_THRESHOLD": 5,
+    "RESET_TIMEOUT": 30,
+}
+
+
+def get_setting(name):
+    """
+    Return an OPENWEATHER_QUOTA setting, falling back on the default value.
+    """
+    return getattr(settings, "OPENWEATHER_QUOTA", {}).get(name, DEFAULTS[name])
+
+
+def calls_per_minute():
+    """
+    Return the budget of the guard, the share of this process when the
+    cache is not shared.
+    """
+    budget = get_setting("CALLS_PER_MINUTE")
+    if is_shared():
+        return budget
+    return max(1, budget // get_setting("WORKERS"))
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling Openweathermap when the guard refuses the call.
+    """
+
+
+class QuotaExceeded(UpstreamUnavailable):
+    """
+    The calls-per-minute budget is spent.
+    """
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """
+    Openweathermap failed repeatedly, calls fail fast until the reset timeout.
+    """
+
+
+class QuotaGuard:
+    """
+    Process-shared call budget and circuit breaker.
+    """
+    prefix = "po_app:quota"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"allowed": 0, "rejected_quota": 0, "rejected_open": 0, "opened": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _window_key(self, window):
+        return f"{self.prefix}:window:{window}"
+
+    def _usage(self, now):
+        """
+        Return the sliding window estimate of the calls made during the
+        last minute.
+        """
+        window = int(now // 60)
+        previous = cache.get(self._window_key(window - 1), 0)
+        current = cache.get(self._window_key(window), 0)
+        return previous * (1 - (now % 60) / 60) + current
+
+    def _take_slot(self, now):
+        window_key = self._window_key(int(now // 60))
+        cache.add(window_key, 0, timeout=180)
+        try:
+            cache.incr(window_key)
+        except ValueError:
+            cache.set(window_key, 1, timeout=180)
+        if self._usage(now) > calls_per_minute():
+            try:
+                cache.decr(window_key)
+            except ValueError:
+                pass
+            return False
+        return True
+
+    def before_call(self):
+        """
+        Raise CircuitOpen or QuotaExceeded when the call must not be made.
+        Once the reset timeout is over a single probe call is let through.
+        """
+        opened_until = cache.get(f"{self.prefix}:opened_until")
+        if opened_until is not None:
+            if time.time() < opened_until or not cache.add(
+                    f"{self.prefix}:probe", 1, timeout=get_setting("RESET_TIMEOUT")):
+                self._count("rejected_open")
+                raise CircuitOpen("Openweathermap circuit breaker is open")
+        if not self._take_slot(time.time()):
+            self._count("rejected_quota")
+            raise QuotaExceeded("Openweathermap calls per minute budget exceeded")
+        self._count("allowed")
+
+    def record_success(self):
+        """
+        Close the breaker after a successful call.
+        """
+        if cache.get(f"{self.prefix}:failures"):
+            cache.delete_many([f"{self.prefix}:failures", f"{self.prefix}:opened_until",
+                               f"{self.prefix}:probe"])
+
+    def record_failure(self):
+        """
+        Count a consecutive failure and open the breaker past the threshold.
+        """
+        failures_key = f"{self.prefix}:failures"
+        reset_timeout = get_setting("RESET_TIMEOUT")
+        cache.add(failures_key, 0, timeout=reset_timeout * 10)
+        try:
+            failures = cache.incr(failures_key)
+        except ValueError:
+            failures = 1
+            cache.set(failures_key, failures, timeout=reset_timeout * 10)
+        if failures >= get_setting("FAILURE_THRESHOLD"):
+            cache.set(f"{self.prefix}:opened_until", time.time() + reset_timeout,
+                      timeout=reset_timeout * 10)
+            cache.delete(f"{self.prefix}:probe")
+            self._count("opened")
+
+    abefore_call = sync_to_async(before_call, thread_sensitive=False)
+    arecord_success = sync_to_async(record_success, thread_sensitive=False)
+    arecord_failure = sync_to_async(record_failure, thread_sensitive=False)
+
+    def state(self):
+        """
+        Return budget usage, breaker state and this process counters.
+        """
+        now = time.time()
+        opened_until = cache.get(f"{self.prefix}:opened_until")
+        if opened_until is None:
+            breaker = "closed"
+        elif now < opened_until:
+            breaker = "open"
+        else:
+            breaker = "half-open"
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "budget": {"calls_per_minute": calls_per_minute(), "shared": is_shared(),
+                       "used": round(self._usage(now), 2)},
+            "breaker": {"state": breaker, "failures": cache.get(f"{self.prefix}:failures", 0),
+                        "opened_until": opened_until},
+            "counters": counters,
+        }
+
+    def reset(self):
+        """
+        Close the breaker and reset this process counters.
+        """
+        window = int(time.time() // 60)
+        cache.delete_many([f"{self.prefix}:failures", f"{self.prefix}:opened_until",
+                           f"{self.prefix}:probe", self._window_key(window),
+                           self._window_key(window - 1)])
+        with self._lock:
+            self.counters = {name: 0 for name in self.counters}
+
+
+quota_guard = QuotaGuard()
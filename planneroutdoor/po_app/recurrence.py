@@ -0,0 +1,151 @@
+"""
+Expansion of recurrence rules into occurrences, and their materialization
+as PlannedActivities rows.
+
+Occurrences are generated lazily: the first occurrence overlapping a
+window is found arithmetically and the following ones are yielded one at
+a time, so expanding any window holds one occurrence per rule in memory.
+Rows are only created up to a horizon, e.g. the forecast window, in
+batches of bulk_create under the interval index lock of each user.
+"""
+import calendar
+import heapq
+from datetime import date, timedelta
+from itertools import islice
+from django.db.models import Q
+from .intervals import PlanningConflict, interval_indexes
+from .models import RecurrenceRules, PlannedActivities
+
+BATCH_SIZE = 500
+# Occurrences within the forecast window are real rows
+HORIZON_DAYS = 16
+STEP_DAYS = {RecurrenceRules.DAILY: 1, RecurrenceRules.WEEKLY: 7}
+
+
+def add_months(day, months):
+    """
+    Same day months later, clamped to the end of shorter months.
+    """
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def period_days(rule):
+    """
+    Shortest number of days between two occurrences of a rule.
+    """
+    if rule.frequency == RecurrenceRules.MONTHLY:
+        return 28 * rule.interval
+    return STEP_DAYS[rule.frequency] * rule.interval
+
+
+def nth_start(rule, n):
+    """
+    Start date of the occurrence n of a rule, counting from 0.
+    """
+    if rule.frequency == RecurrenceRules.MONTHLY:
+        return add_months(rule.start_date, n * rule.interval)
+    return rule.start_date + timedelta(days=n * STEP_DAYS[rule.frequency] * rule.interval)
+
+
+def first_index(rule, start):
+    """
+    Number of the first occurrence of a rule ending on or after start.
+    """
+    target = start - (rule.end_date - rule.start_date)
+    if target <= rule.start_date:
+        return 0
+    if rule.frequency == RecurrenceRules.MONTHLY:
+        months = (target.year - rule.start_date.year) * 12 + target.month - rule.start_date.month
+        n = months // rule.interval
+        while nth_start(rule, n) < target:
+            n += 1
+        return n
+    return -(-(target - rule.start_date).days // period_days(rule))
+
+
+def occurrences(rule, start=None, end=None):
+    """
+    Yield lazily the (start_date, end_date) of the rule occurrences
+    overlapping [start, end], both optional.
+    """
+    duration = rule.end_date - rule.start_date
+    n = first_index(rule, start) if start else 0
+    while rule.count is None or n < rule.count:
+        first = nth_start(rule, n)
+        if (end and first > end) or (rule.until and first > rule.until):
+            return
+        yield first, first + duration
+        n += 1
+
+
+def expand(rules, start, end):
+    """
+    Yield lazily the (rule, start_date, end_date) of the occurrences of
+    several rules overlapping [start, end], ordered by start date.
+    """
+    streams = (((first, rule.pk, last, rule) for first, last in occurrences(rule, start, end))
+               for rule in rules)
+    for first, _, last, rule in heapq.merge(*streams):
+        yield rule, first, last
+
+
+def materialize_rule(writer, rule, until, strict=False, batch_size=BATCH_SIZE):
+    """
+    Create the rows of the occurrences of a rule not materialized yet, from
+    today at the earliest up to until, with the IntervalWriter of its user. Occurrences overlapping
+    a planned activity are skipped, or raise PlanningConflict when strict.
+    Return the numbers of created and skipped occurrences.
+    """
+    begin = max(rule.start_date, date.today())
+    if rule.materialized_until is not None:
+        begin = max(rule.start_date, rule.materialized_until + timedelta(days=1))
+    created = skipped = 0
+    if begin <= until:
+        writer.sync(begin, until)
+    pending = (item for item in occurrences(rule, begin, until) if item[0] >= begin)
+    while True:
+        chunk = list(islice(pending, batch_size))
+        if not chunk:
+            break
+        batch = []
+        for first, last in chunk:
+            conflicts = writer.index.conflicts(first, last)
+            if conflicts:
+                if strict:
+                    raise PlanningConflict(conflicts)
+                skipped += 1
+                continue
+            writer.add(None, first, last)
+            batch.append(PlannedActivities(
+                user_id_id=rule.user_id_id, activity_id_id=rule.activity_id_id, location=rule.location,
+                start_date=first, end_date=last, rule_id=rule))
+        PlannedActivities.objects.bulk_create(batch)
+        created += len(batch)
+    rule.materialized_until = until
+    RecurrenceRules.objects.filter(pk=rule.pk).update(materialized_until=until)
+    return created, skipped
+
+
+def horizon():
+    return date.today() + timedelta(days=HORIZON_DAYS - 1)
+
+
+def materialize(until, batch_size=BATCH_SIZE):
+    """
+    Materialize the occurrences of every rule up to until, one user at a
+    time. Return the numbers of users, created and skipped occurrences.
+    """
+    pending = RecurrenceRules.objects.filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=until))
+    result = {"users": 0, "created": 0, "skipped": 0}
+    users = pending.values_list("user_id", flat=True).distinct().order_by("user_id")
+    for user_id in users.iterator(chunk_size=batch_size):
+        with interval_indexes.write(user_id) as writer:
+            for rule in pending.filter(user_id=user_id).order_by("rule_id"):
+                created, skipped = materialize_rule(writer, rule, until, batch_size=batch_size)
+                result["created"] += created
+                result["skipped"] += skipped
+        result["users"] += 1
+    return result
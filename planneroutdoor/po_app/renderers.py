@@ -0,0 +1,77 @@
+"""
+orjson based JSON renderer and parser, registered in REST_FRAMEWORK settings,
+and a response type for bodies encoded ahead of time.
+"""
+import orjson
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from .timing import timed
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Drop-in replacement of rest_framework JSONRenderer, with the same
+    output: UTC datetimes end with Z like the DRF encoder writes them, and
+    types orjson does not know, e.g. Decimal, are handed to the DRF encoder.
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+        if accepted_media_type and "indent" in accepted_media_type:
+            option |= orjson.OPT_INDENT_2
+        with timed("render"):
+            return orjson.dumps(data, default=self._default, option=option)
+
+
+class ORJSONParser(BaseParser):
+    """
+    Drop-in replacement of rest_framework JSONParser.
+    """
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
+
+
+def encode(data):
+    """
+    Encode data as the JSON renderer would.
+    """
+    return ORJSONRenderer().render(data)
+
+
+class EncodedResponse(Response):
+    """
+    Response whose JSON body was encoded, and possibly compressed with
+    content_encoding, ahead of time, e.g. once per cache entry. Other
+    renderers, like the browsable API, render data as usual.
+    """
+
+    def __init__(self, data, encoded, content_encoding=None, **kwargs):
+        super().__init__(data, **kwargs)
+        self.encoded = encoded
+        self.content_encoding = content_encoding
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, "accepted_renderer", None)
+        if renderer is None or renderer.format != "json":
+            return super().rendered_content
+        self["Content-Type"] = renderer.media_type
+        patch_vary_headers(self, ("Accept-Encoding",))
+        if self.content_encoding:
+            self["Content-Encoding"] = self.content_encoding
+        return self.encoded
@@ -0,0 +1,158 @@
+"""
+OpenAPI schema built once per code version instead of on every request.
+
+drf_yasg walks every viewset to generate the schema, so the rendered spec
+is kept in memory per format, or read from the artifact written by the
+build_openapi_schema command when the API URL is configured. The version
+is a fingerprint of the URL patterns, of the project modules defining
+their views and of RELEASE, so a deploy changing any of them serves a new
+schema. Responses carry a strong ETag and long-lived cache headers, and
+are compressed once per accepted encoding. Without URL the spec is
+rendered per request host, at most MAX_ENTRIES rendered and compressed
+bodies are kept.
+"""
+import hashlib
+import sys
+import threading
+from pathlib import Path
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import URLResolver
+from django.utils.http import quote_etag
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import get_schema_view
+from .catalog_cache import etag_matches
+from .middleware import accepted_encoding, compress
+
+
+DEFAULTS = {
+    "DIR": None,
+    "URL": None,
+    "RELEASE": "",
+    "MAX_AGE": 86400,
+    "MAX_ENTRIES": 32,
+}
+EXTENSIONS = {"openapi": ".json", ".json": ".json", ".yaml": ".yaml"}
+
+
+def get_setting(name):
+    """
+    Return an OPENAPI_SCHEMA setting, falling back on the default value.
+    """
+    value = getattr(settings, "OPENAPI_SCHEMA", {}).get(name, DEFAULTS[name])
+    if name == "DIR" and value is None:
+        value = Path(settings.BASE_DIR) / "openapi"
+    return value
+
+
+def walk(patterns, prefix=""):
+    """
+    Yield (route, view) of URL patterns, included patterns flattened.
+    """
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from walk(pattern.url_patterns, route)
+        else:
+            callback = pattern.callback
+            yield route, getattr(callback, "cls", None) or getattr(callback, "view_class", None) or callback
+
+
+def fingerprint(patterns):
+    """
+    Return the version of the schema of URL patterns.
+    """
+    digest = hashlib.sha1(str(get_setting("RELEASE")).encode())
+    base = Path(settings.BASE_DIR).resolve()
+    modules = set()
+    for route, view in walk(patterns):
+        digest.update(f"{route}:{view.__module__}.{view.__qualname__}\n".encode())
+        modules.add(view.__module__.partition(".")[0])
+    for name in sorted(name for name in sys.modules if name.partition(".")[0] in modules):
+        source = getattr(sys.modules[name], "__file__", None)
+        if source and Path(source).resolve().is_relative_to(base):
+            digest.update(Path(source).read_bytes())
+    return digest.hexdigest()
+
+
+def cached_schema_view(info, patterns, **kwargs):
+    """
+    Return the drf_yasg SchemaView for info and patterns, serving its
+    spec renderers from the schema cache.
+    """
+    base_view = get_schema_view(info, patterns=patterns, public=True, **kwargs)
+
+    class CachedSchemaView(base_view):
+        schema_info = info
+        schema_patterns = patterns
+        _version = None
+        _rendered = {}
+        _lock = threading.Lock()
+
+        @classmethod
+        def version(cls):
+            if cls._version is None:
+                cls._version = fingerprint(cls.schema_patterns)
+            return cls._version
+
+        @classmethod
+        def artifact(cls, renderer_format):
+            return Path(get_setting("DIR")) / f"schema-{cls.version()}{EXTENSIONS[renderer_format]}"
+
+        @classmethod
+        def store(cls, key, value):
+            with cls._lock:
+                if len(cls._rendered) >= get_setting("MAX_ENTRIES"):
+                    cls._rendered.clear()
+                cls._rendered[key] = value
+
+        @classmethod
+        def build(cls, renderer_class, url, request=None):
+            """
+            Generate and render the spec, the API URL comes from the request
+            when url is None.
+            """
+            generator = cls.generator_class(cls.schema_info, "", url, cls.schema_patterns)
+            return renderer_class().render(generator.get_schema(request, True))
+
+        def rendered(self, request):
+            renderer = request.accepted_renderer
+            url = get_setting("URL")
+            key = (renderer.format, url or request.build_absolute_uri("/"))
+            with self._lock:
+                entry = self._rendered.get(key)
+            if entry is None:
+                artifact = self.artifact(renderer.format)
+                if url and artifact.exists():
+                    body = artifact.read_bytes()
+                else:
+                    body = self.build(type(renderer), url, request)
+                entry = (body, quote_etag(hashlib.sha1(body).hexdigest()))
+                self.store(key, entry)
+            return entry
+
+        def compressed(self, body, etag, encoding):
+            key = (etag, encoding)
+            with self._lock:
+                content = self._rendered.get(key)
+            if content is None:
+                content = compress(body, encoding)
+                self.store(key, content)
+            return content
+
+        def get(self, request, version="", format=None):
+            if not isinstance(request.accepted_renderer, _SpecRenderer):
+                return super().get(request, version, format)
+            body, etag = self.rendered(request)
+            headers = {"ETag": etag, "Cache-Control": f"public, max-age={get_setting('MAX_AGE')}"}
+            if etag_matches(request, etag):
+                return HttpResponseNotModified(headers=headers)
+            encoding = accepted_encoding(request)
+            if encoding:
+                body = self.compressed(body, etag, encoding)
+                headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+            renderer = request.accepted_renderer
+            return HttpResponse(body, content_type=f"{renderer.media_type}; charset={renderer.charset}",
+                                headers=headers)
+
+    return CachedSchemaView
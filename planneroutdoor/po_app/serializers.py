@@ -1,13 +1,34 @@
 """
 """
 from rest_framework import serializers
-from django.contrib.auth.hashers import make_password
-from .models import Users, Activities, Allergens, UserActivities, UserAllergens, PlannedActivities
+from django.db.models import QuerySet
+from django.urls import reverse
+from .models import Users, Activities, Allergens, UserActivities, UserAllergens, PlannedActivities, RecurrenceRules
+from .hashing import make_password
+from .recurrence import period_days
+from .timing import timed
 
 
-class UsersSerializer(serializers.HyperlinkedModelSerializer):
+class TimedData:
+    """
+    Serializer mixin adding the time spent building data, related rows
+    loaded meanwhile included, to the serialize phase of the request.
+    """
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            return super().data
+
+
+class TimedListSerializer(TimedData, serializers.ListSerializer):
+    pass
+
+
+class UsersSerializer(TimedData, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Users
+        list_serializer_class = TimedListSerializer
         fields = ["url", "id", "username", "email", "password", "address"]
 
     def create(self, validated_data):
@@ -26,35 +47,166 @@ class UsersSerializer(serializers.HyperlinkedModelSerializer):
         return value
 
 
-class ActivitiesSerializer(serializers.HyperlinkedModelSerializer):
+class ActivitiesSerializer(TimedData, serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Activities
+        list_serializer_class = TimedListSerializer
         fields = ["url", "activity_id", "activity_name",
                   "activity_desc"]
 
 
-class AllergensSerializer(serializers.HyperlinkedModelSerializer):
+class AllergensSerializer(TimedData, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Allergens
+        list_serializer_class = TimedListSerializer
         fields = ["url", "allergen_id", "allergen_name", "allergen_desc"]
 
 
-class UserActivitiesSerializer(serializers.HyperlinkedModelSerializer):
+class UserActivitiesSerializer(TimedData, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = UserActivities
+        list_serializer_class = TimedListSerializer
         fields = ["url", "user_activity_id", "user_id",
                   "activity_id"]
 
 
-class UserAllergensSerializer(serializers.HyperlinkedModelSerializer):
+class UserAllergensSerializer(TimedData, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = UserAllergens
+        list_serializer_class = TimedListSerializer
         fields = ["url", "user_allergen_id", "user_id", "allergen_id"]
 
 
-class PlannedActivitiesSerializer(serializers.HyperlinkedModelSerializer):
+class PlannedActivitiesSerializer(TimedData, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = PlannedActivities
+        list_serializer_class = TimedListSerializer
         fields = ["url", "planned_activity_id", "user_id",
-                  "activity_id", "location", "start_date", "end_date"]
+                  "activity_id", "location", "start_date", "end_date", "rule_id"]
+        read_only_fields = ["rule_id"]
+
+    def validate(self, attrs):
+        start = attrs.get("start_date", getattr(self.instance, "start_date", None))
+        end = attrs.get("end_date", getattr(self.instance, "end_date", None))
+        if start and end and end < start:
+            raise serializers.ValidationError("end_date must not be before start_date.")
+        return attrs
+
+
+class RecurrenceRulesSerializer(TimedData, serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = RecurrenceRules
+        list_serializer_class = TimedListSerializer
+        fields = ["url", "rule_id", "user_id", "activity_id", "location", "start_date", "end_date",
+                  "frequency", "interval", "until", "count", "materialized_until"]
+        read_only_fields = ["materialized_until"]
+
+    def validate(self, attrs):
+        values = {field: attrs.get(field, getattr(self.instance, field, None))
+                  for field in ("start_date", "end_date", "frequency", "interval", "until")}
+        if values["end_date"] < values["start_date"]:
+            raise serializers.ValidationError("end_date must not be before start_date.")
+        if values["interval"] is not None and values["interval"] < 1:
+            raise serializers.ValidationError("interval must be at least 1.")
+        if values["until"] and values["until"] < values["start_date"]:
+            raise serializers.ValidationError("until must not be before start_date.")
+        period = period_days(RecurrenceRules(frequency=values["frequency"], interval=values["interval"] or 1))
+        if (values["end_date"] - values["start_date"]).days >= period:
+            raise serializers.ValidationError("Occurrences must not overlap each other.")
+        return attrs
+
+
+class PlannedActivitiesImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PlannedActivities
+        fields = ["activity_id", "location", "start_date", "end_date"]
+
+    def validate(self, attrs):
+        if attrs["end_date"] < attrs["start_date"]:
+            raise serializers.ValidationError("end_date must not be before start_date.")
+        return attrs
+
+
+class UserActivitiesSetSerializer(serializers.Serializer):
+    activity_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=True)
+
+    def validate_activity_ids(self, value):
+        value = set(value)
+        if Activities.objects.filter(activity_id__in=value).count() != len(value):
+            raise serializers.ValidationError("Unknown activity id.")
+        return value
+
+
+class UserAllergensSetSerializer(serializers.Serializer):
+    allergen_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=True)
+
+    def validate_allergen_ids(self, value):
+        value = set(value)
+        if Allergens.objects.filter(allergen_id__in=value).count() != len(value):
+            raise serializers.ValidationError("Unknown allergen id.")
+        return value
+
+
+class FlatSerializer:
+    """
+    Read-only list serializer building plain dicts from a values() queryset,
+    or from rows of such a queryset.
+    Related objects are given by id and the url of each row comes from one
+    reversed URL template instead of a reverse() per row and field.
+    """
+    fields = ()
+    pk = None
+    url_name = None
+
+    def __init__(self, queryset, request=None):
+        self.queryset = queryset
+        self.request = request
+
+    def url_template(self):
+        url = reverse(self.url_name, args=["0"])
+        if self.request is not None:
+            url = self.request.build_absolute_uri(url)
+        prefix, _, suffix = url.rpartition("0")
+        return prefix, suffix
+
+    @classmethod
+    def values(cls, queryset):
+        """
+        Return the values() queryset holding the serialized fields.
+        """
+        return queryset.values(*cls.fields)
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            return self.rows()
+
+    def rows(self):
+        rows = self.queryset
+        if isinstance(rows, QuerySet):
+            rows = self.values(rows)
+        rows = [dict(row) for row in rows]
+        prefix, suffix = self.url_template()
+        pk = self.pk
+        for row in rows:
+            row["url"] = f"{prefix}{row[pk]}{suffix}"
+        return rows
+
+
+class UserActivitiesFlatSerializer(FlatSerializer):
+    fields = ("user_activity_id", "user_id", "activity_id")
+    pk = "user_activity_id"
+    url_name = "useractivities-detail"
+
+
+class UserAllergensFlatSerializer(FlatSerializer):
+    fields = ("user_allergen_id", "user_id", "allergen_id")
+    pk = "user_allergen_id"
+    url_name = "userallergens-detail"
+
+
+class PlannedActivitiesFlatSerializer(FlatSerializer):
+    fields = ("planned_activity_id", "user_id", "activity_id", "location", "start_date", "end_date", "rule_id")
+    pk = "planned_activity_id"
+    url_name = "plannedactivities-detail"
@@ -0,0 +1,37 @@
+"""
+Cache invalidation receivers, connected in PoAppConfig.ready.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import user_cache
+from .catalog_cache import bump_version, user_namespace
+from .intervals import interval_indexes, planned_namespace
+from .models import Users, Activities, Allergens, UserActivities, UserAllergens, PlannedActivities
+
+
+@receiver([post_save, post_delete], sender=Activities)
+def activities_changed(sender, **kwargs):
+    bump_version("activities")
+
+
+@receiver([post_save, post_delete], sender=Allergens)
+def allergens_changed(sender, **kwargs):
+    bump_version("allergens")
+
+
+@receiver([post_save, post_delete], sender=Users)
+def user_changed(sender, instance, **kwargs):
+    user_cache.forget(instance.pk)
+    bump_version(user_namespace(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=UserActivities)
+@receiver([post_save, post_delete], sender=UserAllergens)
+def user_preferences_changed(sender, instance, **kwargs):
+    bump_version(user_namespace(instance.user_id_id))
+
+
+@receiver([post_save, post_delete], sender=PlannedActivities)
+def planned_activities_changed(sender, instance, **kwargs):
+    if not interval_indexes.writing:
+        bump_version(planned_namespace(instance.user_id_id))
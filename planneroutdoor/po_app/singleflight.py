@@ -0,0 +1,127 @@
+"""
+Coalescing of concurrent identical upstream requests.
+
+Threads of one worker asking for the same key share a single call.
+Across worker processes a short lock in the shared cache elects one
+leader, the other processes wait for the leader's result instead of
+calling upstream themselves.
+"""
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+
+
+DEFAULTS = {
+    "LOCK_TIMEOUT": None,
+    "RESULT_TTL": 5,
+    "POLL_INTERVAL": 0.05,
+}
+
+
+def get_setting(name):
+    """
+    Return a SINGLE_FLIGHT setting, falling back on the default value.
+    """
+    return getattr(settings, "SINGLE_FLIGHT", {}).get(name, DEFAULTS[name])
+
+
+def upstream_key(url, params):
+    """
+    Build a normalized key for an upstream request, the API key is left out.
+    """
+    query = urlencode(sorted((k, str(v)) for k, v in params.items() if k != "appid"))
+    return hashlib.sha1(f"{url}?{query}".encode()).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run fn() once per key for all concurrent callers.
+    """
+
+    def __init__(self, namespace="flight"):
+        self.namespace = namespace
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {"leader": 0, "shared": 0}
+
+    def do(self, key, fn, timeout=10):
+        """
+        Return fn() for key, sharing an in-flight call when there is one.
+        Errors of the leading call are raised in every waiting caller.
+        timeout is the longest fn() can take, the cross-process lock lives
+        that long unless LOCK_TIMEOUT is set.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.counters["leader"] += 1
+                leader = True
+            else:
+                self.counters["shared"] += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn, get_setting("LOCK_TIMEOUT") or timeout)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _do_shared(self, key, fn, lock_timeout):
+        """
+        Elect one process per key through cache.add, others poll for its result.
+        """
+        lock_key = f"po_app:{self.namespace}:lock:{key}"
+        result_key = f"po_app:{self.namespace}:result:{key}"
+
+        if cache.add(lock_key, 1, timeout=lock_timeout):
+            try:
+                result = fn()
+                cache.set(result_key, result, timeout=get_setting("RESULT_TTL"))
+                return result
+            finally:
+                cache.delete(lock_key)
+
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            result = cache.get(result_key)
+            if result is not None:
+                return result
+            if cache.get(lock_key) is None:
+                break
+            time.sleep(get_setting("POLL_INTERVAL"))
+        result = cache.get(result_key)
+        if result is not None:
+            return result
+        return fn()
+
+    def stats(self):
+        """
+        Return the number of leading and shared calls.
+        """
+        with self._lock:
+            return dict(self.counters)
+
+
+upstream_flight = SingleFlight()
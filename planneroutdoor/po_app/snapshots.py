@@ -0,0 +1,169 @@
+"""
+Forecast snapshots of upcoming planned activities.
+
+A snapshot summarizes the forecast days of one activity: temperature
+range, highest precipitation probability and wind, and the worst air
+quality index. It records the forecast and pollution cache entries it was
+computed from, so a refresh only reads the caches, never upstream, and
+rewrites the snapshots whose entries or covered days changed.
+"""
+from datetime import date, timedelta
+import logging
+import requests
+from .air_quality import aggregate, aqi_level, daily_aqi
+from .forecast import Forecast, UNITS
+from .geocoding import LocationTooLong, geocode, normalize_location
+from .models import ForecastSnapshots, PlannedActivities
+from .prewarm import FORECAST_DAYS, POLLUTION_DAYS
+from .quota import UpstreamUnavailable
+from .weather_cache import CoordinateError, forecast_cache, forecast_source, pollution_cache
+
+
+SUMMARY_FIELDS = ("first_day", "last_day", "temp_min", "temp_max", "pop",
+                  "wind_speed", "wind_direction", "air_quality")
+FIELDS = ("source_key", "fetched_at", "pollution_fetched_at") + SUMMARY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def forecast_days(key, entry):
+    """
+    Return {date: ForecastDay} of a forecast cache entry.
+    """
+    forecast = forecast_cache.derived(key, entry, "parsed", Forecast)
+    return {date.fromisoformat(day.date): day for day in forecast.days}
+
+
+def pollution_days(key, entry):
+    """
+    Return {date: highest air quality index} of a pollution cache entry.
+    """
+    return daily_aqi(pollution_cache.derived(key, entry, "aggregated", aggregate))
+
+
+def summarize(days, aqi, first, last):
+    """
+    Return the summary fields of the forecast days between first and last.
+    """
+    celsius = UNITS["metric"][0]
+    covered = [days[day] for day in sorted(days) if first <= day <= last]
+    if not covered:
+        return dict.fromkeys(SUMMARY_FIELDS) | {"wind_direction": "", "air_quality": ""}
+
+    def extreme(values, pick):
+        values = [value for value in values if value is not None]
+        return pick(values) if values else None
+
+    windiest = max(covered, key=lambda day: day.wind_speed or 0)
+    temp_min = extreme((day.temp_min for day in covered), min)
+    temp_max = extreme((day.temp_max for day in covered), max)
+    worst = extreme((value for day, value in aqi.items() if first <= day <= last), max)
+    return {
+        "first_day": date.fromisoformat(covered[0].date),
+        "last_day": date.fromisoformat(covered[-1].date),
+        "temp_min": None if temp_min is None else round(celsius(temp_min), 1),
+        "temp_max": None if temp_max is None else round(celsius(temp_max), 1),
+        "pop": extreme((day.pop for day in covered), max),
+        "wind_speed": windiest.wind_speed,
+        "wind_direction": windiest.wind_direction,
+        "air_quality": aqi_level(worst),
+    }
+
+
+def source_keys(locations):
+    """
+    Geocode locations and return {normalized name: cache key}. Locations
+    that cannot be geocoded are logged and left out.
+    """
+    keys = {}
+    for name, location in locations.items():
+        try:
+            results = geocode(location)
+            if results:
+                keys[name] = forecast_source(results[0]["lat"], results[0]["lon"])[0]
+        except (LocationTooLong, CoordinateError, UpstreamUnavailable, requests.exceptions.RequestException) as e:
+            logger.warning("Cannot geocode %r for forecast snapshots: %s", location, e)
+    return keys
+
+
+class Source:
+    """
+    Cached forecast and pollution entries of one location, read once per refresh.
+    """
+
+    def __init__(self, key, forecast, pollution):
+        self.key = key
+        self.forecast = forecast
+        self.pollution = pollution
+        self._days = self._aqi = None
+
+    def days(self):
+        if self._days is None:
+            self._days = forecast_days(self.key, self.forecast)
+        return self._days
+
+    def aqi(self):
+        if self._aqi is None:
+            self._aqi = pollution_days(self.key, self.pollution) if self.pollution else {}
+        return self._aqi
+
+    def covered(self, first, last):
+        """
+        First and last forecast days between first and last.
+        """
+        covered = [day for day in self.days() if first <= day <= last]
+        return (min(covered), max(covered)) if covered else (None, None)
+
+
+def refresh_snapshots(today=None):
+    """
+    Bring the snapshots of the activities overlapping the forecast window
+    up to date with the cached forecasts. Returns the numbers of updated,
+    unchanged and missing snapshots, missing when the forecast is not cached.
+    """
+    today = today or date.today()
+    horizon = today + timedelta(days=FORECAST_DAYS - 1)
+    activities = list(PlannedActivities.objects.filter(
+        start_date__lte=horizon, end_date__gte=today).select_related("forecast"))
+    keys = source_keys({normalize_location(activity.location): activity.location
+                        for activity in activities if normalize_location(activity.location)})
+
+    result = {"updated": 0, "unchanged": 0, "missing": 0}
+    sources = {}
+    created, changed = [], []
+    for activity in activities:
+        key = keys.get(normalize_location(activity.location))
+        if key not in sources:
+            forecast = forecast_cache.lookup(key) if key else None
+            sources[key] = Source(key, forecast, pollution_cache.lookup(key) if forecast else None)
+        source = sources[key]
+        if source.forecast is None:
+            result["missing"] += 1
+            continue
+
+        needs_pollution = activity.start_date < today + timedelta(days=POLLUTION_DAYS)
+        pollution_at = source.pollution[0] if needs_pollution and source.pollution else None
+        first, last = max(activity.start_date, today), min(activity.end_date, horizon)
+        snapshot = getattr(activity, "forecast", None)
+        if (snapshot is not None and snapshot.source_key == key
+                and snapshot.fetched_at == source.forecast[0]
+                and snapshot.pollution_fetched_at == pollution_at
+                and (snapshot.first_day, snapshot.last_day) == source.covered(first, last)):
+            result["unchanged"] += 1
+            continue
+
+        summary = summarize(source.days(), source.aqi() if pollution_at else {}, first, last)
+        values = dict(summary, source_key=key, fetched_at=source.forecast[0], pollution_fetched_at=pollution_at)
+        if snapshot is None:
+            created.append(ForecastSnapshots(planned_activity_id=activity, **values))
+        else:
+            for field, value in values.items():
+                setattr(snapshot, field, value)
+            changed.append(snapshot)
+        result["updated"] += 1
+
+    ForecastSnapshots.objects.bulk_create(created, batch_size=500)
+    ForecastSnapshots.objects.bulk_update(changed, FIELDS, batch_size=500)
+    ForecastSnapshots.objects.filter(planned_activity_id__end_date__lt=today).delete()
+    return result
+
@@ -0,0 +1,124 @@
+"""
+Suitability scores of activities over the forecast days of a location.
+
+Each activity gets the rule of the first keyword found in its name, e.g.
+kiting needs wind where climbing needs dry rock. A rule gives trapezoid
+ranges for the day temperature, the wind speed and the precipitation
+probability, scoring 1 inside the ideal range and falling to 0 at the
+limits. The scores of every activity and day are computed at once by
+broadcasting the rules against the days, then weighted by the air
+quality of the days the pollution forecast covers, more heavily for
+users with allergens.
+"""
+from datetime import date
+import numpy as np
+from .forecast import UNITS
+
+
+# (hard low, ideal low, ideal high, hard high) of temperature in Celsius,
+# wind speed in m/s and precipitation probability
+NO_MINIMUM = -100.0
+DEFAULT_RULE = ((0, 12, 26, 35), (NO_MINIMUM, 0, 8, 15), (NO_MINIMUM, 0, 0.3, 0.8))
+RULES = (
+    (("kite", "kiting", "windsurf"), ((5, 15, 30, 38), (4, 7, 12, 16), (NO_MINIMUM, 0, 0.3, 0.8))),
+    (("paraglid",), ((0, 12, 28, 35), (NO_MINIMUM, 0, 5, 8), (NO_MINIMUM, 0, 0.1, 0.4))),
+    (("climb",), ((2, 10, 24, 32), (NO_MINIMUM, 0, 8, 14), (NO_MINIMUM, 0, 0.1, 0.4))),
+    (("snowboard", "ski"), ((-20, -8, 2, 8), (NO_MINIMUM, 0, 8, 15), (NO_MINIMUM, 0, 0.5, 1.0))),
+    (("fish",), ((0, 10, 25, 35), (NO_MINIMUM, 0, 6, 12), (NO_MINIMUM, 0, 0.4, 0.9))),
+    (("cycl", "bik"), ((0, 12, 26, 35), (NO_MINIMUM, 0, 6, 12), (NO_MINIMUM, 0, 0.2, 0.7))),
+    (("hik", "walk", "trek"), ((-5, 8, 24, 34), (NO_MINIMUM, 0, 8, 15), (NO_MINIMUM, 0, 0.3, 0.8))),
+)
+# Score factor of the Openweathermap air quality index 1 to 5
+AIR_FACTORS = {
+    False: np.array([1.0, 1.0, 0.9, 0.7, 0.5]),
+    True: np.array([1.0, 0.85, 0.6, 0.3, 0.0]),
+}
+
+
+def rule_for(name):
+    """
+    Return the rule of an activity name.
+    """
+    name = name.casefold()
+    for keywords, rule in RULES:
+        if any(keyword in name for keyword in keywords):
+            return rule
+    return DEFAULT_RULE
+
+
+def day_conditions(forecast):
+    """
+    Return the (3, days) array of day temperature in Celsius, wind speed
+    and precipitation probability of a parsed forecast, NaN when unknown.
+    """
+    celsius = UNITS["metric"][0]
+
+    def value(day, name):
+        found = getattr(day, name)
+        return np.nan if found is None else found
+
+    conditions = np.array([[value(day, "temp_day") for day in forecast.days],
+                           [value(day, "wind_speed") for day in forecast.days],
+                           [value(day, "pop") for day in forecast.days]], dtype=np.float64)
+    conditions[0] = celsius(conditions[0])
+    return conditions.reshape(3, len(forecast.days))
+
+
+def score(forecast, aqi, activities, allergic):
+    """
+    Score every (activity, day) pair of a parsed forecast from 0 to 100.
+    aqi maps dates to the highest air quality index of the day and
+    activities is a list of (activity_id, activity_name).
+    Returns the days, the activity ids and names, and the scores array
+    with one row per activity.
+    """
+    days = [date.fromisoformat(day.date) for day in forecast.days]
+    rules = np.array([rule_for(name) for _, name in activities], dtype=np.float64).reshape(-1, 3, 4)
+    conditions = day_conditions(forecast)[None, :, :]
+
+    hard_low, ideal_low, ideal_high, hard_high = (rules[:, :, i, None] for i in range(4))
+    rise = (conditions - hard_low) / np.maximum(ideal_low - hard_low, 1e-9)
+    fall = (hard_high - conditions) / np.maximum(hard_high - ideal_high, 1e-9)
+    partial = np.clip(np.minimum(rise, fall), 0.0, 1.0)
+    partial = np.where(np.isnan(partial), 1.0, partial)
+
+    index = np.array([aqi.get(day) or np.nan for day in days], dtype=np.float64)
+    known = ~np.isnan(index)
+    air = np.ones(len(days))
+    air[known] = AIR_FACTORS[allergic][np.clip(np.rint(index[known]).astype(np.int64), 1, 5) - 1]
+
+    scores = np.rint(partial.prod(axis=1) * air[None, :] * 100).astype(np.int64)
+    return {
+        "days": days,
+        "activity_ids": np.array([activity_id for activity_id, _ in activities], dtype=np.int64),
+        "activity_names": [name for _, name in activities],
+        "scores": scores.reshape(len(activities), len(days)),
+    }
+
+
+def ranking(scored, activity_ids=None, limit=5):
+    """
+    Return the rows of the selected activities, all by default, and their
+    limit best (activity, day) pairs.
+    """
+    rows = np.arange(len(scored["activity_ids"]))
+    if activity_ids is not None:
+        rows = rows[np.isin(scored["activity_ids"], list(activity_ids))]
+    scores = scored["scores"][rows]
+    days = scored["days"]
+
+    flat = scores.ravel()
+    limit = min(limit, flat.size)
+    best = []
+    if limit:
+        top = np.argpartition(-flat, limit - 1)[:limit]
+        top = top[np.lexsort((top, -flat[top]))]
+        for position in top:
+            row, day = divmod(int(position), len(days))
+            best.append({"activity_id": int(scored["activity_ids"][rows[row]]),
+                         "date": days[day], "score": int(flat[position])})
+
+    activities = [{"activity_id": int(scored["activity_ids"][row]),
+                   "activity_name": scored["activity_names"][row],
+                   "scores": scores[i].tolist()} for i, row in enumerate(rows)]
+    return {"days": days, "activities": activities, "best": best}
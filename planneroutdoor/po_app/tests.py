@@ -1,7 +1,52 @@
-from django.urls import reverse
-from rest_framework import status
+import gzip
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+import brotli
+import requests
+from django.contrib.auth import hashers
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import HttpResponse
+from django.urls import resolve, reverse
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from drf_yasg.generators import OpenAPISchemaGenerator
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
 from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import Activities, Allergens, ForecastSnapshots, GeoLocations, PlannedActivities, RecurrenceRules
+from .models import UserActivities, UserAllergens
+from .weather_cache import forecast_cache, pollution_cache, quantize
+from .air_quality import aggregate
+from .authentication import user_cache
+from .forecast import FIELDS, Forecast, parse_projection, wind_direction
+from .geocoding import normalize_location, store_location
+from .hashing import password_pool
+from .metrics import MetricsMiddleware, metrics
+from .middleware import CompressionMiddleware
+from .renderers import ORJSONRenderer
+from .singleflight import SingleFlight, upstream_flight, upstream_key
+from .async_views import closes_async_client
+from .openweather import close_async_client, get_async_client, get_session, get_with_retries, retry_budget
+from .openweather import fetch_forecast, upstream_stats
+from .quota import CircuitOpen, QuotaExceeded, quota_guard
+from .catalog_cache import catalog_cache, get_version, user_namespace
+from .intervals import IntervalIndex, interval_indexes, planned_namespace
+from .recurrence import occurrences
+from .prewarm import prewarm_targets
+from .snapshots import refresh_snapshots
+from .suitability import ranking, score
 
 
 class UserAPITests(APITestCase):
@@ -66,3 +111,1388 @@ class UserAPITests(APITestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("message", response.data)
+
+
+class WeatherCacheTests(APITestCase):
+    """
+    Testing for forecast cache:
+        Coordinates snapped to the grid,
+        Invalid coordinates refused,
+        Nearby coordinates sharing one upstream call,
+        Stale entries served while refreshing,
+        Refresh refused by the quota logged without a traceback.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+
+    def test_quantize(self):
+        self.assertEqual(quantize("48.85661", 0.01), "48.8600")
+        self.assertEqual(quantize(-2.3522, 0.5), "-2.5000")
+
+    @patch("po_app.weather_cache.fetch_forecast")
+    def test_invalid_coordinates(self, fetch):
+        for lat, lon in (("inf", "2"), ("nan", "2"), ("500", "2"), ("48", "-180.5"), ("north", "2")):
+            response = self.client.get(reverse("weather-list"), {"lat": lat, "lon": lon})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Latitude must be a number between -90 and 90")
+        fetch.assert_not_called()
+
+    @patch("po_app.weather_cache.fetch_forecast", return_value={"list": []})
+    def test_nearby_coordinates_share_entry(self, fetch):
+        url = reverse("weather-list")
+        self.client.get(url, {"lat": "48.85661", "lon": "2.35222"})
+        response = self.client.get(url, {"lat": "48.8571", "lon": "2.3518"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(forecast_cache.stats()["hit"], 1)
+        self.assertEqual(forecast_cache.stats()["miss"], 1)
+
+    def test_stale_entry_served(self):
+        forecast_cache.set("key", "old")
+        with self.settings(WEATHER_CACHE={"TTL": 0}), \
+                patch.object(forecast_cache, "_refresh_in_background") as refresh:
+            self.assertEqual(forecast_cache.get("key", lambda: "new"), "old")
+        refresh.assert_called_once()
+        self.assertEqual(forecast_cache.stats()["stale"], 1)
+
+    def test_refresh_quota_exceeded(self):
+        def loader():
+            raise QuotaExceeded("Quota exceeded")
+
+        with self.assertLogs("po_app.weather_cache", "WARNING") as logs:
+            forecast_cache._refresh("key", loader)
+        self.assertEqual(logs.records[0].levelname, "WARNING")
+        self.assertIsNone(logs.records[0].exc_info)
+
+
+class GeoCodingTests(APITestCase):
+    """
+    Testing for geocoding table:
+        Normalized location names,
+        Repeated queries answered from the database,
+        Negative results cached,
+        Too long locations refused.
+    """
+
+    def test_normalize_location(self):
+        self.assertEqual(normalize_location("  Montréal   QC "), "montreal qc")
+
+    @patch("po_app.geocoding.fetch_geocoding", return_value=[{"name": "Zürich", "lat": 47.37, "lon": 8.54}])
+    def test_read_through(self, fetch):
+        url = reverse("geocode-list")
+        self.client.get(url, {"location": "Zürich"})
+        response = self.client.get(url, {"location": "zurich "})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"][0]["name"], "Zürich")
+        self.assertEqual(fetch.call_count, 1)
+
+    @patch("po_app.geocoding.fetch_geocoding", return_value=[])
+    def test_negative_cache(self, fetch):
+        url = reverse("geocode-list")
+        self.client.get(url, {"location": "Nowhere"})
+        response = self.client.get(url, {"location": "nowhere"})
+        self.assertEqual(response.data["error"], "Location not found")
+        self.assertEqual(fetch.call_count, 1)
+        self.assertTrue(GeoLocations.objects.filter(normalized_name="nowhere", results=[]).exists())
+
+    @patch("po_app.geocoding.fetch_geocoding")
+    def test_location_too_long(self, fetch):
+        response = self.client.get(reverse("geocode-list"), {"location": "x" * 251})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        fetch.assert_not_called()
+
+
+class SingleFlightTests(APITestCase):
+    """
+    Testing for upstream request coalescing:
+        Normalized keys ignoring the API key,
+        Concurrent identical calls sharing one fetch,
+        Cross-process lock outliving the upstream timeouts and retries.
+    """
+
+    def test_upstream_key(self):
+        self.assertEqual(upstream_key("u", {"lat": 1, "lon": 2, "appid": "a"}),
+                         upstream_key("u", {"lon": "2", "lat": "1", "appid": "b"}))
+
+    def test_concurrent_calls_coalesced(self):
+        flight = SingleFlight("test")
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"list": []}
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda _: flight.do("key", fetch), range(10)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result == {"list": []} for result in results))
+
+    @override_settings(OPENWEATHER_CLIENT={"CONNECT_TIMEOUT": 3, "READ_TIMEOUT": 10, "MAX_RETRIES": 2})
+    def test_lock_timeout(self):
+        with patch.object(upstream_flight, "_do_shared", return_value={}) as shared:
+            fetch_forecast(lat=1, lon=2)
+        self.assertGreater(shared.call_args.args[2], 3 * (3 + 10))
+
+
+class OpenWeatherClientTests(APITestCase):
+    """
+    Testing for the Openweather HTTP client:
+        Timeouts passed to the pooled session,
+        Retries on upstream errors,
+        Retries refused once the budget is spent.
+    """
+
+    def setUp(self):
+        upstream_stats.clear()
+        quota_guard.reset()
+
+    def fake_response(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = b"{}"
+        return response
+
+    @patch("po_app.openweather.time.sleep")
+    def test_retry_then_success(self, sleep):
+        session = get_session()
+        with patch.object(session, "get", side_effect=[self.fake_response(503), self.fake_response(200)]) as get, \
+                patch.object(retry_budget, "withdraw", return_value=True):
+            response = get_with_retries("forecast", "http://upstream", {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(get.call_args.kwargs["timeout"], (3.05, 10))
+        self.assertEqual(upstream_stats.snapshot()["forecast"]["retries"], 1)
+
+    def test_budget_exhausted(self):
+        session = get_session()
+        with patch.object(session, "get", side_effect=requests.exceptions.ConnectionError) as get, \
+                patch.object(retry_budget, "withdraw", return_value=False):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                get_with_retries("pollution", "http://upstream", {})
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(upstream_stats.snapshot()["pollution"]["errors"], 1)
+
+
+class AsyncWeatherTests(APITestCase):
+    """
+    Testing for async weather endpoints:
+        Forecast served through the shared cache,
+        Authentication required for pollution,
+        Upstream session closed after requests outside ASGI.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+
+    @patch("po_app.async_views.afetch_forecast", new_callable=AsyncMock, return_value={"list": []})
+    async def test_async_weather(self, fetch):
+        url = reverse("async-weather")
+        await self.async_client.get(url, {"lat": "48.85661", "lon": "2.35222"})
+        response = await self.async_client.get(url, {"lat": "48.8571", "lon": "2.3518"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"message": "", "data": {"list": []}})
+        self.assertEqual(fetch.await_count, 1)
+
+    async def test_async_pollution_requires_auth(self):
+        response = await self.async_client.get(reverse("async-weatherpollution"), {"lat": "1", "lon": "2"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_client_closed_outside_asgi(self):
+        sessions = []
+
+        @closes_async_client
+        async def view(request):
+            sessions.append(get_async_client())
+            return HttpResponse()
+
+        await view(RequestFactory().get("/"))
+        await view(AsyncRequestFactory().get("/"))
+        self.assertEqual([session.closed for session in sessions], [True, False])
+        await close_async_client()
+
+
+class WeatherDayDetailsTests(APITestCase):
+    """
+    Testing for combined day details:
+        Forecast and pollution merged for the requested day,
+        Authentication required.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+        pollution_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="testuser",
+            password="Test>012",
+            email="testuser@maildrop.cc",
+            address="toronto")
+
+    @patch("po_app.weather_cache.fetch_pollution", return_value={"list": [
+        {"dt": 86400 * 10 + 3600, "components": {"co": 1}},
+        {"dt": 86400 * 11, "components": {"co": 2}}]})
+    @patch("po_app.weather_cache.fetch_forecast", return_value={"city": {"name": "Paris"}, "list": [
+        {"dt": 86400 * 10 + 43200}, {"dt": 86400 * 11 + 43200}]})
+    def test_day_details(self, fetch_forecast, fetch_pollution):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("weatherdaydetails-list"),
+                                   {"lat": "48.85", "lon": "2.35", "day": 86400 * 11 + 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual(data["forecast"]["dt"], 86400 * 11 + 43200)
+        self.assertEqual([entry["components"]["co"] for entry in data["pollution"]], [2])
+
+    def test_day_details_requires_auth(self):
+        response = self.client.get(reverse("weatherdaydetails-list"), {"lat": "1", "lon": "2"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CompactForecastTests(APITestCase):
+    """
+    Testing for compact forecast representation:
+        Wind directions,
+        Field, unit and day projection,
+        Parsed forecast cached with its entry,
+        Fields deduplicated in FIELDS order,
+        Invalid projection rejected.
+    """
+
+    payload = {"city": {"name": "Paris", "country": "FR", "timezone": 7200}, "list": [
+        {"dt": 1729080000, "sunrise": 1729058400, "sunset": 1729098000,
+         "temp": {"min": 283.15, "max": 293.15}, "speed": 10.0, "deg": 40,
+         "weather": [{"description": "light rain", "icon": "10d"}]},
+        {"dt": 1729166400, "temp": {"min": 273.15, "max": 278.15}, "speed": 2.0, "deg": 350}]}
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+
+    def test_wind_direction(self):
+        self.assertEqual(wind_direction(0), "N")
+        self.assertEqual(wind_direction(40), "NE")
+        self.assertEqual(wind_direction(348.75), "N")
+        self.assertEqual(wind_direction(200), "SSW")
+
+    def test_projection(self):
+        with patch("po_app.weather_cache.fetch_forecast", return_value=self.payload):
+            response = self.client.get(reverse("weather-list"), {
+                "lat": "48.85", "lon": "2.35", "fields": "date,temp_max,wind_speed,wind_direction,sunrise",
+                "units": "imperial", "days": "1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["days"], [
+            {"date": "2024-10-16", "temp_max": 68.0, "wind_speed": 22.4, "wind_direction": "NE", "sunrise": "08:00"}])
+
+    @patch("po_app.views.Forecast", wraps=Forecast)
+    def test_parsed_once_per_entry(self, parse):
+        with patch("po_app.weather_cache.fetch_forecast", return_value=self.payload):
+            for units in ("metric", "imperial", "metric"):
+                self.client.get(reverse("weather-list"), {"lat": "48.85", "lon": "2.35", "units": units})
+        self.assertEqual(parse.call_count, 1)
+
+    def test_fields_normalized(self):
+        fields = parse_projection({"fields": "temp_max, date,temp_max"})[0]
+        self.assertEqual(fields, parse_projection({"fields": "date,temp_max"})[0])
+        self.assertEqual(fields, tuple(field for field in FIELDS if field in ("date", "temp_max")))
+
+    def test_invalid_projection(self):
+        response = self.client.get(reverse("weather-list"), {"lat": "48.85", "lon": "2.35", "fields": "colour"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AirQualityTests(APITestCase):
+    """
+    Testing for air quality aggregation:
+        Daily min, mean and max per component,
+        Category levels with the client thresholds,
+        Aggregated mode cached with the upstream payload.
+    """
+
+    payload = {"coord": {"lat": 48.85, "lon": 2.35}, "list": [
+        {"dt": 86400 + 3600, "main": {"aqi": 1}, "components": {"co": 40, "no": 0, "no2": 10, "pm2_5": 5, "pm10": 5, "so2": 100, "nh3": 30}},
+        {"dt": 86400 + 7200, "main": {"aqi": 3}, "components": {"co": 60, "no": 0, "no2": 30, "pm2_5": 15, "pm10": 15, "so2": 300, "nh3": 50}},
+        {"dt": 2 * 86400, "main": {"aqi": 2}, "components": {"co": 900, "no": 900, "no2": 900, "pm2_5": 900, "pm10": 900, "so2": 900, "nh3": 900}}]}
+
+    def setUp(self):
+        cache.clear()
+        pollution_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="testuser",
+            password="Test>012",
+            email="testuser@maildrop.cc",
+            address="toronto")
+
+    def test_aggregate(self):
+        days = aggregate(self.payload)["days"]
+        self.assertEqual([day["dt"] for day in days], [86400, 2 * 86400])
+        self.assertEqual(days[0]["components"]["co"], {"min": 40.0, "mean": 50.0, "max": 60.0})
+        self.assertEqual(days[0]["aqi"]["mean"], 2.0)
+        self.assertEqual(days[0]["levels"], {"vehicle": "Good", "industrial": "Moderate", "agricultural": "Good"})
+        self.assertEqual(days[1]["levels"]["vehicle"], "Very Unhealthy")
+
+    def test_aggregated_mode_cached(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse("weatherpollution-list")
+        with patch("po_app.weather_cache.fetch_pollution", return_value=self.payload) as fetch, \
+                patch("po_app.views.aggregate", wraps=aggregate) as reduce:
+            for _ in range(2):
+                response = self.client.get(url, {"lat": "48.85", "lon": "2.35", "mode": "aggregated"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["data"]["days"]), 2)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(reduce.call_count, 1)
+
+
+class QuotaGuardTests(APITestCase):
+    """
+    Testing for the Openweathermap quota guard:
+        Calls refused once the per minute budget is spent,
+        Budget split between processes without a shared cache,
+        Circuit breaker opening after consecutive failures,
+        Expired cache entries served while upstream is refused,
+        Service unavailable answer without cached data.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+        quota_guard.reset()
+
+    def test_budget_exhausted(self):
+        with self.settings(OPENWEATHER_QUOTA={"CALLS_PER_MINUTE": 2}):
+            quota_guard.before_call()
+            quota_guard.before_call()
+            with self.assertRaises(QuotaExceeded):
+                quota_guard.before_call()
+        state = quota_guard.state()
+        self.assertEqual(state["counters"]["allowed"], 2)
+        self.assertEqual(state["counters"]["rejected_quota"], 1)
+
+    def test_budget_per_process(self):
+        with self.settings(OPENWEATHER_QUOTA={"CALLS_PER_MINUTE": 60, "WORKERS": 4}):
+            self.assertEqual(quota_guard.state()["budget"]["calls_per_minute"], 15)
+            with patch("po_app.quota.is_shared", return_value=True):
+                self.assertEqual(quota_guard.state()["budget"]["calls_per_minute"], 60)
+
+    def test_breaker_opens(self):
+        session = get_session()
+        with self.settings(OPENWEATHER_QUOTA={"FAILURE_THRESHOLD": 2}), \
+                patch.object(session, "get", side_effect=requests.exceptions.ConnectionError) as get, \
+                patch.object(retry_budget, "withdraw", return_value=False):
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    get_with_retries("forecast", "http://upstream", {})
+            with self.assertRaises(CircuitOpen):
+                get_with_retries("forecast", "http://upstream", {})
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(quota_guard.state()["breaker"]["state"], "open")
+
+    def test_fallback_to_expired_entry(self):
+        forecast_cache.set("key", "old")
+
+        def refused():
+            raise CircuitOpen()
+
+        with self.settings(WEATHER_CACHE={"TTL": 0, "STALE_TTL": 0}):
+            self.assertEqual(forecast_cache.get("key", refused), "old")
+        self.assertEqual(forecast_cache.stats()["fallback"], 1)
+
+    @patch("po_app.weather_cache.fetch_forecast", side_effect=CircuitOpen())
+    def test_unavailable_without_cache(self, fetch):
+        response = self.client.get(reverse("weather-list"), {"lat": "1", "lon": "2"})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class PrewarmTests(APITestCase):
+    """
+    Testing for the forecast pre-warmer:
+        Locations of upcoming activities deduplicated,
+        Activities beyond the forecast window ignored,
+        Fresh entries not fetched again,
+        Locations failing to geocode logged and skipped,
+        Refused without a shared cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+        pollution_cache.clear()
+        quota_guard.reset()
+        user = get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        hiking = Activities.objects.create(activity_name="Hiking", activity_desc="Walk")
+        biking = Activities.objects.create(activity_name="Biking", activity_desc="Ride")
+        today = date.today()
+        for activity, location, start in ((hiking, "Paris", 2), (biking, " paris ", 10),
+                                          (hiking, "Lyon", 30)):
+            PlannedActivities.objects.create(
+                user_id=user, activity_id=activity, location=location,
+                start_date=today + timedelta(days=start),
+                end_date=today + timedelta(days=start + 1))
+        store_location("Paris", [{"name": "Paris", "lat": 48.8566, "lon": 2.3522}])
+
+    def test_local_cache_refused(self):
+        with self.assertRaises(CommandError):
+            call_command("prewarm_forecasts", stdout=StringIO())
+
+    @patch("po_app.management.commands.prewarm_forecasts.is_shared", return_value=True)
+    @patch("po_app.weather_cache.fetch_pollution", return_value={"list": []})
+    @patch("po_app.weather_cache.fetch_forecast", return_value={"list": []})
+    def test_prewarm(self, fetch_forecast, fetch_pollution, shared):
+        out = StringIO()
+        call_command("prewarm_forecasts", stdout=out)
+        self.assertIn("1 locations, 1 targets: 2 refreshed", out.getvalue())
+        fetch_forecast.assert_called_once_with(lat="48.8600", lon="2.3500")
+        self.assertEqual(fetch_pollution.call_count, 1)
+
+        call_command("prewarm_forecasts", stdout=out)
+        self.assertEqual(fetch_forecast.call_count, 1)
+        response = self.client.get(reverse("weather-list"), {"lat": "48.8566", "lon": "2.3522"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(forecast_cache.stats()["hit"], 1)
+
+    @patch("po_app.prewarm.geocode", side_effect=[CircuitOpen(), [{"lat": 45.76, "lon": 4.84}]])
+    def test_geocoding_failure(self, geocode):
+        with self.assertLogs("po_app.prewarm", "WARNING"):
+            targets = prewarm_targets({"paris": ("Paris", True), "lyon": ("Lyon", False)})
+        self.assertEqual(targets, {"45.7600,4.8400": False})
+
+
+class UserPreferencesSetTests(APITestCase):
+    """
+    Testing for bulk preference replacement:
+        Activities difference applied in one request,
+        Allergens cleared with an empty set, cached profile dropped,
+        Unknown ids rejected,
+        Authentication required.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        self.activities = [Activities.objects.create(activity_name=f"Activity {i}", activity_desc=f"Desc {i}")
+                           for i in range(3)]
+        allergen = Allergens.objects.create(allergen_name="Pollen", allergen_desc="Pollen desc")
+        UserActivities.objects.create(user_id=self.user, activity_id=self.activities[0])
+        UserActivities.objects.create(user_id=self.user, activity_id=self.activities[1])
+        UserAllergens.objects.create(user_id=self.user, allergen_id=allergen)
+        self.client.force_authenticate(self.user)
+
+    def test_set_user_activities(self):
+        ids = [self.activities[1].activity_id, self.activities[2].activity_id]
+        with self.assertNumQueries(7):
+            response = self.client.put(reverse("useractivities-set-user-activities"),
+                                       {"activity_ids": ids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"], {"added": [ids[1]], "removed": [self.activities[0].activity_id]})
+        self.assertEqual(sorted(UserActivities.objects.filter(user_id=self.user).values_list("activity_id", flat=True)), ids)
+
+    def test_clear_user_allergens(self):
+        version = get_version(user_namespace(self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse("userallergens-set-user-allergens"), {"allergen_ids": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(UserAllergens.objects.filter(user_id=self.user).exists())
+        self.assertNotEqual(get_version(user_namespace(self.user.pk)), version)
+
+    def test_unknown_id(self):
+        response = self.client.put(reverse("useractivities-set-user-activities"), {"activity_ids": [999]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UserActivities.objects.filter(user_id=self.user).count(), 2)
+
+    def test_requires_auth(self):
+        self.client.force_authenticate(None)
+        response = self.client.put(reverse("useractivities-set-user-activities"), {"activity_ids": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CatalogCacheTests(APITestCase):
+    """
+    Testing for the activities and allergens catalog cache:
+        Repeated reads served without queries,
+        If-None-Match answered with 304,
+        Cache invalidated by model changes,
+        Rebuilt after LOCAL_CACHE_TTL without a shared cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Activities.objects.create(activity_name="Hiking", activity_desc="Walk")
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto"))
+
+    def test_cached_catalog(self):
+        url = reverse("activities-list")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertEqual(len(response.data), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+            self.assertEqual(response["ETag"], etag)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalidated_on_save(self):
+        url = reverse("activities-list")
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Activities.objects.create(activity_name="Biking", activity_desc="Ride")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_local_ttl(self):
+        url = reverse("activities-list")
+        self.client.get(url)
+        with override_settings(LOCAL_CACHE_TTL=0), self.assertNumQueries(1):
+            self.client.get(url)
+        with override_settings(LOCAL_CACHE_TTL=0), \
+                patch("po_app.catalog_cache.is_shared", return_value=True), self.assertNumQueries(0):
+            self.client.get(url)
+
+
+class UserCacheTests(APITestCase):
+    """
+    Testing for the per-user response cache:
+        Unchanged user reads served without queries,
+        Single and bulk writes visible on the next read,
+        Account update visible on the next read,
+        Old entries unreachable after the version is evicted.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        self.activities = [Activities.objects.create(activity_name=f"Activity {i}", activity_desc=f"Desc {i}")
+                           for i in range(2)]
+        self.client.force_authenticate(self.user)
+
+    def get_activities(self):
+        return self.client.get(reverse("useractivities-get-user-activities")).data["data"]
+
+    def test_cached_until_write(self):
+        self.assertEqual(self.get_activities(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_activities(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            UserActivities.objects.create(user_id=self.user, activity_id=self.activities[0])
+        self.assertEqual(len(self.get_activities()), 1)
+
+    def test_bulk_write(self):
+        self.get_activities()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse("useractivities-set-user-activities"),
+                            {"activity_ids": [a.activity_id for a in self.activities]}, format="json")
+        self.assertEqual(len(self.get_activities()), 2)
+
+    def test_account_update(self):
+        url = reverse("users-account")
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {"address": "montreal"}, format="json")
+        self.assertEqual(self.client.get(url).data["data"]["address"], "montreal")
+
+    def test_version_evicted(self):
+        self.assertEqual(self.get_activities(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            UserActivities.objects.create(user_id=self.user, activity_id=self.activities[0])
+        cache.delete(f"po_app:version:{user_namespace(self.user.pk)}")
+        self.assertEqual(len(self.get_activities()), 1)
+
+
+class FlatSerializerTests(APITestCase):
+    """
+    Testing for the flat representation:
+        Ids and row url matching the hyperlinked representation,
+        Flat user activities.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_superuser(
+            username="admin", password="Test>012",
+            email="admin@maildrop.cc", address="toronto")
+        activity = Activities.objects.create(activity_name="Hiking", activity_desc="Walk")
+        UserActivities.objects.create(user_id=self.user, activity_id=activity)
+        PlannedActivities.objects.create(user_id=self.user, activity_id=activity, location="Paris",
+                                         start_date=date(2024, 10, 16), end_date=date(2024, 10, 17))
+        self.client.force_authenticate(self.user)
+
+    def test_planned_activities_flat(self):
+        url = reverse("plannedactivities-list")
+        hyperlinked = self.client.get(url).data[0]
+        flat = self.client.get(url, {"shape": "flat"}).data[0]
+        self.assertEqual(flat["url"], hyperlinked["url"])
+        self.assertEqual(flat["user_id"], self.user.id)
+        self.assertEqual(str(flat["start_date"]), hyperlinked["start_date"])
+
+    def test_user_activities_flat(self):
+        response = self.client.get(reverse("useractivities-get-user-activities"), {"shape": "flat"})
+        row = response.data["data"][0]
+        self.assertEqual(row["user_id"], self.user.id)
+        self.assertTrue(row["url"].endswith(f"/po_app/UserActivities/{row['user_activity_id']}/"))
+
+
+class RenderingTests(APITestCase):
+    """
+    Testing for weather payload rendering:
+        Cached payload encoded once,
+        Brotli and gzip negotiated on Accept-Encoding,
+        Brotli only for public responses, q=0 refused,
+        Same output as the DRF JSON renderer.
+    """
+    payload = {"list": [{"dt": 1729080000 + i * 86400, "temp": {"day": 285.0}} for i in range(30)]}
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+
+    @patch("po_app.weather_cache.fetch_forecast")
+    def test_encoded_once(self, fetch):
+        fetch.return_value = self.payload
+        url = reverse("weather-list")
+        with patch("po_app.views.encode", wraps=json.dumps) as encode:
+            for _ in range(3):
+                response = self.client.get(url, {"lat": "1", "lon": "2"})
+        self.assertEqual(encode.call_count, 1)
+        self.assertEqual(response.json(), {"message": "", "data": self.payload})
+
+    @patch("po_app.weather_cache.fetch_forecast")
+    def test_compression(self, fetch):
+        fetch.return_value = self.payload
+        url = reverse("weather-list")
+        response = self.client.get(url, {"lat": "1", "lon": "2"}, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(json.loads(brotli.decompress(response.content))["data"], self.payload)
+        response = self.client.get(url, {"lat": "1", "lon": "2"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content))["data"], self.payload)
+        response = self.client.get(url, {"lat": "1", "lon": "2"}, HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_brotli_public_only(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        body = json.dumps(self.payload).encode()
+        for cache_control, accept, encoding in [
+            ("public, max-age=60", "gzip, br", "br"),
+            ("private", "gzip, br", "gzip"),
+            ("private", "br", None),
+            ("public", "br;q=0, gzip;q=0.5", "gzip"),
+            ("public", "*;q=0", None),
+        ]:
+            request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept)
+            response = HttpResponse(body, content_type="application/json")
+            response["Cache-Control"] = cache_control
+            response = middleware.process_response(request, response)
+            self.assertEqual(response.get("Content-Encoding"), encoding, (cache_control, accept))
+
+    def test_matches_drf(self):
+        class Serializer(serializers.Serializer):
+            at = serializers.DateTimeField()
+            price = serializers.DecimalField(max_digits=6, decimal_places=2)
+
+        at = datetime(2024, 10, 16, 12, 30, 5, 123456, tzinfo=dt_timezone.utc)
+        data = {
+            "serialized": Serializer({"at": at, "price": Decimal("12.50")}).data,
+            "raw": [at, at.replace(microsecond=0), at.replace(tzinfo=None), at.date(),
+                    at.astimezone(dt_timezone(timedelta(hours=-4))), Decimal("12.50")],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class CalendarTests(APITestCase):
+    """
+    Testing for the planned activities calendar:
+        Only the user activities overlapping the window,
+        Keyset pagination,
+        Invalid window rejected.
+    """
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        other = User.objects.create_user(
+            username="other", password="Test>012",
+            email="other@maildrop.cc", address="montreal")
+        activity = Activities.objects.create(activity_name="Hiking", activity_desc="Walk")
+        for user, start, end in ((self.user, 1, 2), (self.user, 10, 20), (self.user, 28, 31),
+                                 (self.user, 40, 41), (other, 10, 12)):
+            PlannedActivities.objects.create(user_id=user, activity_id=activity, location="Paris",
+                                             start_date=date(2024, 9, 1) + timedelta(days=start),
+                                             end_date=date(2024, 9, 1) + timedelta(days=end))
+        self.client.force_authenticate(self.user)
+        self.url = reverse("plannedactivities-calendar")
+
+    def test_window(self):
+        response = self.client.get(self.url, {"from": "2024-09-15", "to": "2024-09-30", "shape": "flat"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        starts = [str(row["start_date"]) for row in response.data["data"]["results"]]
+        self.assertEqual(starts, ["2024-09-11", "2024-09-29"])
+
+    def test_pagination(self):
+        params = {"from": "2024-09-01", "to": "2024-10-31", "page_size": 2}
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, params)
+        data = response.data["data"]
+        self.assertEqual(len(data["results"]), 2)
+        response = self.client.get(data["next"])
+        self.assertEqual([row["start_date"] for row in response.data["data"]["results"]],
+                         ["2024-09-29", "2024-10-11"])
+        self.assertIsNone(response.data["data"]["next"])
+
+    def test_invalid_window(self):
+        response = self.client.get(self.url, {"from": "2024-09-30", "to": "2024-09-01"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"from": "tomorrow"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PlanningConflictTests(APITestCase):
+    """
+    Testing for the planned activities interval index:
+        Overlap and free windows lookups,
+        Overlapping create and update rejected,
+        All or nothing bulk import,
+        Index refreshed after writes outside the viewset,
+        Writers checking rows the cached index missed,
+        Cached index reused by writers, version bumped on commit.
+    """
+
+    def setUp(self):
+        cache.clear()
+        interval_indexes.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        self.activity = Activities.objects.create(activity_name="Hiking", activity_desc="Walk")
+        self.today = date.today()
+        self.planned = self.plan(2, 4)
+        self.client.force_authenticate(self.user)
+
+    def plan(self, start, end):
+        return PlannedActivities.objects.create(
+            user_id=self.user, activity_id=self.activity, location="Paris",
+            start_date=self.today + timedelta(days=start), end_date=self.today + timedelta(days=end))
+
+    def payload(self, start, end):
+        return {"user_id": reverse("users-detail", args=[self.user.id]),
+                "activity_id": reverse("activities-detail", args=[self.activity.activity_id]),
+                "location": "Paris",
+                "start_date": str(self.today + timedelta(days=start)),
+                "end_date": str(self.today + timedelta(days=end))}
+
+    def test_index(self):
+        day = date(2024, 9, 1)
+        index = IntervalIndex([(1, day, day + timedelta(days=2)),
+                               (2, day + timedelta(days=5), day + timedelta(days=6))])
+        self.assertEqual(index.conflicts(day + timedelta(days=2), day + timedelta(days=5)), [2, 1])
+        self.assertEqual(index.conflicts(day + timedelta(days=3), day + timedelta(days=4)), [])
+        self.assertEqual(index.conflicts(day, day, exclude=1), [])
+        self.assertEqual(index.free_windows(day + timedelta(days=1), day + timedelta(days=9)),
+                         [(day + timedelta(days=3), day + timedelta(days=4)),
+                          (day + timedelta(days=7), day + timedelta(days=9))])
+        index.remove(2)
+        index.add(3, day + timedelta(days=3), day + timedelta(days=3))
+        self.assertEqual(index.conflicts(day + timedelta(days=3), day + timedelta(days=9)), [3])
+
+    def test_create_conflict(self):
+        url = reverse("plannedactivities-list")
+        response = self.client.post(url, self.payload(4, 6), format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["conflicts"], [self.planned.planned_activity_id])
+        response = self.client.post(url, self.payload(5, 6), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, self.payload(6, 7), format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_stale_index(self):
+        url = reverse("plannedactivities-list")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url, self.payload(5, 6), format="json").status_code,
+                             status.HTTP_201_CREATED)
+        missed = PlannedActivities.objects.bulk_create([PlannedActivities(
+            user_id=self.user, activity_id=self.activity, location="Paris",
+            start_date=self.today + timedelta(days=8), end_date=self.today + timedelta(days=9))])[0]
+        response = self.client.post(url, self.payload(9, 10), format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["conflicts"], [missed.planned_activity_id])
+
+    def test_cached_index(self):
+        url = reverse("plannedactivities-list")
+        namespace = planned_namespace(self.user.pk)
+        interval_indexes.get(self.user.pk)
+        version = get_version(namespace)
+        with patch.object(interval_indexes, "_load") as load:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertEqual(self.client.post(url, self.payload(5, 6), format="json").status_code,
+                                 status.HTTP_201_CREATED)
+            self.assertEqual(get_version(namespace), version)
+            for callback in callbacks:
+                callback()
+            self.assertEqual(get_version(namespace), version + 1)
+            self.assertEqual(len(interval_indexes.get(self.user.pk)), 2)
+            load.assert_not_called()
+
+    def test_update(self):
+        url = reverse("plannedactivities-detail", args=[self.planned.planned_activity_id])
+        other = self.plan(8, 9)
+        response = self.client.patch(url, {"end_date": str(self.today + timedelta(days=5))}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.patch(url, {"end_date": str(self.today + timedelta(days=8))}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["conflicts"], [other.planned_activity_id])
+
+    def test_bulk_import(self):
+        url = reverse("plannedactivities-bulk-import")
+        items = [{key: value for key, value in self.payload(start, end).items() if key != "user_id"}
+                 for start, end in ((6, 7), (0, 1), (3, 3))]
+        for item in items:
+            item["activity_id"] = self.activity.activity_id
+        response = self.client.post(url, items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["conflicts"], {2: [self.planned.planned_activity_id]})
+        self.assertEqual(PlannedActivities.objects.count(), 1)
+
+        response = self.client.post(url, items[:1] + items[:2], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, items[:2], format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PlannedActivities.objects.filter(user_id=self.user).count(), 3)
+
+    def test_free_windows(self):
+        url = reverse("plannedactivities-free-windows")
+        response = self.client.get(url, {"days": 8})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([window["days"] for window in response.data["data"]], [2, 3])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan(5, 6)
+        response = self.client.get(url, {"days": 8})
+        self.assertEqual([window["days"] for window in response.data["data"]], [2, 1])
+        response = self.client.get(url, {"days": 17})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecurrenceTests(APITestCase):
+    """
+    Testing for recurrence rules:
+        Lazy expansion over a window,
+        Materialization within the forecast window on create,
+        Overlapping occurrences rejected,
+        Materialization command,
+        Past occurrences kept when a rule is deleted.
+    """
+
+    def setUp(self):
+        cache.clear()
+        interval_indexes.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        self.activity = Activities.objects.create(activity_name="Hiking", activity_desc="Walk")
+        self.today = date.today()
+        self.client.force_authenticate(self.user)
+
+    def rule(self, **kwargs):
+        values = {"user_id": self.user, "activity_id": self.activity, "location": "Paris",
+                  "start_date": self.today, "end_date": self.today + timedelta(days=1),
+                  "frequency": RecurrenceRules.WEEKLY}
+        values.update(kwargs)
+        return RecurrenceRules.objects.create(**values)
+
+    def payload(self, start):
+        return {"user_id": reverse("users-detail", args=[self.user.id]),
+                "activity_id": reverse("activities-detail", args=[self.activity.activity_id]),
+                "location": "Paris", "frequency": "weekly",
+                "start_date": str(self.today + timedelta(days=start)),
+                "end_date": str(self.today + timedelta(days=start + 1))}
+
+    def test_expansion(self):
+        rule = RecurrenceRules(start_date=date(2024, 1, 1), end_date=date(2024, 1, 2),
+                               frequency=RecurrenceRules.WEEKLY, interval=2)
+        starts = [first for first, _ in occurrences(rule, date(2024, 3, 1), date(2024, 3, 31))]
+        self.assertEqual(starts, [date(2024, 3, 11), date(2024, 3, 25)])
+        self.assertEqual(next(occurrences(rule, date(2024, 1, 16))), (date(2024, 1, 15), date(2024, 1, 16)))
+
+        rule = RecurrenceRules(start_date=date(2024, 1, 31), end_date=date(2024, 1, 31),
+                               frequency=RecurrenceRules.MONTHLY, interval=1, count=3)
+        self.assertEqual([first for first, _ in occurrences(rule, date(2024, 2, 1))],
+                         [date(2024, 2, 29), date(2024, 3, 31)])
+        rule.until = date(2024, 3, 1)
+        self.assertEqual(len(list(occurrences(rule))), 2)
+
+    def test_create(self):
+        response = self.client.post(reverse("recurrencerules-list"), self.payload(0), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        starts = PlannedActivities.objects.filter(rule_id=response.data["rule_id"]).values_list("start_date", flat=True)
+        self.assertEqual(sorted(starts), [self.today + timedelta(days=days) for days in (0, 7, 14)])
+
+        response = self.client.post(reverse("recurrencerules-list"), self.payload(8), format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(RecurrenceRules.objects.count(), 1)
+
+    def test_occurrences(self):
+        self.rule()
+        self.rule(start_date=self.today + timedelta(days=3), end_date=self.today + timedelta(days=3),
+                  frequency=RecurrenceRules.MONTHLY)
+        response = self.client.get(reverse("recurrencerules-occurrences"),
+                                   {"from": str(self.today), "to": str(self.today + timedelta(days=365))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        starts = [row["start_date"] for row in response.data["data"]]
+        self.assertEqual(len(starts), 53 + 12)
+        self.assertEqual(starts, sorted(starts))
+        response = self.client.get(reverse("recurrencerules-occurrences"),
+                                   {"from": str(self.today), "to": str(self.today + timedelta(days=400))})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_materialize_command(self):
+        self.rule(frequency=RecurrenceRules.DAILY, end_date=self.today)
+        PlannedActivities.objects.create(user_id=self.user, activity_id=self.activity, location="Lyon",
+                                         start_date=self.today + timedelta(days=2),
+                                         end_date=self.today + timedelta(days=2))
+        out = StringIO()
+        call_command("materialize_recurrences", "--days", "5", "--batch-size", "2", stdout=out)
+        self.assertIn("4 occurrences created, 1 overlapping skipped", out.getvalue())
+        call_command("materialize_recurrences", "--days", "5", stdout=out)
+        self.assertIn("0 users", out.getvalue())
+        self.assertEqual(PlannedActivities.objects.count(), 5)
+
+    def test_destroy(self):
+        response = self.client.post(reverse("recurrencerules-list"), self.payload(0), format="json")
+        rule = RecurrenceRules.objects.get(pk=response.data["rule_id"])
+        past = PlannedActivities.objects.create(user_id=self.user, activity_id=self.activity, location="Paris",
+                                                start_date=self.today - timedelta(days=7),
+                                                end_date=self.today - timedelta(days=6), rule_id=rule)
+        response = self.client.delete(reverse("recurrencerules-detail", args=[rule.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(PlannedActivities.objects.values_list("pk", "rule_id")), [(past.pk, None)])
+
+
+class ForecastSnapshotTests(APITestCase):
+    """
+    Testing for the forecast snapshots of planned activities:
+        Summary of the activity forecast days,
+        Snapshots rewritten only when the cached forecast changed,
+        Activities with weather read in a single query,
+        Geocoding failures logged and skipped.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+        pollution_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        activity = Activities.objects.create(activity_name="Hiking", activity_desc="Walk")
+        self.today = date.today()
+        for location, start in (("Paris", 1), ("Lyon", 3)):
+            PlannedActivities.objects.create(
+                user_id=self.user, activity_id=activity, location=location,
+                start_date=self.today + timedelta(days=start),
+                end_date=self.today + timedelta(days=start + 1))
+        store_location("Paris", [{"name": "Paris", "lat": 48.8566, "lon": 2.3522}])
+        store_location("Lyon", [])
+        self.key = "48.8600,2.3500"
+        self.noon = (self.today - date(1970, 1, 1)).days * 86400 + 43200
+
+    def forecast(self, max_temp):
+        return {"city": {"timezone": 0}, "list": [
+            {"dt": self.noon + day * 86400, "temp": {"min": 280.15 + day, "max": max_temp + day},
+             "pop": day / 10, "speed": 2.0 + day % 2, "deg": 90}
+            for day in range(16)]}
+
+    def test_refresh(self):
+        forecast_cache.set(self.key, self.forecast(290.15))
+        pollution_cache.set(self.key, {"list": [
+            {"dt": self.noon + 86400, "main": {"aqi": 3}, "components": {}},
+            {"dt": self.noon + 2 * 86400, "main": {"aqi": 2}, "components": {}}]})
+        self.assertEqual(refresh_snapshots(), {"updated": 1, "unchanged": 0, "missing": 1})
+        snapshot = ForecastSnapshots.objects.get()
+        self.assertEqual((snapshot.temp_min, snapshot.temp_max), (8.0, 19.0))
+        self.assertEqual((snapshot.pop, snapshot.wind_speed, snapshot.wind_direction), (0.2, 3.0, "E"))
+        self.assertEqual(snapshot.air_quality, "Moderate")
+
+        self.assertEqual(refresh_snapshots(), {"updated": 0, "unchanged": 1, "missing": 1})
+        forecast_cache.set(self.key, self.forecast(295.15))
+        self.assertEqual(refresh_snapshots()["updated"], 1)
+        self.assertEqual(ForecastSnapshots.objects.get().temp_max, 24.0)
+
+    def test_weather(self):
+        forecast_cache.set(self.key, self.forecast(290.15))
+        refresh_snapshots()
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("plannedactivities-weather"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        paris, lyon = response.data["data"]
+        self.assertEqual(paris["forecast"]["temp_max"], 19.0)
+        self.assertEqual(paris["forecast"]["air_quality"], "")
+        self.assertIsNone(lyon["forecast"])
+
+    @patch("po_app.snapshots.geocode", side_effect=requests.exceptions.ConnectionError("down"))
+    def test_geocoding_failure(self, geocode):
+        with self.assertLogs("po_app.snapshots", "WARNING"):
+            self.assertEqual(refresh_snapshots(), {"updated": 0, "unchanged": 0, "missing": 2})
+
+
+class SuitabilityTests(APITestCase):
+    """
+    Testing for the activity suitability scores:
+        Per activity rules, kiting needs wind, climbing needs dry days,
+        Air quality weighs more for users with allergens,
+        Ranking cached with the forecast entry.
+    """
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        forecast_cache.clear()
+        pollution_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        self.kiting = Activities.objects.create(activity_name="Kitesurfing", activity_desc="Kite")
+        self.climbing = Activities.objects.create(activity_name="Rock climbing", activity_desc="Climb")
+        UserActivities.objects.create(user_id=self.user, activity_id=self.kiting)
+        UserActivities.objects.create(user_id=self.user, activity_id=self.climbing)
+        self.client.force_authenticate(self.user)
+
+    def forecast(self):
+        # day 0 windy and dry, day 1 calm and dry, day 2 calm and rainy
+        return Forecast({"city": {"timezone": 0}, "list": [
+            {"dt": 1729080000 + day * 86400, "temp": {"day": 293.15}, "speed": speed, "pop": pop}
+            for day, (speed, pop) in enumerate(((7.5, 0.0), (1.0, 0.0), (1.0, 0.9)))]})
+
+    def test_score(self):
+        activities = [(self.kiting.activity_id, "Kitesurfing"), (self.climbing.activity_id, "Rock climbing")]
+        scored = score(self.forecast(), {}, activities, False)
+        self.assertEqual(scored["scores"].tolist(), [[100, 0, 0], [100, 100, 0]])
+
+        days = [date(2024, 10, 16), date(2024, 10, 17)]
+        allergic = score(self.forecast(), {days[0]: 4}, activities, True)
+        self.assertEqual(allergic["scores"][:, 0].tolist(), [30, 30])
+        self.assertEqual(score(self.forecast(), {days[0]: 4}, activities, False)["scores"][0, 0], 70)
+
+        best = ranking(scored, limit=2)["best"]
+        self.assertEqual([(row["activity_id"], row["score"]) for row in best],
+                         [(self.kiting.activity_id, 100), (self.climbing.activity_id, 100)])
+
+    @patch("po_app.weather_cache.fetch_pollution", side_effect=requests.exceptions.ConnectionError)
+    @patch("po_app.weather_cache.fetch_forecast")
+    def test_endpoint(self, fetch_forecast, fetch_pollution):
+        fetch_forecast.return_value = {"city": {"timezone": 0}, "list": [
+            {"dt": 1729080000, "temp": {"day": 293.15}, "speed": 7.5, "pop": 0.0}]}
+        url = reverse("weather-suitability")
+        response = self.client.get(url, {"lat": "48.8566", "lon": "2.3522", "best": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual([row["scores"] for row in data["activities"]], [[100], [100]])
+        self.assertEqual(data["best"][0]["activity_id"], self.kiting.activity_id)
+
+        with patch("po_app.views.score") as rescore:
+            response = self.client.get(url, {"lat": "48.8566", "lon": "2.3522", "best": 1})
+            rescore.assert_not_called()
+        self.assertEqual(response.data["data"], data)
+        response = self.client.get(url, {"lat": "48.8566", "lon": "2.3522", "best": 51})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SchemaTests(APITestCase):
+    """
+    Testing for the OpenAPI schema cache:
+        Schema generated once per format,
+        ETag revalidation,
+        Artifacts written by build_openapi_schema served without generation,
+        Renders per host bounded.
+    """
+
+    def setUp(self):
+        self.view = resolve(reverse("schema-json", kwargs={"format": ".json"})).func.view_class
+        self.view._rendered.clear()
+        self.url = reverse("schema-json", kwargs={"format": ".json"})
+
+    def test_cached(self):
+        get_schema = OpenAPISchemaGenerator.get_schema
+        with patch.object(OpenAPISchemaGenerator, "get_schema", autospec=True,
+                          side_effect=get_schema) as generate:
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn("/po_app/Weather/Suitability/", json.loads(response.content)["paths"])
+            self.assertIn("max-age", response["Cache-Control"])
+            again = self.client.get(self.url)
+            self.assertEqual(again.content, response.content)
+            self.assertEqual(generate.call_count, 1)
+
+            compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(gzip.decompress(compressed.content), response.content)
+            self.assertEqual(compressed["ETag"], response["ETag"])
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.client.get("/swagger.yaml")
+            self.assertEqual(generate.call_count, 2)
+
+    def test_artifact(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+                OPENAPI_SCHEMA={"DIR": directory, "URL": "https://api.example.com"}):
+            call_command("build_openapi_schema", stdout=StringIO())
+            self.assertTrue(self.view.artifact(".yaml").exists())
+            with patch.object(OpenAPISchemaGenerator, "get_schema") as generate:
+                response = self.client.get(self.url)
+                generate.assert_not_called()
+            self.assertEqual(json.loads(response.content)["host"], "api.example.com")
+
+    @override_settings(ALLOWED_HOSTS=["*"], OPENAPI_SCHEMA={"MAX_ENTRIES": 2})
+    def test_bounded(self):
+        for host in ("a.example.com", "b.example.com", "c.example.com"):
+            response = self.client.get(self.url, HTTP_HOST=host)
+            self.assertEqual(json.loads(response.content)["host"], host)
+            self.assertLessEqual(len(self.view._rendered), 2)
+
+
+class TokenUserTests(APITestCase):
+    """
+    Testing for stateless JWT authentication:
+        Weather calls authenticated without queries,
+        Account update visible on the next request,
+        Deleted account not served from the user cache,
+        Deleted account refused with 401.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+        pollution_cache.clear()
+        user_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    @patch("po_app.weather_cache.fetch_pollution", return_value={"list": []})
+    @patch("po_app.weather_cache.fetch_forecast", return_value={"city": {"name": "Paris"}, "list": []})
+    def test_weather_without_queries(self, fetch_forecast, fetch_pollution):
+        url = reverse("weatherdaydetails-list")
+        params = {"lat": "48.85", "lon": "2.35", "day": 86400}
+        self.client.get(url, params)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_account_update(self):
+        url = reverse("users-account")
+        self.assertEqual(self.client.get(url).data["data"]["address"], "toronto")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {"address": "montreal"}, format="json")
+        self.assertEqual(self.client.get(url).data["data"]["address"], "montreal")
+        self.assertEqual(user_cache.get(self.user.pk).address, "montreal")
+
+    def test_deleted_account(self):
+        self.client.get(reverse("users-account"))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse("users-delete-account", args=[self.user.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with self.assertRaises(AuthenticationFailed):
+            user_cache.get(self.user.pk)
+        response = self.client.get(reverse("plannedactivities-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PasswordHashingTests(APITestCase):
+    """
+    Testing for the password hashing pool:
+        Hashes upgraded to the current hasher and cost on login,
+        Register and login refused while the queue is full.
+    """
+
+    def setUp(self):
+        password_pool.reset()
+        self.addCleanup(password_pool.reset)
+        self.credentials = {"username": "testuser", "password": "Test>012"}
+
+    @override_settings(PASSWORD_HASHING={"PBKDF2_ITERATIONS": 1000})
+    def test_upgrade_on_login(self):
+        user = get_user_model().objects.create_user(
+            email="testuser@maildrop.cc", address="toronto", **self.credentials)
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$1000$"))
+        get_user_model().objects.filter(pk=user.pk).update(
+            password=hashers.make_password("Test>012", hasher="pbkdf2_sha1"))
+
+        with override_settings(PASSWORD_HASHING={"PBKDF2_ITERATIONS": 2000}):
+            response = self.client.post(reverse("token_obtain_pair"), self.credentials, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$2000$"))
+        self.assertTrue(user.check_password("Test>012"))
+
+    @override_settings(PASSWORD_HASHING={"WORKERS": 1, "QUEUE_SIZE": 0, "QUEUE_TIMEOUT": 0.01,
+                                         "PBKDF2_ITERATIONS": 1000})
+    def test_backpressure(self):
+        get_user_model().objects.create_user(
+            email="testuser@maildrop.cc", address="toronto", **self.credentials)
+        release = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            busy = executor.submit(password_pool.run, release.wait)
+            time.sleep(0.05)
+            login = self.client.post(reverse("token_obtain_pair"), self.credentials, format="json")
+            register = self.client.post(reverse("users-register"), {
+                "username": "other", "password": "Test>012",
+                "email": "other@maildrop.cc", "address": "montreal"}, format="json")
+            release.set()
+            busy.result()
+        self.assertEqual(login.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(register.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.client.post(reverse("token_obtain_pair"), self.credentials,
+                                          format="json").status_code, status.HTTP_200_OK)
+
+
+class ServerTimingTests(APITestCase):
+    """
+    Testing for request timing:
+        Phases of a sampled request in Server-Timing and the log,
+        Database queries counted,
+        Serialization timed,
+        Requests not sampled left untouched.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+        pollution_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="testuser", password="Test>012",
+            email="testuser@maildrop.cc", address="toronto")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    @override_settings(REQUEST_TIMING={"SAMPLE_RATE": 1})
+    @patch("po_app.openweather.get_with_retries")
+    def test_sampled_request(self, get):
+        get.return_value.json.return_value = {"city": {"name": "Paris"}, "list": []}
+        user_cache.check(self.user.pk)
+        with self.assertLogs("po_app.timing", "INFO") as logs:
+            response = self.client.get(reverse("weatherdaydetails-list"), {"lat": "48.85", "lon": "2.35"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = {metric.split(";")[0] for metric in response["Server-Timing"].split(", ")}
+        self.assertEqual(metrics, {"auth", "upstream", "render", "total"})
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["phases"]["upstream"]["count"], 2)
+
+    @override_settings(REQUEST_TIMING={"SAMPLE_RATE": 1})
+    def test_queries_counted(self):
+        with self.assertLogs("po_app.timing", "INFO") as logs:
+            response = self.client.get(reverse("plannedactivities-calendar"), {"from": "2024-01-01", "to": "2024-01-31"})
+        self.assertIn('db;dur=', response["Server-Timing"])
+        phases = json.loads(logs.records[0].getMessage())["phases"]
+        self.assertGreaterEqual(phases["db"]["count"], 1)
+
+    @override_settings(REQUEST_TIMING={"SAMPLE_RATE": 1})
+    def test_serialization(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(is_staff=True)
+        with self.assertLogs("po_app.timing", "INFO") as logs:
+            self.client.get(reverse("plannedactivities-list"))
+            self.client.get(reverse("plannedactivities-list"), {"shape": "flat"})
+        self.assertEqual(len(logs.records), 2)
+        for record in logs.records:
+            self.assertEqual(json.loads(record.getMessage())["phases"]["serialize"]["count"], 1)
+
+    @override_settings(REQUEST_TIMING={"SAMPLE_RATE": 0})
+    def test_not_sampled(self):
+        response = self.client.get(reverse("plannedactivities-calendar"), {"from": "2024-01-01", "to": "2024-01-31"})
+        self.assertFalse(response.has_header("Server-Timing"))
+
+
+@override_settings(INTERNAL_IPS=["127.0.0.1"])
+class MetricsTests(APITestCase):
+    """
+    Testing for the Prometheus metrics:
+        Request, cache and upstream metrics exposed,
+        Non-standard methods labelled other,
+        Queries of async requests counted,
+        Concurrent flushes never failing a request,
+        Counters of other processes summed from the shared directory,
+        Bearer token required when configured,
+        Other addresses denied without a token.
+    """
+
+    def setUp(self):
+        cache.clear()
+        forecast_cache.clear()
+        metrics.clear()
+
+    @patch("po_app.weather_cache.fetch_forecast", return_value={"city": {"name": "Paris"}, "list": []})
+    def test_exposition(self, fetch):
+        for _ in range(2):
+            self.client.get(reverse("weather-list"), {"lat": "48.85", "lon": "2.35"})
+        upstream_stats.record("forecast", 0.2, error=True)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = response.content.decode().splitlines()
+        self.assertIn('po_app_request_duration_seconds_count{method="GET",route="weather-list"} 2', lines)
+        self.assertIn('po_app_requests_total{method="GET",route="weather-list",status="2xx"} 2', lines)
+        self.assertIn('po_app_cache_hit_ratio{cache="forecast"} 0.5', lines)
+        self.assertIn('po_app_upstream_errors_total{endpoint="forecast"} 1', lines)
+        self.assertIn('po_app_upstream_request_duration_seconds_bucket{endpoint="forecast",le="0.1"} 0', lines)
+        self.assertIn('po_app_upstream_request_duration_seconds_bucket{endpoint="forecast",le="0.25"} 1', lines)
+        self.assertIn("# TYPE po_app_request_duration_seconds histogram", lines)
+
+    def test_other_method(self):
+        self.client.generic("PROPFIND", reverse("activities-list"))
+        lines = self.client.get(reverse("metrics")).content.decode().splitlines()
+        self.assertIn('po_app_request_duration_seconds_count{method="other",route="activities-list"} 1', lines)
+
+    def test_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS={"DIR": directory}):
+            other = {"counters": [["po_app_db_queries_total", [["route", "users-list"]], 3]],
+                     "histograms": []}
+            with open(f"{directory}/metrics-1-other.json", "w") as f:
+                json.dump(other, f)
+            metrics.inc("po_app_db_queries_total", 2, route="users-list")
+            response = self.client.get(reverse("metrics"))
+        self.assertIn('po_app_db_queries_total{route="users-list"} 5', response.content.decode().splitlines())
+
+    def test_async_queries(self):
+        async def view(request):
+            await sync_to_async(list)(Activities.objects.all())
+            return HttpResponse()
+
+        async_to_sync(MetricsMiddleware(view))(RequestFactory().get("/po_app/Activities/"))
+        self.assertIn(["po_app_db_queries_total", (("route", "unmatched"),), 1], metrics.state()["counters"])
+
+    def test_concurrent_flush(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS={"DIR": directory, "FLUSH_INTERVAL": 0}):
+            metrics.inc("po_app_db_queries_total", route="users-list")
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                for future in [executor.submit(metrics.flush) for _ in range(32)]:
+                    future.result()
+            self.assertEqual([path.name for path in Path(directory).iterdir()], [metrics._file])
+            Path(directory, "file").touch()
+            with override_settings(METRICS={"DIR": f"{directory}/file/metrics", "FLUSH_INTERVAL": 0}), \
+                    self.assertLogs("po_app.metrics", "ERROR"):
+                metrics.maybe_flush()
+
+    @override_settings(METRICS={"TOKEN": "secret"})
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(INTERNAL_IPS=[])
+    def test_no_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,164 @@
+"""
+Per-request timing of the database, Openweathermap, authentication,
+password hashing, serialization and rendering phases.
+
+ServerTimingMiddleware samples SAMPLE_RATE of the requests whose path
+starts with PATH_PREFIX. A sampled request gets a RequestTimings in a
+context variable, which the timed() blocks of the upstream, auth, hash,
+serialize and render call paths add their durations to. In sync workers the
+queries of the default database connection are counted and timed through
+connection.execute_wrapper. The response then carries a Server-Timing
+header and one JSON line is logged to the po_app.timing logger. Requests
+that are not sampled only pay for one random draw, and timed() blocks
+outside a sampled request for one context variable lookup.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import random
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+import orjson
+
+
+DEFAULTS = {
+    "SAMPLE_RATE": 0.0,
+    "PATH_PREFIX": "/po_app/",
+    "HEADER": True,
+}
+
+logger = logging.getLogger("po_app.timing")
+current = ContextVar("po_app_request_timings", default=None)
+
+
+def get_setting(name):
+    """
+    Return a REQUEST_TIMING setting, falling back on the default value.
+    """
+    return getattr(settings, "REQUEST_TIMING", {}).get(name, DEFAULTS[name])
+
+
+class RequestTimings:
+    """
+    Durations in seconds and counts of the phases of one request.
+    Phases run concurrently, e.g. forecast and pollution calls, add up.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            total, count = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (total + duration, count + 1)
+
+    def query(self, execute, sql, params, many, context):
+        """
+        connection.execute_wrapper hook timing every query.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add("db", time.perf_counter() - start)
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def header(self, total):
+        """
+        Return the Server-Timing header value, durations in milliseconds.
+        """
+        metrics = []
+        for name, (duration, count) in sorted(self.phases.items()):
+            unit = "queries" if name == "db" else "calls"
+            metrics.append(f'{name};dur={duration * 1000:.1f};desc="{count} {unit}"')
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def record(self, request, response, total):
+        """
+        Return the structured log record of the request.
+        """
+        return {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 2),
+            "phases": {name: {"ms": round(duration * 1000, 2), "count": count}
+                       for name, (duration, count) in self.phases.items()},
+        }
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the duration of the block to the phase name of the sampled request.
+    """
+    timings = current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    """
+    Time sampled requests and report their phases in a Server-Timing
+    header and the po_app.timing log.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def sampled(self, request):
+        rate = get_setting("SAMPLE_RATE")
+        return (rate > 0 and request.path.startswith(get_setting("PATH_PREFIX"))
+                and (rate >= 1 or random.random() < rate))
+
+    def finish(self, request, response, timings):
+        total = timings.total()
+        if get_setting("HEADER"):
+            response["Server-Timing"] = timings.header(total)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(orjson.dumps(timings.record(request, response, total)).decode())
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled(request):
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            with connection.execute_wrapper(timings.query):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        if not self.sampled(request):
+            return await self.get_response(request)
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
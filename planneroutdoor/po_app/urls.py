@@ -1,8 +1,9 @@
 from rest_framework import routers
 from django.urls import path, include
 from .views import UsersViewSet, ActivitiesViewSet, AllergensViewSet, UserActivitiesViewSet
-from .views import UserAllergensViewSet, PlannedActivitiesViewSet, GeoCodingViewSet
-from .views import WeatherViewSet, WeatherDetailsViewSet, WeatherPollutionViewSet
+from .views import UserAllergensViewSet, PlannedActivitiesViewSet, RecurrenceRulesViewSet, GeoCodingViewSet
+from .views import WeatherViewSet, WeatherDetailsViewSet, WeatherPollutionViewSet, WeatherDayDetailsViewSet
+from . import async_views
 
 router = routers.DefaultRouter()
 router.register(r"po_app/Users", UsersViewSet, basename="users")
@@ -14,14 +15,26 @@ router.register(r"po_app/UserAllergens", UserAllergensViewSet,
                 basename="userallergens")
 router.register(r"po_app/PlannedActivities",
                 PlannedActivitiesViewSet, basename="plannedactivities")
+router.register(r"po_app/RecurrenceRules",
+                RecurrenceRulesViewSet, basename="recurrencerules")
 router.register(r"po_app/Weather", WeatherViewSet, basename="weather")
 router.register(r"po_app/WeatherDetails",
                 WeatherDetailsViewSet, basename="weatherdetails")
 router.register(r"po_app/Geocode", GeoCodingViewSet, basename="geocode")
 router.register(r"po_app/WeatherPollution",
                 WeatherPollutionViewSet, basename="weatherpollution")
+router.register(r"po_app/WeatherDayDetails",
+                WeatherDayDetailsViewSet, basename="weatherdaydetails")
 
 urlpatterns = [
     path("", include(router.urls)),
-    path("api-auth/", include("rest_framework.urls"))
+    path("api-auth/", include("rest_framework.urls")),
+    path("po_app/async/Geocode/", async_views.geocode, name="async-geocode"),
+    path("po_app/async/Weather/", async_views.weather, name="async-weather"),
+    path("po_app/async/WeatherDetails/", async_views.weather_details,
+         name="async-weatherdetails"),
+    path("po_app/async/WeatherPollution/", async_views.weather_pollution,
+         name="async-weatherpollution"),
+    path("po_app/async/WeatherDayDetails/", async_views.weather_day_details,
+         name="async-weatherdaydetails"),
 ]
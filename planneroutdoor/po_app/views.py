@@ -1,16 +1,231 @@
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import date, timedelta
 from django.conf import settings
+from django.db import transaction
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.response import Response
-from django.contrib.auth.hashers import make_password
 from rest_framework import viewsets, permissions, status
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-from .models import Users, Activities, Allergens, UserActivities, UserAllergens, PlannedActivities
+from .models import Users, Activities, Allergens, UserActivities, UserAllergens, PlannedActivities, RecurrenceRules
 from .serializers import UsersSerializer, ActivitiesSerializer, AllergensSerializer, UserActivitiesSerializer, UserAllergensSerializer, PlannedActivitiesSerializer
+from .serializers import UserActivitiesSetSerializer, UserAllergensSetSerializer
+from .serializers import UserActivitiesFlatSerializer, UserAllergensFlatSerializer, PlannedActivitiesFlatSerializer
+from .serializers import PlannedActivitiesImportSerializer, RecurrenceRulesSerializer
+from .weather_cache import CoordinateError, forecast_cache, forecast_source, pollution_cache, pollution_source
+from .air_quality import aggregate, daily_aqi
+from .suitability import ranking, score
+from .forecast import Forecast, ProjectionError, parse_projection, project
+from .geocoding import LocationTooLong, geocode
+from .hashing import HashingBusy, make_password
+from .openweather import upstream_stats
+from .quota import UpstreamUnavailable, quota_guard
+from .renderers import EncodedResponse, encode
+from .middleware import accepted_encoding, compress
+from .pagination import CalendarPagination
+from .intervals import interval_indexes, planned_namespace
+from .recurrence import expand, horizon, materialize_rule
+from .catalog_cache import bump_version, catalog_cache, etag_matches, get_user_cached, user_namespace
+
+
+def get_forecast(lat, lon):
+    """
+    Return the cached forecast for coordinates snapped to the cache grid.
+    """
+    return forecast_cache.get(*forecast_source(lat, lon))
+
+
+def get_city_forecast(city):
+    """
+    Return the cached forecast for a city name.
+    """
+    return forecast_cache.get(*forecast_source(city=city))
+
+
+def get_pollution(lat, lon):
+    """
+    Return the cached pollution forecast for coordinates snapped to the cache grid.
+    """
+    return pollution_cache.get(*pollution_source(lat, lon))
+
+
+def pollution_data(key, entry, mode):
+    """
+    Return the raw payload of a pollution cache entry, or its daily
+    aggregation when mode is "aggregated".
+    """
+    if mode == "aggregated":
+        return pollution_cache.derived(key, entry, "aggregated", aggregate)
+    return entry[1]
+
+
+def forecast_data(key, entry, projection):
+    """
+    Return the raw payload of a forecast cache entry, or its compact
+    projection when fields, units or days were asked for.
+    """
+    if projection is None:
+        return entry[1]
+    forecast = forecast_cache.derived(key, entry, "parsed", Forecast)
+    return forecast_cache.derived(key, entry, ("compact",) + projection,
+                                  lambda data: project(forecast, *projection))
+
+
+def suitability_data(key, entry, pollution, allergic, activity_ids, limit):
+    """
+    Return the ranked suitability scores of a forecast cache entry. Scores
+    are computed once per entry, pollution entry, activities catalog and
+    allergic flag, the per-request ranking is not cached.
+    """
+    catalog, etag = catalog_cache.get(
+        "activities", "suitability",
+        lambda: list(Activities.objects.order_by("activity_id").values_list("activity_id", "activity_name")))
+    pollution_key, pollution_entry = pollution
+    pollution_at = pollution_entry[0] if pollution_entry else None
+    name = ("suitability", etag, pollution_at, allergic)
+
+    def build(data):
+        aqi = {}
+        if pollution_entry:
+            aqi = daily_aqi(pollution_cache.derived(pollution_key, pollution_entry, "aggregated", aggregate))
+        return score(forecast_cache.derived(key, entry, "parsed", Forecast), aqi, catalog, allergic)
+
+    return ranking(forecast_cache.derived(key, entry, name, build), activity_ids, limit)
+
+
+def encoded_envelope(weather_cache, key, entry, name, data):
+    """
+    Return the JSON encoded {"message": "", "data": data} envelope, encoded
+    once per cache entry and representation name.
+    """
+    return weather_cache.derived(key, entry, ("json", name),
+                                 lambda payload: encode({"message": "", "data": data}))
+
+
+def payload_response(request, weather_cache, key, entry, name, data):
+    """
+    Return data in the message/data envelope. The JSON body is encoded, and
+    compressed as accepted by the client, once per cache entry.
+    """
+    encoded = encoded_envelope(weather_cache, key, entry, name, data)
+    encoding = None
+    renderer = getattr(request, "accepted_renderer", None)
+    if renderer is not None and renderer.format == "json" and len(encoded) >= 200:
+        encoding = accepted_encoding(request)
+    if encoding:
+        encoded = weather_cache.derived(key, entry, ("json", name, encoding),
+                                        lambda payload: compress(encoded, encoding))
+    return EncodedResponse({"message": "", "data": data}, encoded, content_encoding=encoding,
+                           status=status.HTTP_200_OK)
+
+
+PROJECTION_PARAMETERS = [
+    openapi.Parameter(
+        "fields", openapi.IN_QUERY, description="Comma separated compact fields, e.g. date,temp_min,temp_max", type=openapi.TYPE_STRING),
+    openapi.Parameter(
+        "units", openapi.IN_QUERY, description="standard, metric or imperial", type=openapi.TYPE_STRING),
+    openapi.Parameter(
+        "days", openapi.IN_QUERY, description="Number of forecast days", type=openapi.TYPE_INTEGER),
+]
+
+
+upstream_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="po_app-upstream")
+
+
+def merge_day_details(forecast, pollution, day=None):
+    """
+    Build one document with the forecast and the pollution samples of a day.
+    day is a unix timestamp, the first forecast day is used when omitted.
+    """
+    days = forecast.get("list", [])
+    if day is None and days:
+        day = days[0]["dt"]
+    day_number = int(day) // 86400 if day is not None else None
+    return {
+        "city": forecast.get("city"),
+        "forecast": next((entry for entry in days if entry["dt"] // 86400 == day_number), None),
+        "pollution": [entry for entry in (pollution or {}).get("list", [])
+                      if entry["dt"] // 86400 == day_number],
+    }
+
+
+def get_day_details(lat, lon, day=None):
+    """
+    Fetch forecast and pollution concurrently and merge them for one day.
+    A pollution failure leaves the pollution part empty.
+    """
+    pollution_future = upstream_executor.submit(copy_context().run, get_pollution, lat, lon)
+    forecast = get_forecast(lat, lon)
+    try:
+        pollution = pollution_future.result()
+    except (requests.exceptions.RequestException, UpstreamUnavailable):
+        pollution = None
+    return merge_day_details(forecast, pollution, day)
+
+
+def replace_user_set(model, user, field, ids):
+    """
+    Make ids the exact set of field values of the user rows of model, with
+    one bulk delete and one bulk insert in a single transaction, and drop
+    the cached user profile on any change. Returns the added and removed ids.
+    """
+    with transaction.atomic():
+        current = set(model.objects.select_for_update().filter(
+            user_id=user).values_list(field, flat=True))
+        added, removed = ids - current, current - ids
+        if removed:
+            model.objects.filter(user_id=user, **{f"{field}__in": removed}).delete()
+        if added:
+            model.objects.bulk_create(
+                [model(user_id=user, **{f"{field}_id": pk}) for pk in added],
+                ignore_conflicts=True)
+        if added or removed:
+            bump_version(user_namespace(user.pk))
+    return {"added": sorted(added), "removed": sorted(removed)}
+
+
+def catalog_response(request, name, build):
+    """
+    Return build() from the versioned catalog cache with a strong ETag,
+    or an empty 304 response when the client copy is current.
+    """
+    data, etag = catalog_cache.get(name, request.build_absolute_uri("/"), build)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+def flat_requested(request):
+    """
+    True when the client asked for the flat representation with ?shape=flat.
+    """
+    return request.query_params.get("shape") == "flat"
+
+
+FORECAST_WINDOW_DAYS = 16
+OCCURRENCES_MAX_DAYS = 366
+SUITABILITY_MAX_BEST = 50
+SNAPSHOT_FIELDS = ("first_day", "last_day", "temp_min", "temp_max", "pop", "wind_speed",
+                   "wind_direction", "air_quality", "updated_at")
+
+SHAPE_PARAMETER = openapi.Parameter(
+    "shape", openapi.IN_QUERY, description="flat for ids instead of hyperlinks", type=openapi.TYPE_STRING)
+
+
+def user_cached(request, name, build):
+    """
+    Return build() for the authenticated user from the per-user cache.
+    """
+    if not request.user.is_authenticated:
+        return build()
+    return get_user_cached(request.user.pk, name, request.build_absolute_uri("/"), build)
 
 
 class DetermineOwnerOrAdmin:
@@ -26,6 +241,9 @@ class DetermineOwnerOrAdmin:
             permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
         elif self.action == "list":
             permission_classes = [IsAdminUser]
+        elif self.action in ["set_user_activities", "set_user_allergens", "calendar", "free_windows", "bulk_import",
+                             "occurrences", "weather"]:
+            permission_classes = [IsAuthenticated]
         else:
             permission_classes = [AllowAny]
         return [permission() for permission in permission_classes]
@@ -68,7 +286,8 @@ class IsOwnerOrAdmin(permissions.BasePermission):
         """
         if request.user.is_staff:
             return True
-        return obj.id == request.user.id
+        owner = obj.user_id_id if hasattr(obj, "user_id_id") else obj.pk
+        return owner == request.user.id
 
 
 class UsersViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
@@ -116,8 +335,8 @@ class UsersViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
         """
         try:
             if request.method == "GET":
-                serializer = self.get_serializer(request.user)
-                return Response({"message": "", "data": serializer.data})
+                data = user_cached(request, "account", lambda: dict(self.get_serializer(request.user).data))
+                return Response({"message": "", "data": data})
             elif request.method == "PATCH":
                 serializer = self.get_serializer(
                     request.user, data=request.data, partial=True)
@@ -125,6 +344,8 @@ class UsersViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
                     serializer.save()
                     return Response({"message": "Account information updated successfully", "data": serializer.data}, status=status.HTTP_200_OK)
                 return Response({"message": "Validation errors", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except HashingBusy as e:
+            return Response({"error": e.detail}, status=e.status_code)
         except Exception as e:
             return Response({"error": "Error occurred while processing method"},
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -141,6 +362,8 @@ class UsersViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
                 serializer.save()
                 return Response({"message": "New user added successfully", "data": serializer.data}, status=status.HTTP_201_CREATED)
             return Response({"message": "Validation errors", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except HashingBusy as e:
+            return Response({"error": e.detail}, status=e.status_code)
         except Exception as e:
             return Response({"error": "Error occurred while processing method"},
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -189,10 +412,11 @@ class ActivitiesViewSet(ActivitiesAllergensPerms, viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         """
-        Overriding standard list method to add personalized response.
+        Overriding standard list method to serve the cached catalog.
         """
         try:
-            return super().list(request, *args, **kwargs)
+            return catalog_response(request, "activities", lambda: list(self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True).data))
         except Exception as e:
             return Response({"error": "Error while reading activities"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -207,10 +431,11 @@ class AllergensViewSet(ActivitiesAllergensPerms, viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         """
-        Overriding standard list method to add personalized response.
+        Overriding standard list method to serve the cached catalog.
         """
         try:
-            return super().list(request, *args, **kwargs)
+            return catalog_response(request, "allergens", lambda: list(self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True).data))
         except Exception as e:
             return Response({"error": "Error while reading allergens"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -252,7 +477,7 @@ class UserActivitiesViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
     """
     Custom methods showned in API documentation.
     """
-    @swagger_auto_schema(tags=["UserActivities"])
+    @swagger_auto_schema(tags=["UserActivities"], manual_parameters=[SHAPE_PARAMETER])
     @action(detail=False, methods=["get"], url_path="GetUserActivities")
     def get_user_activities(self, request):
         """
@@ -260,9 +485,13 @@ class UserActivitiesViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
         """
         try:
             user = request.user
-            user_activities = UserActivities.objects.filter(user_id=user)
-            serializer = self.get_serializer(user_activities, many=True)
-            return Response({"message": "", "data": serializer.data}, status=status.HTTP_200_OK)
+            if flat_requested(request):
+                data = user_cached(request, "activities-flat", lambda: UserActivitiesFlatSerializer(
+                    UserActivities.objects.filter(user_id=user), request).data)
+            else:
+                data = user_cached(request, "activities", lambda: list(self.get_serializer(
+                    UserActivities.objects.filter(user_id=user), many=True).data))
+            return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": "Error while reading user activities"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -296,6 +525,22 @@ class UserActivitiesViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": "Error while deleting user activities"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(tags=["UserActivities"], request_body=UserActivitiesSetSerializer)
+    @action(detail=False, methods=["put"], url_path="SetUserActivities")
+    def set_user_activities(self, request):
+        """
+        Replace user activities with the given set of activity ids.
+        """
+        try:
+            serializer = UserActivitiesSetSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response({"message": "Serializer errors", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+            data = replace_user_set(UserActivities, request.user, "activity_id",
+                                    serializer.validated_data["activity_ids"])
+            return Response({"message": "User activities updated successfully", "data": data}, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": "Error while updating user activities"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
 class UserAllergensViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
     """
@@ -334,7 +579,7 @@ class UserAllergensViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
     """
     Custom methods showned in API documentation.
     """
-    @swagger_auto_schema(tags=["UserAllergens"])
+    @swagger_auto_schema(tags=["UserAllergens"], manual_parameters=[SHAPE_PARAMETER])
     @action(detail=False, methods=["get"], url_path="GetUserAllergens")
     def get_user_allergens(self, request):
         """
@@ -342,9 +587,13 @@ class UserAllergensViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
         """
         try:
             user = request.user
-            user_allergens = UserAllergens.objects.filter(user_id=user)
-            serializer = self.get_serializer(user_allergens, many=True)
-            return Response({"message": "", "data": serializer.data}, status=status.HTTP_200_OK)
+            if flat_requested(request):
+                data = user_cached(request, "allergens-flat", lambda: UserAllergensFlatSerializer(
+                    UserAllergens.objects.filter(user_id=user), request).data)
+            else:
+                data = user_cached(request, "allergens", lambda: list(self.get_serializer(
+                    UserAllergens.objects.filter(user_id=user), many=True).data))
+            return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": "Error while reading user allergens"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -378,6 +627,22 @@ class UserAllergensViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": "Error while deleting user allergens"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(tags=["UserAllergens"], request_body=UserAllergensSetSerializer)
+    @action(detail=False, methods=["put"], url_path="SetUserAllergens")
+    def set_user_allergens(self, request):
+        """
+        Replace user allergens with the given set of allergen ids.
+        """
+        try:
+            serializer = UserAllergensSetSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response({"message": "Serializer errors", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+            data = replace_user_set(UserAllergens, request.user, "allergen_id",
+                                    serializer.validated_data["allergen_ids"])
+            return Response({"message": "User allergens updated successfully", "data": data}, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": "Error while updating user allergens"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
 class PlannedActivitiesViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
     """
@@ -387,6 +652,256 @@ class PlannedActivitiesViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
     serializer_class = PlannedActivitiesSerializer
     swagger_schema = None
 
+    def list(self, request, *args, **kwargs):
+        """
+        Overriding standard list method to serve the flat representation
+        when asked for.
+        """
+        if flat_requested(request):
+            queryset = self.filter_queryset(self.get_queryset())
+            return Response(PlannedActivitiesFlatSerializer(queryset, request).data)
+        return super().list(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        """
+        Save a planned activity unless it overlaps another one of its user.
+        """
+        data = serializer.validated_data
+        with interval_indexes.write(data["user_id"].pk) as writer:
+            writer.check(data["start_date"], data["end_date"])
+            instance = serializer.save()
+            writer.add(instance.pk, instance.start_date, instance.end_date)
+
+    def perform_update(self, serializer):
+        """
+        Save a planned activity unless its new dates overlap another one of its user.
+        """
+        instance = serializer.instance
+        previous_user = instance.user_id_id
+        user = serializer.validated_data.get("user_id", instance.user_id)
+        start = serializer.validated_data.get("start_date", instance.start_date)
+        end = serializer.validated_data.get("end_date", instance.end_date)
+        with interval_indexes.write(user.pk) as writer:
+            writer.check(start, end, exclude=instance.pk)
+            instance = serializer.save()
+            writer.remove(instance.pk)
+            writer.add(instance.pk, instance.start_date, instance.end_date)
+            if previous_user != user.pk:
+                bump_version(planned_namespace(previous_user))
+
+    def perform_destroy(self, instance):
+        with interval_indexes.write(instance.user_id_id) as writer:
+            pk = instance.pk
+            instance.delete()
+            writer.remove(pk)
+
+    @swagger_auto_schema(
+        tags=["PlannedActivities"],
+        request_body=PlannedActivitiesImportSerializer(many=True),
+    )
+    @action(detail=False, methods=["post"], url_path="BulkImport")
+    def bulk_import(self, request):
+        """
+        Create several planned activities for the user at once, none of them
+        is created when one overlaps another or an existing one.
+        """
+        serializer = PlannedActivitiesImportSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = sorted(enumerate(serializer.validated_data), key=lambda item: item[1]["start_date"])
+        overlapping = [position for (position, data), (_, previous) in zip(items[1:], items)
+                       if data["start_date"] <= previous["end_date"]]
+        if overlapping:
+            return Response({"error": "Imported activities overlap each other", "items": sorted(overlapping)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with interval_indexes.write(request.user.pk) as writer:
+                if items:
+                    writer.sync(items[0][1]["start_date"], max(data["end_date"] for _, data in items))
+                conflicts = {}
+                for position, data in items:
+                    found = writer.index.conflicts(data["start_date"], data["end_date"])
+                    if found:
+                        conflicts[position] = found
+                if conflicts:
+                    return Response({"error": "Overlaps planned activities", "conflicts": conflicts},
+                                    status=status.HTTP_409_CONFLICT)
+                created = PlannedActivities.objects.bulk_create(
+                    [PlannedActivities(user_id=request.user, **data) for _, data in items])
+                for instance in created:
+                    writer.add(instance.pk, instance.start_date, instance.end_date)
+            return Response({"message": "Planned activities imported", "data": {"created": len(created)}},
+                            status=status.HTTP_201_CREATED)
+        except Exception as e:
+            return Response({"error": "Error while importing planned activities"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @swagger_auto_schema(
+        tags=["PlannedActivities"],
+        manual_parameters=[
+            openapi.Parameter(
+                "days", openapi.IN_QUERY, description="Number of days from today, 16 at most", type=openapi.TYPE_INTEGER),
+        ]
+    )
+    @action(detail=False, methods=["get"], url_path="FreeWindows")
+    def free_windows(self, request):
+        """
+        Retrieve the windows of days without planned activity in the next days.
+        """
+        try:
+            days = int(request.query_params.get("days", FORECAST_WINDOW_DAYS))
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= FORECAST_WINDOW_DAYS:
+            return Response({"error": f"days must be between 1 and {FORECAST_WINDOW_DAYS}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        start = date.today()
+        windows = interval_indexes.get(request.user.pk).free_windows(start, start + timedelta(days=days - 1))
+        data = [{"from": first, "to": last, "days": (last - first).days + 1} for first, last in windows]
+        return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(tags=["PlannedActivities"])
+    @action(detail=False, methods=["get"], url_path="Weather")
+    def weather(self, request):
+        """
+        Retrieve the user planned activities within the forecast window with
+        their forecast snapshot, in metric units, null until computed.
+        """
+        today = date.today()
+        rows = PlannedActivities.objects.filter(
+            user_id=request.user, end_date__gte=today,
+            start_date__lt=today + timedelta(days=FORECAST_WINDOW_DAYS),
+        ).order_by("start_date", "planned_activity_id").values(
+            "planned_activity_id", "activity_id", "location", "start_date", "end_date",
+            *(f"forecast__{field}" for field in SNAPSHOT_FIELDS))
+
+        data = []
+        for row in rows:
+            forecast = {field: row.pop(f"forecast__{field}") for field in SNAPSHOT_FIELDS}
+            row["forecast"] = forecast if forecast["updated_at"] is not None else None
+            data.append(row)
+        return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        tags=["PlannedActivities"],
+        manual_parameters=[
+            openapi.Parameter(
+                "from", openapi.IN_QUERY, description="First day of the window, YYYY-MM-DD", type=openapi.TYPE_STRING),
+            openapi.Parameter(
+                "to", openapi.IN_QUERY, description="Last day of the window, YYYY-MM-DD", type=openapi.TYPE_STRING),
+            SHAPE_PARAMETER,
+        ]
+    )
+    @action(detail=False, methods=["get"], url_path="Calendar", pagination_class=CalendarPagination)
+    def calendar(self, request):
+        """
+        Retrieve the user planned activities overlapping a date window.
+        """
+        try:
+            start = date.fromisoformat(request.query_params["from"])
+            end = date.fromisoformat(request.query_params["to"])
+        except (KeyError, ValueError):
+            return Response({"error": "from and to dates are required, as YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        if end < start:
+            return Response({"error": "to must not be before from"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            queryset = PlannedActivities.objects.filter(
+                user_id=request.user, start_date__lte=end, end_date__gte=start)
+            if flat_requested(request):
+                page = self.paginate_queryset(PlannedActivitiesFlatSerializer.values(queryset))
+                results = PlannedActivitiesFlatSerializer(page, request).data
+            else:
+                page = self.paginate_queryset(queryset)
+                results = self.get_serializer(page, many=True).data
+            data = {"next": self.paginator.get_next_link(),
+                    "previous": self.paginator.get_previous_link(),
+                    "results": results}
+            return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+        except NotFound as e:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({"error": "Error while reading planned activities"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class RecurrenceRulesViewSet(DetermineOwnerOrAdmin, viewsets.ModelViewSet):
+    """
+    Django viewset for RecurrenceRules model.
+    Occurrences within the forecast window are materialized as planned activities.
+    """
+    queryset = RecurrenceRules.objects.all()
+    serializer_class = RecurrenceRulesSerializer
+    swagger_schema = None
+
+    def perform_create(self, serializer):
+        """
+        Save a rule unless one of its materialized occurrences overlaps a
+        planned activity of its user.
+        """
+        with interval_indexes.write(serializer.validated_data["user_id"].pk) as writer:
+            rule = serializer.save()
+            materialize_rule(writer, rule, horizon(), strict=True)
+
+    def perform_update(self, serializer):
+        """
+        Save a rule and replace its upcoming occurrences.
+        """
+        instance = serializer.instance
+        previous_user = instance.user_id_id
+        user = serializer.validated_data.get("user_id", instance.user_id)
+        today = date.today()
+        with interval_indexes.write(user.pk) as writer:
+            upcoming = PlannedActivities.objects.filter(rule_id=instance, start_date__gte=today)
+            for pk in upcoming.values_list("planned_activity_id", flat=True):
+                writer.remove(pk)
+            upcoming.delete()
+            rule = serializer.save(materialized_until=today - timedelta(days=1))
+            materialize_rule(writer, rule, horizon(), strict=True)
+            if previous_user != user.pk:
+                bump_version(planned_namespace(previous_user))
+
+    def perform_destroy(self, instance):
+        """
+        Delete a rule and its upcoming occurrences, past ones are kept
+        as standalone planned activities.
+        """
+        with interval_indexes.write(instance.user_id_id) as writer:
+            upcoming = PlannedActivities.objects.filter(rule_id=instance, start_date__gte=date.today())
+            for pk in upcoming.values_list("planned_activity_id", flat=True):
+                writer.remove(pk)
+            upcoming.delete()
+            instance.delete()
+
+    @swagger_auto_schema(
+        tags=["PlannedActivities"],
+        manual_parameters=[
+            openapi.Parameter(
+                "from", openapi.IN_QUERY, description="First day of the window, YYYY-MM-DD", type=openapi.TYPE_STRING),
+            openapi.Parameter(
+                "to", openapi.IN_QUERY, description="Last day of the window, YYYY-MM-DD", type=openapi.TYPE_STRING),
+        ]
+    )
+    @action(detail=False, methods=["get"], url_path="Occurrences")
+    def occurrences(self, request):
+        """
+        Retrieve the occurrences of the user rules overlapping a date window,
+        of one year at most, whether materialized or not.
+        """
+        try:
+            start = date.fromisoformat(request.query_params["from"])
+            end = date.fromisoformat(request.query_params["to"])
+        except (KeyError, ValueError):
+            return Response({"error": "from and to dates are required, as YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        if not timedelta(0) <= end - start <= timedelta(days=OCCURRENCES_MAX_DAYS):
+            return Response({"error": f"to must be within {OCCURRENCES_MAX_DAYS} days after from"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rules = RecurrenceRules.objects.filter(user_id=request.user).exclude(until__lt=start)
+        data = [{"rule_id": rule.pk, "activity_id": rule.activity_id_id, "location": rule.location,
+                 "start_date": first, "end_date": last}
+                for rule, first, last in expand(rules, start, end)]
+        return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+
 
 class CookieTokenObtainPairView(TokenObtainPairView):
     """
@@ -452,16 +967,17 @@ class GeoCodingViewSet(viewsets.ViewSet):
         if not location:
             return Response({"error": "Please provide a location"}, status=status.HTTP_400_BAD_REQUEST)
 
-        api_key = settings.OPENWEATHER_API_KEY
-        geocoding_url = f"http://api.openweathermap.org/geo/1.0/direct?q={
-            location}&limit=5&appid={api_key}"
-
         try:
-            response = requests.get(geocoding_url)
-            data = response.json()
-            if response.status_code != 200 or not data:
-                return Response({"error": "Location not found"}, status=response.status_code)
+            data = geocode(location)
+            if not data:
+                return Response({"error": "Location not found"}, status=status.HTTP_200_OK)
             return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+        except LocationTooLong as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except UpstreamUnavailable as e:
+            return Response({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except requests.exceptions.HTTPError as e:
+            return Response({"error": "Location not found"}, status=e.response.status_code)
         except Exception as e:
             return Response({"error": "Error from Openweathermap geocoding API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -480,33 +996,116 @@ class WeatherViewSet(viewsets.ViewSet):
                 "lat", openapi.IN_QUERY, description="Latitude obtained with geocode", type=openapi.TYPE_NUMBER),
             openapi.Parameter(
                 "lon", openapi.IN_QUERY, description="Longitude obtained with geocode", type=openapi.TYPE_NUMBER),
-        ]
+        ] + PROJECTION_PARAMETERS
     )
     def list(self, request):
         """
         Retrieve weather data for a specified city or by latitude and longitude.
         """
-        api_key = settings.OPENWEATHER_API_KEY
         city = request.query_params.get("city")
         lat = request.query_params.get("lat")
         lon = request.query_params.get("lon")
 
-        if lat and lon:
-            url = f"http://api.openweathermap.org/data/2.5/forecast/daily?lat={
-                lat}&lon={lon}&cnt=16&appid={api_key}"
-        elif city:
-            url = f"http://api.openweathermap.org/data/2.5/forecast/daily?q={
-                city}&cnt=16&appid={api_key}"
-        else:
-            return Response({"error": "Please provide a city name or latitude and longitude"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            projection = parse_projection(request.query_params)
+            if lat and lon:
+                key, loader = forecast_source(lat, lon)
+            elif city:
+                key, loader = forecast_source(city=city)
+            else:
+                return Response({"error": "Please provide a city name or latitude and longitude"}, status=status.HTTP_400_BAD_REQUEST)
+            entry = forecast_cache.get_entry(key, loader)
+            data = forecast_data(key, entry, projection)
+            return payload_response(request, forecast_cache, key, entry, projection, data)
+        except UpstreamUnavailable as e:
+            return Response({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except requests.exceptions.RequestException as e:
+            return Response({"error": "Error from Openweathermap forecast API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except ProjectionError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except CoordinateError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(
+        tags=["Weather"],
+        manual_parameters=[
+            openapi.Parameter(
+                "lat", openapi.IN_QUERY, description="Latitude obtained with geocode", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(
+                "lon", openapi.IN_QUERY, description="Longitude obtained with geocode", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(
+                "activity_ids", openapi.IN_QUERY, description="Comma separated activity ids, the user activities by default", type=openapi.TYPE_STRING),
+            openapi.Parameter(
+                "best", openapi.IN_QUERY, description=f"Number of best (activity, day) pairs, {SUITABILITY_MAX_BEST} at most", type=openapi.TYPE_INTEGER),
+        ]
+    )
+    @action(detail=False, methods=["get"], url_path="Suitability", permission_classes=[IsAuthenticated])
+    def suitability(self, request):
+        """
+        Retrieve the 0 to 100 suitability score of activities for every
+        forecast day of a location, and the best (activity, day) pairs.
+        Air quality weighs more for users with allergens.
+        """
+        lat = request.query_params.get("lat")
+        lon = request.query_params.get("lon")
+        if not lat or not lon:
+            return Response({"error": "Latitude, longitude, are required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get("best", 5))
+            activity_ids = request.query_params.get("activity_ids")
+            if activity_ids:
+                activity_ids = tuple(sorted({int(pk) for pk in activity_ids.split(",") if pk.strip()}))
+        except ValueError:
+            return Response({"error": "best and activity_ids must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= limit <= SUITABILITY_MAX_BEST:
+            return Response({"error": f"best must be between 0 and {SUITABILITY_MAX_BEST}"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            profile = user_cached(request, "suitability", lambda: {
+                "activity_ids": sorted(UserActivities.objects.filter(user_id=request.user).values_list("activity_id", flat=True)),
+                "allergic": UserAllergens.objects.filter(user_id=request.user).exists(),
+            })
+            activity_ids = activity_ids or tuple(profile["activity_ids"]) or None
+            key, loader = forecast_source(lat, lon)
+            entry = forecast_cache.get_entry(key, loader)
+            pollution_key, pollution_loader = pollution_source(lat, lon)
+            try:
+                pollution = (pollution_key, pollution_cache.get_entry(pollution_key, pollution_loader))
+            except (UpstreamUnavailable, requests.exceptions.RequestException):
+                pollution = (pollution_key, None)
+            data = suitability_data(key, entry, pollution, profile["allergic"], activity_ids, limit)
             return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+        except UpstreamUnavailable as e:
+            return Response({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except requests.exceptions.RequestException as e:
             return Response({"error": "Error from Openweathermap forecast API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except CoordinateError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(tags=["Weather"])
+    @action(detail=False, methods=["get"], url_path="CacheStats", permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """
+        Retrieve forecast and pollution cache hit, miss and stale counters.
+        """
+        data = {"forecast": forecast_cache.stats(), "pollution": pollution_cache.stats()}
+        return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(tags=["Weather"])
+    @action(detail=False, methods=["get"], url_path="UpstreamStats", permission_classes=[IsAdminUser])
+    def upstream_stats(self, request):
+        """
+        Retrieve Openweathermap latency and error counters per endpoint.
+        """
+        return Response({"message": "", "data": upstream_stats.snapshot()}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(tags=["Weather"])
+    @action(detail=False, methods=["get"], url_path="QuotaStats", permission_classes=[IsAdminUser])
+    def quota_stats(self, request):
+        """
+        Retrieve Openweathermap calls per minute budget and circuit breaker state.
+        """
+        return Response({"message": "", "data": quota_guard.state()}, status=status.HTTP_200_OK)
 
 
 class WeatherDetailsViewSet(viewsets.ViewSet):
@@ -523,29 +1122,32 @@ class WeatherDetailsViewSet(viewsets.ViewSet):
                 "lat", openapi.IN_QUERY, description="Latitude obtained with geocode", type=openapi.TYPE_NUMBER),
             openapi.Parameter(
                 "lon", openapi.IN_QUERY, description="Longitude obtained with geocode", type=openapi.TYPE_NUMBER),
-        ]
+        ] + PROJECTION_PARAMETERS
     )
     def list(self, request):
         """
         Retrieve weather data for a specified city and a choosen day.
         """
-        api_key = settings.OPENWEATHER_API_KEY
         lat = request.query_params.get("lat")
         lon = request.query_params.get("lon")
 
         if not lat or not lon:
             return Response({"error": "Latitude, longitude, are required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        url = f"http://api.openweathermap.org/data/2.5/forecast/daily?lat={
-            lat}&lon={lon}&cnt=16&appid={api_key}"
-
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+            projection = parse_projection(request.query_params)
+            key, loader = forecast_source(lat, lon)
+            entry = forecast_cache.get_entry(key, loader)
+            data = forecast_data(key, entry, projection)
+            return payload_response(request, forecast_cache, key, entry, projection, data)
+        except UpstreamUnavailable as e:
+            return Response({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except requests.exceptions.RequestException as e:
             return Response({"error": "Error from Openweathermap forecast API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except ProjectionError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except CoordinateError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class WeatherPollutionViewSet(viewsets.ViewSet):
@@ -562,26 +1164,75 @@ class WeatherPollutionViewSet(viewsets.ViewSet):
                 "lat", openapi.IN_QUERY, description="Latitude obtained with geocode", type=openapi.TYPE_NUMBER),
             openapi.Parameter(
                 "lon", openapi.IN_QUERY, description="Longitude obtained with geocode", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(
+                "mode", openapi.IN_QUERY, description="aggregated for daily min, mean, max and levels", type=openapi.TYPE_STRING),
         ]
     )
     def list(self, request):
         """
         Retrieve pollution data for a specified city and a choosen day.
         """
-        api_key = settings.OPENWEATHER_API_KEY
         lat = request.query_params.get("lat")
         lon = request.query_params.get("lon")
+        mode = request.query_params.get("mode")
 
         if not lat or not lon:
             return Response({"error": "Latitude, longitude, are required"}, status=status.HTTP_400_BAD_REQUEST)
+        if mode not in (None, "", "raw", "aggregated"):
+            return Response({"error": "mode must be raw or aggregated"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            key, loader = pollution_source(lat, lon)
+            entry = pollution_cache.get_entry(key, loader)
+            data = pollution_data(key, entry, mode)
+            return payload_response(request, pollution_cache, key, entry, mode or "raw", data)
+        except UpstreamUnavailable as e:
+            return Response({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except requests.exceptions.RequestException as e:
+            return Response({"error": "Error from Openweathermap pollution API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except CoordinateError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        url = f"http://api.openweathermap.org/data/2.5/air_pollution/forecast?lat={
-            lat}&lon={lon}&appid={api_key}"
+
+class WeatherDayDetailsViewSet(viewsets.ViewSet):
+    """
+    Django viewset for weather and pollution details of one day.
+    Using OpenWeathermap forecast and air pollution APIs in parallel.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        tags=["Weather"],
+        manual_parameters=[
+            openapi.Parameter(
+                "lat", openapi.IN_QUERY, description="Latitude obtained with geocode", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(
+                "lon", openapi.IN_QUERY, description="Longitude obtained with geocode", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(
+                "day", openapi.IN_QUERY, description="Unix timestamp of the day, first forecast day by default", type=openapi.TYPE_INTEGER),
+        ]
+    )
+    def list(self, request):
+        """
+        Retrieve forecast and pollution data for a choosen day.
+        """
+        lat = request.query_params.get("lat")
+        lon = request.query_params.get("lon")
+        day = request.query_params.get("day")
+
+        if not lat or not lon:
+            return Response({"error": "Latitude, longitude, are required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            day = int(day) if day else None
+        except ValueError:
+            return Response({"error": "day must be a unix timestamp"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            data = get_day_details(lat, lon, day)
             return Response({"message": "", "data": data}, status=status.HTTP_200_OK)
+        except UpstreamUnavailable as e:
+            return Response({"error": "Openweathermap is temporarily unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except requests.exceptions.RequestException as e:
-            return Response({"error": "Error from Openweathermap pollution API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"error": "Error from Openweathermap forecast API"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except CoordinateError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,339 @@
+"""
+Tiered cache for OpenWeathermap payloads.
+
+Entries live in a small in-process LRU in front of the Django cache backend.
+A fresh entry is served as is, a stale entry is served immediately while a
+single background refresh runs, and a missing entry is fetched inline.
+Expired entries are kept up to FALLBACK_TTL and served when the quota
+guard refuses the upstream call.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import metrics
+from .openweather import fetch_forecast, fetch_pollution
+from .quota import UpstreamUnavailable
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "GRID": 0.01,
+    "TTL": 600,
+    "STALE_TTL": 3600,
+    "LRU_SIZE": 256,
+    "FALLBACK_TTL": 24 * 3600,
+}
+
+
+def get_setting(name):
+    """
+    Return a WEATHER_CACHE setting, falling back on the default value.
+    """
+    return getattr(settings, "WEATHER_CACHE", {}).get(name, DEFAULTS[name])
+
+
+class CoordinateError(ValueError):
+    """
+    Raised for a latitude or longitude that is not a finite number in range.
+    """
+
+
+def coordinate(value, limit, name="Coordinate"):
+    """
+    Return value as a float, raising CoordinateError unless it is a finite
+    number between -limit and limit.
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        value = math.nan
+    if not math.isfinite(value) or abs(value) > limit:
+        raise CoordinateError(f"{name} must be a number between -{limit} and {limit}")
+    return value
+
+
+def quantize(value, grid=None):
+    """
+    Snap a latitude or longitude to the configured grid.
+    Returns a string so it can be used both in cache keys and upstream URLs.
+    """
+    grid = grid or get_setting("GRID")
+    snapped = round(coordinate(value, 180) / grid) * grid
+    return f"{snapped:.4f}"
+
+
+def quantize_coordinates(lat, lon):
+    """
+    Validate and snap a latitude and longitude, see quantize.
+    """
+    coordinate(lat, 90, "Latitude")
+    coordinate(lon, 180, "Longitude")
+    return quantize(lat), quantize(lon)
+
+
+def forecast_source(lat=None, lon=None, city=None):
+    """
+    Return the forecast cache key and upstream loader for coordinates
+    snapped to the cache grid, or for a city name.
+    """
+    if city is None:
+        lat, lon = quantize_coordinates(lat, lon)
+        return f"{lat},{lon}", lambda: fetch_forecast(lat=lat, lon=lon)
+    return f"city:{city.strip().casefold()}", lambda: fetch_forecast(q=city)
+
+
+def pollution_source(lat, lon):
+    """
+    Return the pollution cache key and upstream loader for coordinates
+    snapped to the cache grid.
+    """
+    lat, lon = quantize_coordinates(lat, lon)
+    return f"{lat},{lon}", lambda: fetch_pollution(lat, lon)
+
+
+class WeatherCache:
+    """
+    Stale-while-revalidate cache shared by the weather viewsets.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._tasks = set()
+        self._derived = OrderedDict()
+        self.counters = {"hit": 0, "miss": 0, "stale": 0, "fallback": 0}
+
+    def _cache_key(self, key):
+        return f"po_app:{self.namespace}:{key}"
+
+    def _count(self, name):
+        metrics.inc("po_app_cache_requests_total", cache=self.namespace, result=name)
+        with self._lock:
+            self.counters[name] += 1
+
+    def _lru_get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+            return entry
+
+    def _lru_set(self, key, entry):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > get_setting("LRU_SIZE"):
+                self._lru.popitem(last=False)
+
+    def _timeout(self):
+        return max(get_setting("STALE_TTL"), get_setting("FALLBACK_TTL"))
+
+    def lookup(self, key):
+        """
+        Return the (fetched_at, data) entry for key, or None.
+        The local LRU is used first, the shared backend when the local
+        entry is missing or no longer fresh.
+        """
+        entry = self._lru_get(key)
+        if entry is None or time.time() - entry[0] >= get_setting("TTL"):
+            shared = cache.get(self._cache_key(key))
+            if shared is not None and (entry is None or shared[0] > entry[0]):
+                entry = shared
+                self._lru_set(key, entry)
+        return entry
+
+    def store(self, key, data):
+        """
+        Store data in both tiers and return the new entry.
+        """
+        entry = (time.time(), data)
+        self._lru_set(key, entry)
+        cache.set(self._cache_key(key), entry, timeout=self._timeout())
+        return entry
+
+    def set(self, key, data):
+        """
+        Store data in both tiers.
+        """
+        return self.store(key, data)[1]
+
+    def _freshness(self, entry):
+        """
+        Classify an entry as "hit", "stale" or "miss" and count it.
+        """
+        state = "miss"
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < get_setting("TTL"):
+                state = "hit"
+            elif age < get_setting("STALE_TTL"):
+                state = "stale"
+        self._count(state)
+        return state
+
+    def get_entry(self, key, loader):
+        """
+        Return the (fetched_at, data) entry for key, calling loader() on a miss.
+        Stale entries are returned as is and refreshed in the background,
+        expired entries are returned when the quota guard refuses the call.
+        """
+        entry = self.lookup(key)
+        state = self._freshness(entry)
+        if state == "stale":
+            self._refresh_in_background(key, loader)
+        if state != "miss":
+            return entry
+        try:
+            return self.store(key, loader())
+        except UpstreamUnavailable:
+            if entry is None:
+                raise
+            self._count("fallback")
+            return entry
+
+    def get(self, key, loader):
+        """
+        Return cached data for key, see get_entry.
+        """
+        return self.get_entry(key, loader)[1]
+
+    def derived(self, key, entry, name, build):
+        """
+        Return build(data) for a cache entry, computed once per entry in
+        this process and dropped together with it.
+        """
+        derived_key = (key, entry[0], name)
+        with self._lock:
+            if derived_key in self._derived:
+                self._derived.move_to_end(derived_key)
+                return self._derived[derived_key]
+        value = build(entry[1])
+        with self._lock:
+            self._derived[derived_key] = value
+            while len(self._derived) > get_setting("LRU_SIZE") * 4:
+                self._derived.popitem(last=False)
+        return value
+
+    async def alookup(self, key):
+        """
+        Async variant of lookup using the cache backend async API.
+        """
+        entry = self._lru_get(key)
+        if entry is None or time.time() - entry[0] >= get_setting("TTL"):
+            shared = await cache.aget(self._cache_key(key))
+            if shared is not None and (entry is None or shared[0] > entry[0]):
+                entry = shared
+                self._lru_set(key, entry)
+        return entry
+
+    async def astore(self, key, data):
+        """
+        Async variant of store.
+        """
+        entry = (time.time(), data)
+        self._lru_set(key, entry)
+        await cache.aset(self._cache_key(key), entry, timeout=self._timeout())
+        return entry
+
+    async def aset(self, key, data):
+        """
+        Async variant of set.
+        """
+        return (await self.astore(key, data))[1]
+
+    async def aget_entry(self, key, loader):
+        """
+        Async variant of get_entry, loader is a coroutine function and stale
+        entries are refreshed in a task on the running event loop.
+        """
+        entry = await self.alookup(key)
+        state = self._freshness(entry)
+        if state == "stale":
+            with self._lock:
+                refreshing = key in self._refreshing
+                self._refreshing.add(key)
+            if not refreshing:
+                task = asyncio.ensure_future(self._arefresh(key, loader))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        if state != "miss":
+            return entry
+        try:
+            return await self.astore(key, await loader())
+        except UpstreamUnavailable:
+            if entry is None:
+                raise
+            self._count("fallback")
+            return entry
+
+    async def aget(self, key, loader):
+        """
+        Async variant of get.
+        """
+        return (await self.aget_entry(key, loader))[1]
+
+    async def _arefresh(self, key, loader):
+        try:
+            await self.aset(key, await loader())
+        except UpstreamUnavailable as e:
+            logger.warning("Background refresh of %s %s failed: %s", self.namespace, key, e)
+        except Exception:
+            logger.exception("Background refresh of %s %s failed", self.namespace, key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, loader):
+        """
+        Start one refresh thread per key, extra callers keep the stale data.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, loader),
+                         daemon=True).start()
+
+    def _refresh(self, key, loader):
+        try:
+            self.set(key, loader())
+        except UpstreamUnavailable as e:
+            logger.warning("Background refresh of %s %s failed: %s", self.namespace, key, e)
+        except Exception:
+            logger.exception("Background refresh of %s %s failed", self.namespace, key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        """
+        Return hit, miss, stale and fallback counters with the current LRU size.
+        """
+        with self._lock:
+            total = self.counters["hit"] + self.counters["stale"] + self.counters["miss"]
+            return {
+                **self.counters,
+                "hit_ratio": round((self.counters["hit"] + self.counters["stale"]) / total, 4) if total else 0.0,
+                "lru_size": len(self._lru),
+            }
+
+    def clear(self):
+        """
+        Empty the local tier and reset counters.
+        """
+        with self._lock:
+            self._lru.clear()
+            self._derived.clear()
+            self.counters = {"hit": 0, "miss": 0, "stale": 0, "fallback": 0}
+
+
+forecast_cache = WeatherCache("forecast")
+pollution_cache = WeatherCache("pollution")